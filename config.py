@@ -1,6 +1,39 @@
+import os
+import tempfile
+
 # Configurations for Flask-Caching
-CACHE_TYPE = 'simple'  # Use in-memory cache
+# File-backed so every gunicorn worker on the host shares one cache
+CACHE_TYPE = 'server.cache.InstrumentedFileSystemCache'
+CACHE_DIR = os.environ.get('CACHE_DIR', os.path.join(tempfile.gettempdir(), 'parkingmanager-cache'))
+CACHE_THRESHOLD = 1000
 
 # Configuration for SQLite database
-SQLALCHEMY_DATABASE_URI = 'sqlite:///app.db'
+SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///app.db')
 SQLALCHEMY_TRACK_MODIFICATIONS = False
+# How long a writer waits for another worker's write lock, and the connection pool of each worker
+SQLITE_BUSY_TIMEOUT_MS = 5000
+SQLITE_POOL_SIZE = 10
+SQLITE_POOL_OVERFLOW = 5
+
+# Budget for all upstream calls made while serving one request; stays under gunicorn's 30 second worker timeout
+REQUEST_DEADLINE_SECONDS = 20
+
+# Bulk permit endpoints: max items per request and upstream calls in flight
+BULK_PERMIT_MAX_ITEMS = 100
+BULK_PERMIT_CONCURRENCY = 5
+
+# Permit list pagination: default and largest page size
+PERMITS_PER_PAGE = 50
+PERMITS_MAX_PER_PAGE = 500
+
+# People list pagination: default and largest page size
+PEOPLE_PER_PAGE = 50
+PEOPLE_MAX_PER_PAGE = 500
+
+# Static files (/static, /favicon.ico, /robots.txt) may be cached by browsers and proxies for a week
+SEND_FILE_MAX_AGE_DEFAULT = 7 * 24 * 60 * 60
+
+# Port each worker serves event streams on from an asyncio loop (helpers/event_server.py); serving.py
+# sets it under gunicorn. Unset, streams are served by the /permits/events route on request threads.
+EVENTS_PORT = int(os.environ['EVENTS_PORT']) if os.environ.get('EVENTS_PORT', '').isdigit() else None
+EVENTS_HOST = os.environ.get('EVENTS_HOST', '0.0.0.0')
@@ -0,0 +1,122 @@
+"""Compares serving profiles (see serving.py) under the load driver.
+
+Starts the ParkingBoss stand-in, then for each profile starts the app with
+gunicorn against it, drives load with loadtest.driver and stops it again.
+Prints requests per second and latency per profile:
+
+    python manage.py bench 127.0.0.1:5000 --profile sync,gthread
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+import serving
+from loadtest import driver
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Settings the app needs to talk to the stand-in; anything already set in the environment wins.
+APP_ENV = {
+    'LOCATION_ID': 'bench-location',
+    'TENANT': 'bench-tenant',
+    'TENANT_PW': 'bench-password',
+    'MONTHLY_USAGE_QUOTA': '100000',
+    'TIMEZONE': 'America/Los_Angeles',
+    'LOG_LEVEL': 'WARNING',
+}
+
+
+def wait_until_up(url, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f'{url} did not come up within {timeout:.0f}s')
+
+
+def stop(process):
+    process.terminate()
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def bench_profile(profile, host, port, stub_url, args):
+    # Fresh database, cache and metrics directories, so one profile's warm state does not flatter the next.
+    scratch = tempfile.mkdtemp(prefix=f'bench-{profile}-')
+    env = dict(APP_ENV, **os.environ)
+    env.update(PARKINGBOSS_API_URL=f'{stub_url}/v1',
+               DATABASE_URL=f"sqlite:///{os.path.join(scratch, 'bench.db')}",
+               CACHE_DIR=os.path.join(scratch, 'cache'),
+               METRICS_DIR=os.path.join(scratch, 'metrics'))
+    app = subprocess.Popen(serving.gunicorn_args(profile, host, port), cwd=ROOT, env=env)
+    try:
+        base_url = f'http://{host}:{port}'
+        wait_until_up(f'{base_url}/health')
+        if args.warmup:
+            driver.run(base_url, stub_url, args.concurrency, args.warmup, args.mix)
+        rows = driver.run(base_url, stub_url, args.concurrency, args.duration, args.mix)
+    finally:
+        stop(app)
+        shutil.rmtree(scratch, ignore_errors=True)
+    return rows[-1]
+
+
+def format_comparison(results):
+    lines = [f"{'profile':<10}{'workers':>9}{'reqs':>8}{'errs':>7}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"]
+    for profile, row in results:
+        lines.append(f"{profile:<10}{serving.worker_count(profile):>9}{row['requests']:>8}{row['errors']:>7}"
+                     f"{row['rps']:>9.1f}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}")
+    return '\n'.join(lines)
+
+
+def parse_profiles(value):
+    profiles = value.split(',')
+    for profile in profiles:
+        if profile not in serving.PROFILES:
+            raise argparse.ArgumentTypeError(f'unknown profile: {profile}')
+    return profiles
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare serving profiles against the ParkingBoss stand-in')
+    parser.add_argument('address', nargs='?', default='127.0.0.1:5000', help='where each profile listens')
+    parser.add_argument('--stub', dest='stub_address', default='127.0.0.1:8081', help='where the stand-in listens')
+    parser.add_argument('--profile', dest='profiles', type=parse_profiles, default=list(serving.PROFILES),
+                        help='comma-separated, default: all of ' + ','.join(serving.PROFILES))
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=15.0, help='seconds measured per profile')
+    parser.add_argument('--warmup', type=float, default=3.0, help='seconds of unmeasured load first')
+    parser.add_argument('--mix', type=driver.parse_mix, default=None, help='e.g. home=3,list=5,create=1,delete=1')
+    args = parser.parse_args(argv)
+
+    host, port = args.address.split(':')
+    stub_url = f'http://{args.stub_address}'
+    stub = subprocess.Popen(['gunicorn', '--bind', args.stub_address, '--threads', '16', 'loadtest.stub_server:app'],
+                            cwd=ROOT)
+    try:
+        wait_until_up(f'{stub_url}/_stub/permit-ids')
+        results = []
+        for profile in args.profiles:
+            print(f'benchmarking {profile} ...', file=sys.stderr)
+            results.append((profile, bench_profile(profile, host, port, stub_url, args)))
+    finally:
+        stop(stub)
+    print(format_comparison(results))
+    return results
+
+
+if __name__ == '__main__':
+    main()
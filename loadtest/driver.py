@@ -0,0 +1,160 @@
+"""Load driver for the parking manager.
+
+Exercises ``/``, ``/permits``, ``POST /permits`` and ``DELETE /permits/<id>``
+through the real app with a fixed number of concurrent clients, then prints
+throughput and p50/p95/p99 latency per route:
+
+    python -m loadtest.driver http://127.0.0.1:5000 --stub http://127.0.0.1:8081 \
+        --concurrency 16 --duration 30
+"""
+import argparse
+import math
+import random
+import threading
+import time
+from collections import defaultdict
+
+import requests
+
+# Relative weight of each scenario in the request mix
+DEFAULT_MIX = {'home': 3, 'list': 5, 'create': 1, 'delete': 1}
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(fraction * len(sorted_values))
+    return sorted_values[max(0, min(len(sorted_values), rank) - 1)]
+
+
+class Results:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, route, seconds, ok):
+        with self.lock:
+            self.latencies[route].append(seconds)
+            if not ok:
+                self.errors[route] += 1
+
+    def summary(self, elapsed):
+        rows = []
+        everything = []
+        for route in sorted(self.latencies):
+            latencies = sorted(self.latencies[route])
+            everything.extend(latencies)
+            rows.append(self._row(route, latencies, self.errors[route], elapsed))
+        rows.append(self._row('total', sorted(everything), sum(self.errors.values()), elapsed))
+        return rows
+
+    @staticmethod
+    def _row(route, latencies, errors, elapsed):
+        return {
+            'route': route,
+            'requests': len(latencies),
+            'errors': errors,
+            'rps': len(latencies) / elapsed if elapsed else 0.0,
+            'p50_ms': percentile(latencies, 0.50) * 1000,
+            'p95_ms': percentile(latencies, 0.95) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+        }
+
+
+class Client:
+    def __init__(self, base_url, stub_url, results):
+        self.base_url = base_url.rstrip('/')
+        self.stub_url = stub_url.rstrip('/') if stub_url else None
+        self.results = results
+        self.session = requests.Session()
+
+    def timed(self, route, method, path, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=30, **kwargs)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            ok = False
+        self.results.record(route, time.perf_counter() - start, ok)
+
+    def home(self):
+        self.timed('GET /', 'GET', '/')
+
+    def list(self):
+        self.timed('GET /permits', 'GET', '/permits')
+
+    def create(self):
+        plate = f'LT{random.randint(0, 99999):05d}'
+        self.timed('POST /permits', 'POST', '/permits', data={'licenseplate': plate, 'duration': '1'})
+
+    def delete(self):
+        permit_id = self.pick_permit_id()
+        if permit_id is None:
+            return self.create()
+        self.timed('DELETE /permits/<id>', 'DELETE', f'/permits/{permit_id}')
+
+    def pick_permit_id(self):
+        if self.stub_url is None:
+            return None
+        try:
+            permit_ids = self.session.get(f'{self.stub_url}/_stub/permit-ids', timeout=5).json()
+        except (requests.RequestException, ValueError):
+            return None
+        return random.choice(permit_ids) if permit_ids else None
+
+
+def run(base_url, stub_url=None, concurrency=8, duration=10.0, mix=None):
+    mix = mix or DEFAULT_MIX
+    scenarios = [name for name, weight in mix.items() for _ in range(weight)]
+    results = Results()
+    deadline = time.monotonic() + duration
+
+    def worker():
+        client = Client(base_url, stub_url, results)
+        while time.monotonic() < deadline:
+            getattr(client, random.choice(scenarios))()
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results.summary(time.monotonic() - started)
+
+
+def format_summary(rows):
+    lines = [f"{'route':<24}{'reqs':>8}{'errs':>7}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"]
+    for row in rows:
+        lines.append(f"{row['route']:<24}{row['requests']:>8}{row['errors']:>7}{row['rps']:>9.1f}"
+                     f"{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}")
+    return '\n'.join(lines)
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name not in DEFAULT_MIX or not weight.isnumeric():
+            raise argparse.ArgumentTypeError(f'invalid mix entry: {part}')
+        mix[name] = int(weight)
+    return mix
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load driver for the parking manager')
+    parser.add_argument('base_url', help='app under test, e.g. http://127.0.0.1:5000')
+    parser.add_argument('--stub', dest='stub_url', help='ParkingBoss stand-in, used to pick permits to delete')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds')
+    parser.add_argument('--mix', type=parse_mix, default=None, help='e.g. home=3,list=5,create=1,delete=1')
+    args = parser.parse_args(argv)
+    rows = run(args.base_url, args.stub_url, args.concurrency, args.duration, args.mix)
+    print(format_summary(rows))
+    return rows
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""Local stand-in for the ParkingBoss API, for load tests.
+
+Serves the token, usage, tenant-permits, temporary-permit and expires
+endpoints with payloads shaped like the real ones. Latency, error rate and
+the size of the permit list are configurable through the environment:
+
+    STUB_LATENCY_MS         mean added latency per request (default 50)
+    STUB_LATENCY_JITTER_MS  uniform +/- jitter around the mean (default 20)
+    STUB_ERROR_RATE         fraction of requests answered with a 503 (default 0)
+    STUB_PERMITS            permits listed for the tenant at startup (default 25)
+
+Run it with ``python manage.py stub 127.0.0.1:8081`` and point the app at it
+with ``PARKINGBOSS_API_URL=http://127.0.0.1:8081/v1``.
+"""
+import datetime
+import os
+import random
+import threading
+import time
+import uuid
+
+from flask import Flask, jsonify, request
+
+LATENCY_MS = float(os.environ.get('STUB_LATENCY_MS', 50))
+LATENCY_JITTER_MS = float(os.environ.get('STUB_LATENCY_JITTER_MS', 20))
+ERROR_RATE = float(os.environ.get('STUB_ERROR_RATE', 0))
+PERMITS = int(os.environ.get('STUB_PERMITS', 25))
+
+TENANT_ID = 'stub-tenant'
+POLICY_ID = 'stub-policy'
+
+
+class StubState:
+    """Permits and vehicles the stand-in reports, shared by all its threads."""
+    def __init__(self, permits):
+        self.lock = threading.Lock()
+        self.permits = {}
+        self.vehicles = {}
+        self.used_hours = 0
+        for i in range(permits):
+            self.add_permit(f'STUB{i:03d}', hours=1 + i % 24)
+
+    def add_permit(self, license_plate, hours):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        permit_id = uuid.uuid4().hex
+        vehicle_id = uuid.uuid4().hex
+        with self.lock:
+            self.vehicles[vehicle_id] = {'id': vehicle_id, 'display': license_plate}
+            self.permits[permit_id] = {
+                'id': permit_id,
+                'vehicle': vehicle_id,
+                'policy': POLICY_ID,
+                'lifecycle': {'valid': now.isoformat(), 'invalid': (now + datetime.timedelta(hours=hours)).isoformat()},
+            }
+            self.used_hours += hours
+        return permit_id
+
+    def expire_permit(self, permit_id):
+        with self.lock:
+            return self.permits.pop(permit_id, None) is not None
+
+
+def hours_in(duration):
+    if duration and duration.startswith('PT') and duration.endswith('H') and duration[2:-1].isnumeric():
+        return int(duration[2:-1])
+    return 1
+
+
+def create_stub_app(latency_ms=LATENCY_MS, jitter_ms=LATENCY_JITTER_MS, error_rate=ERROR_RATE, permits=PERMITS):
+    app = Flask(__name__)
+    state = StubState(permits)
+    app.config['STUB_STATE'] = state
+
+    @app.before_request
+    def simulate_upstream():
+        if request.path.startswith('/_stub'):
+            return None
+        delay = max(0.0, latency_ms + random.uniform(-jitter_ms, jitter_ms)) / 1000
+        if delay:
+            time.sleep(delay)
+        if error_rate and random.random() < error_rate:
+            return jsonify({'error': 'stub injected failure'}), 503
+        return None
+
+    @app.route('/v1/accounts/auth/tokens', methods=['POST'])
+    def token():
+        return jsonify({'accounts': {'item': TENANT_ID}, 'token': uuid.uuid4().hex})
+
+    @app.route('/v1/locations/<location_id>/tenants/<tenant_id>/permits/temporary/usage')
+    def usage(location_id, tenant_id):
+        return jsonify({
+            'usage': {'items': {tenant_id: {'used': {'PT24H': {'display': f'{state.used_hours} hours'}}}}},
+            'issuers': {'items': {location_id: {'policy': POLICY_ID}}},
+        })
+
+    @app.route('/v1/locations/<location_id>/tenants/<tenant_id>/permits')
+    def tenant_permits(location_id, tenant_id):
+        with state.lock:
+            payload = {'permits': {'items': dict(state.permits)}, 'vehicles': {'items': dict(state.vehicles)}}
+        return jsonify(payload)
+
+    @app.route('/v1/permits/temporary', methods=['POST'])
+    def create_permit():
+        license_plate = request.form.get('vehicle') or request.args.get('vehicle')
+        if not license_plate:
+            return jsonify({'error': 'vehicle is required'}), 400
+        permit_id = state.add_permit(license_plate, hours_in(request.form.get('duration')))
+        return jsonify({'permits': {'item': permit_id}})
+
+    @app.route('/v1/permits/<permit_id>/expires', methods=['PUT', 'POST'])
+    def expire_permit(permit_id):
+        if not state.expire_permit(permit_id):
+            return jsonify({'error': 'unknown permit'}), 404
+        return jsonify({'permits': {'item': permit_id}})
+
+    @app.route('/_stub/permit-ids')
+    def permit_ids():
+        """Lets the load driver pick permits to delete without scraping HTML."""
+        with state.lock:
+            return jsonify(list(state.permits))
+
+    return app
+
+
+app = create_stub_app()
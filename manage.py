@@ -1,5 +1,7 @@
 import os, sys, argparse, subprocess, signal
 
+import serving
+
 # Project defaults
 FLASK_APP = 'server/__init__.py'
 DEFAULT_IP = '0.0.0.0:5000'
@@ -55,13 +57,20 @@ cm.add(Command(
 
 cm.add(Command(
     "start",
-    "runs server with gunicorn in a production setting",
-    lambda c: 'gunicorn -b {0}:{1} server:app'.format(c['host'], c['port']),
+    "runs server with gunicorn in a production setting (--profile {0}, default {1})".format(
+        '|'.join(serving.PROFILES), serving.DEFAULT_PROFILE),
+    lambda c: serving.gunicorn_command(c['profile'] or serving.DEFAULT_PROFILE, c['host'], c['port']),
     {
         'FLASK_APP': FLASK_APP,
         'FLASK_DEBUG': 'false'
     }))
 
+cm.add(Command(
+    "bench",
+    "starts each serving profile against the ParkingBoss stand-in and reports requests per second",
+    lambda c: 'python -m loadtest.bench {0}:{1} --profile {2}'.format(
+        c['host'], c['port'], c['profile'] or ','.join(serving.PROFILES))))
+
 cm.add(Command(
     "run",
     "runs dev server using Flask's native debugger & backend reloader",
@@ -89,6 +98,22 @@ cm.add(Command(
         'FLASK_DEBUG': 'true'
     }))
 
+cm.add(Command(
+    "stub",
+    "runs the local ParkingBoss stand-in used for load tests (see loadtest/stub_server.py)",
+    lambda c: 'gunicorn -b {0}:{1} --threads 16 loadtest.stub_server:app'.format(c['host'], c['port'])))
+
+cm.add(Command(
+    "loadtest",
+    "drives load against a running app at the given address and reports p50/p95/p99",
+    lambda c: 'python -m loadtest.driver http://{0}:{1} --stub {2}'.format(
+        c['host'], c['port'], os.environ.get('STUB_URL', 'http://127.0.0.1:8081'))))
+
+cm.add(Command(
+    "startup",
+    "reports import and create_app time per module and phase (see startup_report.py)",
+    lambda c: 'python startup_report.py'))
+
 cm.add(Command(
     "test",
     "runs all tests inside of `tests` directory",
@@ -100,6 +125,8 @@ parser = argparse.ArgumentParser(description=cm.availableCommands(),
 parser.add_argument("subcommand", help="subcommand to run (see list above)")
 parser.add_argument("ipaddress", nargs='?', default=DEFAULT_IP,
                     help="address and port to run on (i.e. {0})".format(DEFAULT_IP))
+parser.add_argument("--profile", choices=sorted(serving.PROFILES),
+                    help="serving profile for start and bench (see serving.py)")
 
 
 def livereload_check():
@@ -122,6 +149,7 @@ try:
     cm.configure({
         'host': addr[0],
         'port': addr[1],
+        'profile': args.profile or '',
     })
     cm.run(cmd)
 except KeyboardInterrupt:
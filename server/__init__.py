@@ -1,52 +1,136 @@
 from dotenv import load_dotenv
-import logging
 from typing import Any
 
-from flask import Flask, render_template, Response
-from flask_caching import Cache
+import contextlib
+import time
 
-from .helpers.parkingboss_api_helper import get_remaining_usage
+from flask import Flask, abort, g, make_response, render_template, request, Response
+
+from .helpers import deadline, tenants
+from .helpers.parkingboss_api_helper import get_cached_remaining_usage
 from .models.database import db, init_app
-from .cache import cache
+from .cache import cache, not_modified, revalidate
+from . import background, log, metrics
+
 
+@contextlib.contextmanager
+def startup_phase(app, name):
+    """Records how long a create_app phase took in app.extensions['startup_seconds'] (see startup_report.py)."""
+    started = time.perf_counter()
+    yield
+    app.extensions.setdefault('startup_seconds', {})[name] = time.perf_counter() - started
 
-def create_app():
+
+def create_app(test_config=None):
     app = Flask(__name__)
 
-    app.config.from_object('config')
-    app.config['DEBUG'] = True
+    with startup_phase(app, 'config'):
+        app.config.from_object('config')
+        app.config['DEBUG'] = True
+        if test_config is not None:
+            app.config.update(test_config)
+        # Compact JSON even in debug mode; the API payloads are read by scripts, not people.
+        app.json.compact = True
 
     # Initialize the database
-    init_app(app)
+    with startup_phase(app, 'database'):
+        init_app(app)
 
     # Initialize cache
-    cache.init_app(app)
+    with startup_phase(app, 'cache'):
+        cache.init_app(app)
 
     # Import and register blueprints
-    from .views.permit_views import permit_blueprint
-    app.register_blueprint(permit_blueprint)
-    from .views.person_views import person_blueprint
-    app.register_blueprint(person_blueprint)
+    with startup_phase(app, 'blueprints'):
+        from .views.permit_views import permit_blueprint
+        app.register_blueprint(permit_blueprint)
+        from .views.person_views import person_blueprint, vehicle_blueprint
+        app.register_blueprint(person_blueprint)
+        app.register_blueprint(vehicle_blueprint)
+        from .views.api_views import api_blueprint
+        app.register_blueprint(api_blueprint)
+        # The same views again for every other tenant, under /t/<tenant>/ (see helpers/tenants.py)
+        app.register_blueprint(permit_blueprint, name='tenant_permits', url_prefix='/t/<tenant>/permits')
+        app.register_blueprint(api_blueprint, name='tenant_api', url_prefix='/t/<tenant>/api')
+        app.register_blueprint(person_blueprint, name='tenant_person', url_prefix='/t/<tenant>/person')
+        app.register_blueprint(vehicle_blueprint, name='tenant_vehicles', url_prefix='/t/<tenant>/vehicles')
+        from .views.metrics_views import metrics_blueprint
+        app.register_blueprint(metrics_blueprint)
+        from .routes.static import static_blueprint
+        app.register_blueprint(static_blueprint)
+
+    # Background jobs (permit sync, usage refresh, ...) start with the first request each worker serves
+    from .helpers import event_server, outbox, permit_sync, refresher, renewals
+
+    @app.before_request
+    def start_background_workers():
+        for worker in background.workers:
+            worker.ensure_started(app)
+
+    # Tenant-scoped routes make their tenant current for the request; the rest serve the default one.
+    @app.url_value_preprocessor
+    def select_tenant(endpoint, values):
+        if values is not None and 'tenant' in values:
+            tenant = tenants.registry.get(values.pop('tenant'))
+            if tenant is None:
+                abort(404)
+            g.tenant = tenant
+
+    @app.before_request
+    def touch_tenant():
+        tenants.current().touch()
 
-    # Configure Logging
-    logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+    @app.context_processor
+    def tenant_links():
+        return {'tenant_url_for': tenants.url_for}
+
+    # Per-route timing
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+
+    # Time budget shared by the upstream calls of each request (REQUEST_DEADLINE_SECONDS)
+    @app.before_request
+    def start_deadline():
+        deadline.start(app.config['REQUEST_DEADLINE_SECONDS'])
+
+    @app.after_request
+    def record_request_time(response):
+        if 'request_started' in g:
+            metrics.observe('http_request_seconds',
+                            (('endpoint', request.endpoint or 'unmatched'), ('method', request.method),
+                             ('status', str(response.status_code))),
+                            time.perf_counter() - g.request_started)
+        return response
+
+    # Configure Logging (LOG_LEVEL, LOG_PAYLOAD_SAMPLE_RATE)
+    with startup_phase(app, 'logging'):
+        log.configure(app)
 
     # Landing Page
     @app.route("/")
+    @app.route("/t/<tenant>/", endpoint='tenant_home')
     def home():
-        return render_template("home.html", usage=get_remaining_usage())
+        usage = get_cached_remaining_usage()
+        etag = f'usage-{usage}'
+        response = not_modified(etag)
+        if response is None:
+            response = revalidate(make_response(render_template("home.html", usage=usage)), etag)
+        response.headers['X-Data-Age'] = str(int(tenants.current().usage_refresher.age() or 0))
+        return response
 
     # Customize your error pages
     @app.errorhandler(404)
     def unrecognized_object(error: Any) -> Response:
         return Response("404 Not Found", status=404)
 
-    # Prevent Caching
+    # Prevent Caching, unless the view set its own policy (ETag revalidation, static files)
     @app.after_request
     def set_response_headers(response):
-        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-        response.headers['Pragma'] = 'no-cache'
-        response.headers['Expires'] = '0'
+        if 'Cache-Control' not in response.headers:
+            response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
+            response.headers['Pragma'] = 'no-cache'
+            response.headers['Expires'] = '0'
         return response
 
     load_dotenv()
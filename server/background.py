@@ -0,0 +1,48 @@
+import os
+import threading
+
+# Every BackgroundWorker (and the event server), started from create_app's before_request hook.
+workers = []
+
+
+class BackgroundWorker:
+    """Periodic job run on a daemon thread inside an app context.
+
+    Threads do not survive fork, so the worker is started lazily from the
+    first request each process serves (see ``ensure_started``) rather than
+    when the app is created; that also keeps gunicorn's --preload safe.
+    ``wake()`` runs the job early, e.g. right after a local write.
+    """
+    def __init__(self, name, interval, job):
+        self.name = name
+        self.interval = interval
+        self.job = job
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pid = None
+        self._thread = None
+        workers.append(self)
+
+    def ensure_started(self, app):
+        if self._pid == os.getpid() or app.config.get('TESTING'):
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._wake = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(app,), name=self.name, daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self, app):
+        while True:
+            with app.app_context():
+                try:
+                    self.job()
+                except Exception:
+                    app.logger.exception('Background job %s failed', self.name)
+            self._wake.wait(self.interval)
+            self._wake.clear()
@@ -1,3 +1,56 @@
+import time
+
+from flask import make_response, request
 from flask_caching import Cache
+from flask_caching.backends.filesystemcache import FileSystemCache
+
+from server import metrics
+
+cache = Cache()
+
+
+class InstrumentedFileSystemCache(FileSystemCache):
+    """FileSystemCache that counts hits and misses (select with CACHE_TYPE)."""
+    def get(self, key):
+        value = super().get(key)
+        metrics.inc('cache_requests_total', (('result', 'miss' if value is None else 'hit'),))
+        return value
+
+# Rendered permit list page, shared by the permit views and the sync engine
+PERMIT_LIST_CACHE_TIMEOUT = 50
+
+
+def permit_generation(tenant):
+    """Current permit data generation for a tenant, as seen by every worker sharing the cache."""
+    generation = cache.get(f'permits/generation/{tenant}')
+    if generation is None:
+        # Never seen, or evicted: start a fresh one so no ETag handed out earlier can match.
+        generation = bump_permit_generation(tenant)
+    return generation
+
+
+def bump_permit_generation(tenant):
+    # A fresh timestamp instead of an increment: no read-modify-write race between workers.
+    generation = time.time_ns()
+    cache.set(f'permits/generation/{tenant}', generation, timeout=0)
+    return generation
+
+
+def permit_list_cache_key(tenant, view='default'):
+    # ``view`` tells apart the pages and sort orders of the list.
+    return f'permits/list_permits/{tenant}/{permit_generation(tenant)}/{view}'
+
+
+def revalidate(response, etag):
+    """Lets the browser keep ``response`` as long as it revalidates ``etag`` before each use."""
+    response.set_etag(etag, weak=True)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
 
-cache = Cache()
\ No newline at end of file
+def not_modified(etag):
+    """A 304 response when the request already holds ``etag``, else None."""
+    if request.if_none_match.contains_weak(etag):
+        return revalidate(make_response('', 304), etag)
+    return None
@@ -0,0 +1,194 @@
+"""asyncio variant of parkingboss_api_helper.
+
+Shares configuration, the token manager, the policy cache and the response
+parsers with the blocking helper, so both paths see the same tenant and
+raise the same ExternalAPIError / ResponseParsingError.
+"""
+import asyncio
+import time
+
+from flask import current_app
+
+from server import log, metrics
+from server.lazy import lazy_import
+from server.helpers import parkingboss_api_helper as pb
+from server.helpers import tenants
+from server.helpers.error_handler import ExternalAPIError, QuotaExceededError, ResponseParsingError
+from server.helpers.usage_ledger import hours_in
+from server.helpers.http_client import AsyncParkingBossClient
+
+httpx = lazy_import('httpx')
+
+# One pooled client per event loop; every async upstream call goes through it.
+client = AsyncParkingBossClient()
+
+
+def without_none(values):
+    # requests silently drops None params and form fields; httpx would send them empty.
+    return {key: value for key, value in values.items() if value is not None}
+
+
+def response_json(response):
+    """The response's JSON body; one that is not JSON is an ExternalAPIError, as in the blocking helper."""
+    try:
+        return response.json()
+    except ValueError as e:
+        current_app.logger.exception('Error with API request: %s', e)
+        raise ExternalAPIError() from e
+
+
+async def get_auth_data():
+    manager = tenants.current().token_manager
+    auth_data = manager.cached()
+    if auth_data is None:
+        # The refresh is shared with the blocking path, so run it off the loop.
+        auth_data = await asyncio.to_thread(manager.get)
+    return auth_data
+
+
+async def call_with_auth(make_request):
+    """Awaits make_request(auth_data) with the current tenant's cached token, refreshing it once on a 401."""
+    auth_data = await get_auth_data()
+    response = await make_request(auth_data)
+    if response.status_code == 401:
+        current_app.logger.info('Bearer token rejected, refreshing')
+        tenants.current().token_manager.invalidate(auth_data["bearer"])
+        response = await make_request(await get_auth_data())
+    response.raise_for_status()
+    return response
+
+
+async def get_usage_and_policy_id():
+    return await pb.flights.do_async(('usage', pb.tenant_key()), fetch_usage_and_policy_id)
+
+
+@metrics.timed_upstream('usage')
+async def fetch_usage_and_policy_id():
+    tenant = tenants.current()
+
+    async def make_request(auth_data):
+        params = {"viewpoint": pb.generate_timestamp_with_utc_offset(), "Authorization": f"bearer {auth_data['bearer']}", "sample": "PT24H"}
+        full_url = f"{tenant.usage_url}/tenants/{auth_data['tenant_id']}/permits/temporary/usage"
+        log.payload(current_app.logger, 'Calling GET to: %s with params: %s', full_url, params)
+        return await client.get(full_url, params=params, headers={"Content-Type": "application/json"}, endpoint='usage')
+
+    try:
+        started = time.monotonic()
+        response = await call_with_auth(make_request)
+        usage_dict = pb.parse_usage_and_policy_id(response_json(response))
+        pb.policy_cache.set((tenant.location_id, tenant.tenant), usage_dict["policy_id"])
+        tenant.usage_ledger.reconcile(usage_dict["usage"], started)
+        return usage_dict
+    except httpx.HTTPError as e:
+        current_app.logger.exception('Error with API request: %s', e)
+        raise ExternalAPIError() from e
+    except (KeyError, IndexError) as e:
+        current_app.logger.exception('Malformatted API response: %s', e)
+        raise ResponseParsingError() from e
+
+
+async def get_remaining_usage():
+    usage_dict = None
+    try:
+        usage_dict = await get_usage_and_policy_id()
+    except ExternalAPIError as e:
+        current_app.logger.exception('Error with API request: %s', e)
+    except ResponseParsingError as e:
+        current_app.logger.exception('Malformatted API response: %s', e)
+    return pb.remaining_from_usage(usage_dict)
+
+
+async def get_permits():
+    return await pb.flights.do_async(('permits', pb.tenant_key()), fetch_permits)
+
+
+@metrics.timed_upstream('permits')
+async def fetch_permits():
+    async def make_request(auth_data):
+        params = {
+            "valid": pb.generate_timestamp_with_utc_offset_range_1_month(),
+            "viewpoint": pb.generate_timestamp_with_utc_offset(),
+            "Authorization": f"bearer {auth_data['bearer']}"
+        }
+        full_url = f"{tenants.current().permits_url}/{auth_data['tenant_id']}/permits"
+        log.payload(current_app.logger, 'Calling GET to: %s with params: %s', full_url, params)
+        return await client.get(full_url, params=params, endpoint='permits')
+
+    try:
+        response = await call_with_auth(make_request)
+        return pb.parse_permits(response_json(response))
+    except httpx.HTTPError as e:
+        current_app.logger.exception('Error with API request: %s', e)
+        raise ExternalAPIError() from e
+    except KeyError as e:
+        current_app.logger.exception('Malformatted API response: %s', e)
+        raise ResponseParsingError() from e
+
+
+async def get_policy_id():
+    policy_id = pb.policy_cache.get(pb.policy_key())
+    if policy_id is None:
+        policy_id = (await get_usage_and_policy_id())["policy_id"]
+    return policy_id
+
+
+@metrics.timed_upstream('create')
+async def create_permit(license_plate, duration="PT1H", email=None, phone=None):
+    async def make_request(policy_id):
+        params, form_data = pb.build_create_permit_request(policy_id, license_plate, duration, email, phone)
+        log.payload(current_app.logger, 'Calling POST to: %s with params: %s and data: %s', pb.CREATE_URL, params, form_data)
+        return await client.post(pb.CREATE_URL, params=without_none(params), data=without_none(form_data), endpoint='create')
+
+    # Checked against the ledger before any network I/O; released again if the create fails.
+    with tenants.current().usage_ledger.reserving(hours_in(duration)):
+        cached = pb.policy_cache.get(pb.policy_key()) is not None
+        policy_id = await get_policy_id()
+
+        try:
+            response = await make_request(policy_id)
+            if pb.is_policy_error(response):
+                current_app.logger.info('Policy %s rejected, invalidating cached policy', policy_id)
+                pb.policy_cache.delete(pb.policy_key())
+                if cached:
+                    response = await make_request(await get_policy_id())
+            response.raise_for_status()
+            return response_json(response)["permits"]["item"]
+        except httpx.HTTPError as e:
+            current_app.logger.exception('Error with API request: %s', e)
+            raise ExternalAPIError() from e
+        except KeyError as e:
+            current_app.logger.exception('Malformatted API response: %s', e)
+            raise ResponseParsingError() from e
+
+
+@metrics.timed_upstream('delete')
+async def delete_permit(permit_id):
+    delete_url = f"{pb.API_URL}/permits/{permit_id}/expires"
+    params = {"viewpoint": pb.generate_timestamp_z(), "permit": permit_id, "to": tenants.current().cancel_email, "_method": "PUT"}
+
+    try:
+        log.payload(current_app.logger, 'Calling PUT to: %s with params: %s', delete_url, params)
+        response = await client.put(delete_url, params=without_none(params), endpoint='delete')
+        response.raise_for_status()
+        return {"success": True, "permit_id": permit_id}
+    except httpx.HTTPError as e:
+        current_app.logger.exception('Error with API request: %s', e)
+        raise ExternalAPIError() from e
+
+
+async def gather_bounded(items, call, limit):
+    """Awaits call(item) for every item with at most ``limit`` calls in flight.
+
+    Returns one (result, error) pair per item, in input order, so a single
+    failing item does not abort the rest of the batch.
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(item):
+        async with semaphore:
+            try:
+                return await call(item), None
+            except (ExternalAPIError, QuotaExceededError, ResponseParsingError) as e:
+                return None, e
+
+    return await asyncio.gather(*(run(item) for item in items))
@@ -0,0 +1,98 @@
+import os
+import threading
+import time
+
+from server import metrics
+from server.helpers.error_handler import ExternalAPIError
+
+# Failures in a row that open a breaker, and how long it stays open before probing
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('CIRCUIT_FAILURE_THRESHOLD', 5))
+CIRCUIT_RESET_SECONDS = float(os.environ.get('CIRCUIT_RESET_SECONDS', 30))
+CIRCUIT_HALF_OPEN_PROBES = int(os.environ.get('CIRCUIT_HALF_OPEN_PROBES', 1))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """Fails fast while an upstream endpoint keeps failing.
+
+    Closed, calls go through and ``failure_threshold`` failures in a row
+    open the breaker. Open, calls raise ExternalAPIError (503) without
+    touching the network until ``reset_seconds`` have passed. Half-open, up
+    to ``half_open_probes`` calls go through: a success closes the breaker,
+    a failure opens it again.
+    """
+    def __init__(self, name, failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+                 reset_seconds=CIRCUIT_RESET_SECONDS, half_open_probes=CIRCUIT_HALF_OPEN_PROBES):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.half_open_probes = half_open_probes
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self._opened_at = None
+        self._probes = 0
+
+    def before(self):
+        """Raises ExternalAPIError if the call may not go through right now."""
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < self.reset_seconds:
+                    raise ExternalAPIError(f'ParkingBoss {self.name} calls are failing, retry later', 503)
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._probes >= self.half_open_probes:
+                    raise ExternalAPIError(f'ParkingBoss {self.name} calls are failing, retry later', 503)
+                self._probes += 1
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            if self.state != CLOSED:
+                self._transition(CLOSED)
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                if self.state != OPEN:
+                    self._transition(OPEN)
+
+    def _transition(self, state):
+        self.state = state
+        self._probes = 0
+        metrics.inc('parkingboss_circuit_transitions_total', (('endpoint', self.name), ('state', state)))
+
+    def status(self):
+        with self._lock:
+            status = {'state': self.state, 'failures': self.failures}
+            if self.state == OPEN:
+                status['retry_in'] = max(0.0, round(self._opened_at + self.reset_seconds - time.monotonic(), 1))
+            return status
+
+
+# One breaker per upstream endpoint, shared by the blocking and async clients of this worker.
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker(endpoint):
+    with _breakers_lock:
+        if endpoint not in _breakers:
+            _breakers[endpoint] = CircuitBreaker(endpoint)
+        return _breakers[endpoint]
+
+
+def states():
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    return {endpoint: b.status() for endpoint, b in sorted(breakers.items())}
+
+
+def reset():
+    with _breakers_lock:
+        _breakers.clear()
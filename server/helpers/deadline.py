@@ -0,0 +1,37 @@
+"""Time budget for the upstream calls made while serving one request.
+
+create_app starts the clock in a before_request hook. Every upstream call
+then gets the smaller of UPSTREAM_TIMEOUT_SECONDS and what is left of the
+budget, so a stalled ParkingBoss fails the request well before gunicorn's
+worker timeout kills the worker. Background jobs have no request and get
+the per-call cap only.
+"""
+import os
+import time
+
+from flask import g, has_app_context
+
+from server.helpers.error_handler import ExternalAPIError
+
+UPSTREAM_TIMEOUT_SECONDS = float(os.environ.get('UPSTREAM_TIMEOUT_SECONDS', 10))
+
+
+def start(seconds):
+    g.deadline = time.monotonic() + seconds
+
+
+def remaining():
+    """Seconds left in the current request's budget, or None outside a request."""
+    if not has_app_context() or 'deadline' not in g:
+        return None
+    return g.deadline - time.monotonic()
+
+
+def timeout():
+    """Timeout for the next upstream call; raises ExternalAPIError (504) once the budget is spent."""
+    left = remaining()
+    if left is None:
+        return UPSTREAM_TIMEOUT_SECONDS
+    if left <= 0:
+        raise ExternalAPIError('Request deadline exceeded', 504)
+    return min(UPSTREAM_TIMEOUT_SECONDS, left)
@@ -19,6 +19,12 @@ class ResponseParsingError(CustomError):
         super().__init__(message, status_code)
 
 
+class QuotaExceededError(CustomError):
+    """Error raised when a permit would exceed the monthly usage quota"""
+    def __init__(self, message='Monthly usage quota exceeded', status_code=403):
+        super().__init__(message, status_code)
+
+
 # Define error mappings
 ERROR_MAPPING = defaultdict(lambda: (500, 'Encountered an unexpected error'), {
     ExternalAPIError: (500, 'Error communicating with external service')
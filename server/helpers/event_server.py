@@ -0,0 +1,204 @@
+"""Event streams served from an asyncio loop, so an idle client costs a socket instead of a thread.
+
+When EVENTS_PORT is configured (serving.py sets it under gunicorn), every
+worker runs one event loop on a daemon thread, listening on EVENTS_PORT
+with SO_REUSEPORT so the kernel spreads streams over the workers. Pages
+open their stream there rather than on the /permits/events Flask route,
+which would hold a request thread per client.
+
+The streams are the ones the Flask route serves, for the same paths
+(/permits/events and /t/<tenant>/permits/events): the worker's events
+poller publishes to each tenant's broadcaster, which wakes the loop. Only
+the catch-up on connect reads the database, on the loop's executor.
+Like a BackgroundWorker, the server starts with the first request each
+worker serves, so it never runs in gunicorn's master.
+"""
+import asyncio
+import json
+import os
+import re
+import socket
+import threading
+import time
+import urllib.parse
+
+from server import background
+from server.helpers import event_stream, tenants
+
+# Streams per worker, across tenants; each costs a socket and a coroutine.
+EVENTS_SERVER_MAX_CLIENTS = int(os.environ.get('EVENTS_SERVER_MAX_CLIENTS', 1000))
+# Time a client gets to send its request line and headers
+EVENTS_HEADER_TIMEOUT_SECONDS = float(os.environ.get('EVENTS_HEADER_TIMEOUT_SECONDS', 10))
+
+ROUTE = re.compile(r'^(?:/t/(?P<tenant>[^/]+))?/permits/events$')
+
+REASONS = {200: 'OK', 204: 'No Content', 400: 'Bad Request', 404: 'Not Found',
+           405: 'Method Not Allowed', 503: 'Service Unavailable'}
+# Pages are served from the app's own port, so streams are cross-origin requests.
+CORS_HEADERS = {'Access-Control-Allow-Origin': '*'}
+
+slots = event_stream.Slots(EVENTS_SERVER_MAX_CLIENTS)
+
+
+def head(status, headers):
+    lines = [f'HTTP/1.1 {status} {REASONS[status]}']
+    lines += [f'{name}: {value}' for name, value in dict(CORS_HEADERS, Connection='close', **headers).items()]
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+
+def error(status, message, headers=None):
+    body = json.dumps({'error': message}).encode()
+    return head(status, dict(headers or {}, **{'Content-Type': 'application/json',
+                                               'Content-Length': str(len(body))})) + body
+
+
+def parse_request(data):
+    """(method, path, query, headers) of a request head; ValueError when it is malformed."""
+    lines = data.decode('latin-1').split('\r\n')
+    method, target, _ = lines[0].split(' ', 2)
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    url = urllib.parse.urlsplit(target)
+    return method, url.path, urllib.parse.parse_qs(url.query), headers
+
+
+class Wakeup:
+    """Wakes the coroutines waiting on one broadcaster when it publishes from another thread."""
+    def __init__(self, loop):
+        self._loop = loop
+        self._future = loop.create_future()
+
+    def set(self):
+        if not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self):
+        self._future.set_result(None)
+        self._future = self._loop.create_future()
+
+    async def wait(self, timeout):
+        """Waits for the next publish, up to ``timeout``; must be called on the loop."""
+        try:
+            await asyncio.wait_for(asyncio.shield(self._future), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+class EventServer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._app = None
+        self._loop = None
+        self._wakeups = {}
+
+    def ensure_started(self, app):
+        """Starts this worker's server, unless it runs already, under tests, or without EVENTS_PORT."""
+        if self._pid == os.getpid() or app.config.get('TESTING') or not app.config.get('EVENTS_PORT'):
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Not retried on failure: one worker without the port leaves its streams to the others.
+            self._pid = os.getpid()
+            try:
+                self.start(app, app.config['EVENTS_HOST'], app.config['EVENTS_PORT'])
+            except OSError:
+                app.logger.exception('Could not serve event streams on port %s', app.config['EVENTS_PORT'])
+
+    def start(self, app, host, port):
+        """Listens on ``host``:``port`` from a new loop on a daemon thread; returns the port bound."""
+        self._app = app
+        self._wakeups = {}
+        self._loop = asyncio.new_event_loop()
+        server = self._loop.run_until_complete(asyncio.start_server(
+            self.handle, host, port, reuse_port=hasattr(socket, 'SO_REUSEPORT')))
+        threading.Thread(target=self._loop.run_until_complete, args=(server.serve_forever(),),
+                         name='event-server', daemon=True).start()
+        return server.sockets[0].getsockname()[1]
+
+    def wakeup(self, broadcaster):
+        """The loop's Wakeup for ``broadcaster``, registered on first use; called on the loop."""
+        wakeup = self._wakeups.get(broadcaster)
+        if wakeup is None:
+            wakeup = self._wakeups[broadcaster] = Wakeup(self._loop)
+            broadcaster.add_listener(wakeup.set)
+        return wakeup
+
+    def catch_up(self, tenant, broadcaster, since):
+        with self._app.app_context(), tenants.scope(tenant):
+            tenant.touch()
+            return event_stream.catch_up(broadcaster, since)
+
+    async def handle(self, reader, writer):
+        try:
+            try:
+                data = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), EVENTS_HEADER_TIMEOUT_SECONDS)
+                method, path, query, headers = parse_request(data)
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ValueError):
+                return
+            await self.respond(method, path, query, headers, writer)
+        except ConnectionError:
+            # The client went away.
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, method, path, query, headers, writer):
+        match = ROUTE.match(path)
+        tenant = tenants.registry.get(urllib.parse.unquote(match.group('tenant') or tenants.DEFAULT_KEY)) if match else None
+        if tenant is None:
+            writer.write(error(404, 'Not found'))
+            return await writer.drain()
+        if method == 'OPTIONS':
+            # Preflight of a reconnect that carries Last-Event-ID
+            writer.write(head(204, {'Access-Control-Allow-Methods': 'GET',
+                                    'Access-Control-Allow-Headers': 'Last-Event-ID, Cache-Control'}))
+            return await writer.drain()
+        if method != 'GET':
+            writer.write(error(405, 'Method not allowed', {'Allow': 'GET, OPTIONS'}))
+            return await writer.drain()
+        since = headers.get('last-event-id') or query.get('since', [None])[0]
+        if since is not None and not since.isnumeric():
+            writer.write(error(400, '"since" must be a permit data version'))
+            return await writer.drain()
+        broadcaster = event_stream.channel(tenant).broadcaster
+        if not broadcaster.join(slots):
+            writer.write(error(503, 'Too many event streams, retry later', {'Retry-After': '30'}))
+            return await writer.drain()
+        try:
+            await self.stream(tenant, broadcaster, int(since) if since is not None else None, writer)
+        finally:
+            broadcaster.leave(slots)
+
+    async def stream(self, tenant, broadcaster, since, writer):
+        """Writes the catch-up from ``since``, then live messages, the same stream the Flask route serves."""
+        loop = asyncio.get_running_loop()
+        cursor, version, messages = await loop.run_in_executor(None, self.catch_up, tenant, broadcaster, since)
+        wakeup = self.wakeup(broadcaster)
+        deadline = time.monotonic() + event_stream.EVENTS_MAX_STREAM_SECONDS
+        writer.write(head(200, {'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache',
+                                'X-Accel-Buffering': 'no'}))
+        writer.write(''.join(['retry: 3000\n\n'] + messages).encode())
+        await writer.drain()
+        while time.monotonic() < deadline:
+            # Never blocks: what was published since the last look, if anything.
+            cursor, published = broadcaster.wait(cursor, 0)
+            if published == []:
+                await wakeup.wait(min(event_stream.EVENTS_KEEPALIVE_SECONDS, deadline - time.monotonic()))
+                cursor, published = broadcaster.wait(cursor, 0)
+                if published == []:
+                    writer.write(b': keep-alive\n\n')
+                    await writer.drain()
+                    continue
+            if published is None:
+                writer.write(event_stream.format_event('reset', {}).encode())
+                return await writer.drain()
+            writer.write(''.join(event_stream.live(published, version)).encode())
+            await writer.drain()
+
+server = EventServer()
+background.workers.append(server)
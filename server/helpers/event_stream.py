@@ -0,0 +1,247 @@
+import collections
+import json
+import os
+import threading
+import time
+
+from werkzeug.wsgi import ClosingIterator
+
+from server.background import BackgroundWorker
+from server.helpers import outbox, permit_sync, tenants
+
+EVENTS_POLL_SECONDS = float(os.environ.get('EVENTS_POLL_SECONDS', 1))
+# Comment lines sent while nothing happens, so proxies keep idle streams open
+EVENTS_KEEPALIVE_SECONDS = float(os.environ.get('EVENTS_KEEPALIVE_SECONDS', 15))
+# Streams end after this long; EventSource reconnects on its own with Last-Event-ID
+EVENTS_MAX_STREAM_SECONDS = float(os.environ.get('EVENTS_MAX_STREAM_SECONDS', 5 * 60))
+# Request threads per worker; serving.py passes its profile's count to gunicorn. Unset
+# under the development server, which starts a thread per request.
+WORKER_THREADS = int(os.environ['WORKER_THREADS']) if os.environ.get('WORKER_THREADS', '').isdigit() else None
+# Streams on the Flask route, per worker, across tenants. Each holds a request thread for as
+# long as it lasts, so under gunicorn they get at most half of them and other requests keep
+# the rest. Pages use the event server instead when there is one (helpers/event_server.py).
+EVENTS_MAX_CLIENTS = int(os.environ.get('EVENTS_MAX_CLIENTS', 50 if WORKER_THREADS is None else WORKER_THREADS // 2))
+
+
+def format_event(name, data, event_id=None):
+    lines = [f'event: {name}', f'data: {json.dumps(data, separators=(",", ":"))}']
+    if event_id is not None:
+        lines.insert(0, f'id: {event_id}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def delta(since):
+    """(version, messages) for the permit changes after ``since``; None if the client must reload.
+
+    Only the last message carries the version, so a reconnect never skips part of a delta.
+    """
+    changes = permit_sync.changes_since(since)
+    if changes is None:
+        return None
+    version, changed, deleted, expired = changes
+    events = [('permit', permit) for permit in changed]
+    events += [('deleted', {'id': permit_id}) for permit_id in deleted]
+    events += [('expired', {'id': permit_id}) for permit_id in expired]
+    return version, [format_event(name, data, version if i == len(events) - 1 else None)
+                     for i, (name, data) in enumerate(events)]
+
+
+class Slots:
+    """Caps the streams one worker serves in one way, e.g. on request threads."""
+    def __init__(self, limit):
+        self.limit = limit
+        self.open = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self.open >= self.limit:
+                return False
+            self.open += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.open -= 1
+
+
+# Streams served from the Flask route, each on a request thread
+thread_slots = Slots(EVENTS_MAX_CLIENTS)
+
+
+class Broadcaster:
+    """Fans out messages to every open stream of one tenant in this worker.
+
+    One poller thread publishes. Streams on request threads block on a
+    shared Condition instead of polling; the event server's loop is woken
+    through a listener instead (see helpers/event_server.py).
+    """
+    def __init__(self, size=256):
+        self._condition = threading.Condition()
+        # (seq, version, message); version is None for messages not tied to permit data
+        self._messages = collections.deque(maxlen=size)
+        self._seq = 0
+        self._listeners = []
+        self.clients = 0
+
+    def add_listener(self, callback):
+        """Calls ``callback`` (from the publishing thread) after every publish."""
+        with self._condition:
+            self._listeners.append(callback)
+
+    def cursor(self):
+        with self._condition:
+            return self._seq
+
+    def publish(self, version, messages):
+        if not messages:
+            return
+        with self._condition:
+            for message in messages:
+                self._seq += 1
+                self._messages.append((self._seq, version, message))
+            self._condition.notify_all()
+            listeners = list(self._listeners)
+        for callback in listeners:
+            callback()
+
+    def wait(self, after, timeout):
+        """Messages published after cursor ``after``, waiting up to ``timeout``.
+
+        Returns (cursor, messages); messages is None when the client fell
+        further behind than the buffer reaches.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._seq > after, timeout)
+            if self._seq == after:
+                return after, []
+            if self._messages[0][0] > after + 1:
+                return self._seq, None
+            return self._seq, [(version, message) for seq, version, message in self._messages if seq > after]
+
+    def join(self, slots=None):
+        """Counts a new stream against ``slots`` (request threads by default); False when they are all taken."""
+        if not (slots or thread_slots).acquire():
+            return False
+        with self._condition:
+            self.clients += 1
+        return True
+
+    def leave(self, slots=None):
+        with self._condition:
+            self.clients -= 1
+        (slots or thread_slots).release()
+
+
+class Channel:
+    """A tenant's broadcaster, and the permit version, finished operation and usage its poller last published."""
+    def __init__(self):
+        self.broadcaster = Broadcaster()
+        self.version = None
+        self.operations_seq = None
+        self.remaining = None
+
+
+_channels = {}
+_channels_lock = threading.Lock()
+
+
+def channel(tenant):
+    with _channels_lock:
+        if tenant.key not in _channels:
+            _channels[tenant.key] = Channel()
+        return _channels[tenant.key]
+
+
+def poll_channel(channel):
+    """Publishes the current tenant's permit changes, finished outbox operations and remaining usage."""
+    broadcaster = channel.broadcaster
+    if not broadcaster.clients:
+        # Start from the current version once someone listens, instead of replaying history.
+        channel.version = None
+        channel.operations_seq = None
+        return
+    if channel.version is None:
+        channel.version = permit_sync.current_version()
+    else:
+        result = delta(channel.version)
+        if result is None:
+            channel.version = permit_sync.current_version()
+            broadcaster.publish(None, [format_event('reset', {}, channel.version)])
+        else:
+            channel.version, messages = result
+            broadcaster.publish(channel.version, messages)
+
+    if channel.operations_seq is None:
+        channel.operations_seq = outbox.last_finished_seq()
+    else:
+        channel.operations_seq, operations = outbox.finished_since(channel.operations_seq)
+        broadcaster.publish(None, [format_event('operation', operation) for operation in operations])
+
+    remaining = tenants.current().usage_ledger.remaining()
+    if remaining is not None and remaining != channel.remaining:
+        channel.remaining = remaining
+        broadcaster.publish(None, [format_event('usage', {'remaining': str(remaining)})])
+
+
+def poll():
+    """Polls every tenant with a channel in this worker; those nobody listens to cost one check."""
+    with _channels_lock:
+        channels = list(_channels.items())
+    for key, tenant_channel in channels:
+        with tenants.scope(tenants.registry.get(key)):
+            poll_channel(tenant_channel)
+
+
+def catch_up(broadcaster, since):
+    """(cursor, version, messages) to start a stream of the current tenant at: the catch-up from ``since``, if any.
+
+    The cursor is taken first, so a change published meanwhile is sent
+    live rather than lost.
+    """
+    cursor = broadcaster.cursor()
+    version = permit_sync.current_version()
+    messages = []
+    if since is not None:
+        result = delta(since)
+        if result is None:
+            messages = [format_event('reset', {}, version)]
+        else:
+            version, messages = result
+    return cursor, version, messages
+
+
+def live(messages, version):
+    """The published messages a stream caught up to ``version`` still has to send."""
+    # Permit changes the catch-up already covered are skipped.
+    return [message for message_version, message in messages if message_version is None or message_version > version]
+
+
+def stream(since):
+    """SSE messages for one client that has joined its tenant's broadcaster: the catch-up from ``since``, then live ones.
+
+    The catch-up is read here, in the view, so the stream itself runs
+    outside any app context and holds no database connection while idle.
+    """
+    broadcaster = channel(tenants.current()).broadcaster
+    cursor, version, messages = catch_up(broadcaster, since)
+    deadline = time.monotonic() + EVENTS_MAX_STREAM_SECONDS
+
+    def generate():
+        nonlocal cursor
+        yield 'retry: 3000\n\n'
+        yield from messages
+        while time.monotonic() < deadline:
+            cursor, published = broadcaster.wait(cursor, EVENTS_KEEPALIVE_SECONDS)
+            if published is None:
+                yield format_event('reset', {})
+                return
+            if not published:
+                yield ': keep-alive\n\n'
+            yield from live(published, version)
+
+    # close() runs even when the client leaves before the first message.
+    return ClosingIterator(generate(), [broadcaster.leave])
+
+
+poller = BackgroundWorker('events', EVENTS_POLL_SECONDS, poll)
@@ -0,0 +1,210 @@
+import asyncio
+import os
+import threading
+import time
+
+from server.helpers import circuit_breaker, deadline
+
+# Connection pool settings for upstream calls, shared by every request a worker serves.
+POOL_CONNECTIONS = int(os.environ.get('PARKINGBOSS_POOL_CONNECTIONS', 4))
+POOL_MAXSIZE = int(os.environ.get('PARKINGBOSS_POOL_MAXSIZE', 16))
+KEEP_ALIVE = os.environ.get('PARKINGBOSS_KEEP_ALIVE', 'true').lower() == 'true'
+GET_RETRIES = int(os.environ.get('PARKINGBOSS_GET_RETRIES', 2))
+RETRY_BACKOFF = float(os.environ.get('PARKINGBOSS_RETRY_BACKOFF', 0.2))
+
+
+def record(breaker, response):
+    # 4xx answers (bad token, rejected policy) mean upstream is up.
+    if response.status_code >= 500:
+        breaker.failure()
+    else:
+        breaker.success()
+
+
+def retry_backoff(client, method, response, attempt):
+    """Seconds to wait before sending the call again, or None when ``response`` is final.
+
+    Only GETs answered 502, 503 or 504 are retried, up to ``get_retries``
+    times, and only while the request's budget covers the wait.
+    """
+    if method != 'GET' or response.status_code not in (502, 503, 504) or attempt >= client.get_retries:
+        return None
+    backoff = client.retry_backoff * (2 ** attempt)
+    left = deadline.remaining()
+    if left is not None and left <= backoff:
+        return None
+    return backoff
+
+
+class ParkingBossClient:
+    """Pooled, keep-alive HTTP client for ParkingBoss.
+
+    Exposes the same ``get``/``post``/``put`` call shape as the ``requests``
+    module, plus the ``endpoint`` whose circuit breaker guards the call.
+    Every attempt is bounded by what is left of the request's deadline (see
+    helpers/deadline.py). Only GETs are retried (with backoff), since
+    creating or expiring a permit twice is not safe, and failed connections
+    and timed-out reads are not retried at all. Retries are driven here
+    rather than by urllib3, which would give every attempt the full timeout.
+    The session is rebuilt after a fork so gunicorn workers never share
+    sockets with the master process.
+    """
+    def __init__(self, pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE,
+                 keep_alive=KEEP_ALIVE, get_retries=GET_RETRIES, retry_backoff=RETRY_BACKOFF):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.keep_alive = keep_alive
+        self.get_retries = get_retries
+        self.retry_backoff = retry_backoff
+        self._lock = threading.Lock()
+        self._session = None
+        self._pid = None
+
+    def _build_session(self):
+        # Imported with the first session, so workers that never call upstream skip them.
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        adapter = HTTPAdapter(pool_connections=self.pool_connections,
+                              pool_maxsize=self.pool_maxsize,
+                              max_retries=0)
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        if not self.keep_alive:
+            session.headers['Connection'] = 'close'
+        return session
+
+    @property
+    def session(self):
+        pid = os.getpid()
+        if self._session is None or self._pid != pid:
+            with self._lock:
+                if self._session is None or self._pid != pid:
+                    self._session = self._build_session()
+                    self._pid = pid
+        return self._session
+
+    def request(self, method, url, endpoint='parkingboss', **kwargs):
+        breaker = circuit_breaker.breaker(endpoint)
+        attempt = 0
+        while True:
+            timeout = kwargs['timeout'] if 'timeout' in kwargs else deadline.timeout()
+            breaker.before()
+            try:
+                response = self.session.request(method, url, **dict(kwargs, timeout=timeout))
+            except BaseException:
+                breaker.failure()
+                raise
+            record(breaker, response)
+            backoff = retry_backoff(self, method, response, attempt)
+            if backoff is None:
+                return response
+            response.close()
+            time.sleep(backoff)
+            attempt += 1
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+            self._session = None
+            self._pid = None
+
+
+class AsyncParkingBossClient:
+    """asyncio counterpart of ParkingBossClient, built on httpx.
+
+    Flask runs each async view on a loop of its own, and an httpx.AsyncClient
+    is bound to the loop it was created on. So each worker keeps one event
+    loop running on a daemon thread, which owns the worker's single pooled
+    client; views hand their calls to it and await the result. Deadlines,
+    circuit breakers and GET retries work as in the blocking client. Like the
+    blocking client's session, the loop and client are rebuilt after a fork.
+    """
+    def __init__(self, pool_maxsize=POOL_MAXSIZE, keep_alive=KEEP_ALIVE,
+                 get_retries=GET_RETRIES, retry_backoff=RETRY_BACKOFF):
+        self.pool_maxsize = pool_maxsize
+        self.keep_alive = keep_alive
+        self.get_retries = get_retries
+        self.retry_backoff = retry_backoff
+        self._lock = threading.Lock()
+        self._loop = None
+        self._client = None
+        self._pid = None
+
+    def _build_client(self):
+        import httpx
+
+        limits = httpx.Limits(max_connections=self.pool_maxsize,
+                              max_keepalive_connections=self.pool_maxsize if self.keep_alive else 0)
+        headers = {} if self.keep_alive else {'Connection': 'close'}
+        return httpx.AsyncClient(limits=limits, headers=headers)
+
+    def _start(self):
+        loop = asyncio.new_event_loop()
+        threading.Thread(target=loop.run_forever, name='parkingboss-async', daemon=True).start()
+        self._client = self._build_client()
+        self._loop = loop
+        self._pid = os.getpid()
+
+    @property
+    def loop(self):
+        """This worker's client loop, started on first use."""
+        pid = os.getpid()
+        if self._loop is None or self._pid != pid:
+            with self._lock:
+                if self._loop is None or self._pid != pid:
+                    self._start()
+        return self._loop
+
+    async def _send(self, method, url, **kwargs):
+        loop = self.loop
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(
+            self._client.request(method, url, **kwargs), loop))
+
+    async def request(self, method, url, endpoint='parkingboss', **kwargs):
+        breaker = circuit_breaker.breaker(endpoint)
+        attempt = 0
+        while True:
+            timeout = kwargs['timeout'] if 'timeout' in kwargs else deadline.timeout()
+            breaker.before()
+            try:
+                response = await self._send(method, url, **dict(kwargs, timeout=timeout))
+            except BaseException:
+                breaker.failure()
+                raise
+            record(breaker, response)
+            backoff = retry_backoff(self, method, response, attempt)
+            if backoff is None:
+                return response
+            await asyncio.sleep(backoff)
+            attempt += 1
+
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request('POST', url, **kwargs)
+
+    async def put(self, url, **kwargs):
+        return await self.request('PUT', url, **kwargs)
+
+    def close(self):
+        """Closes the client and stops its loop, if this process started them."""
+        with self._lock:
+            if self._loop is not None and self._pid == os.getpid():
+                asyncio.run_coroutine_threadsafe(self._client.aclose(), self._loop).result()
+                self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop = None
+            self._client = None
+            self._pid = None
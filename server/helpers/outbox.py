@@ -0,0 +1,197 @@
+"""Durable outbox for permit creates and deletes.
+
+A write is recorded as an Operation row and acknowledged right away; the
+outbox worker of every process then drains the table to ParkingBoss.
+
+- A worker claims an operation with a conditional UPDATE, so each one is
+  sent by a single worker even when several drain at once.
+- Operations on the same normalized plate go upstream in the order they
+  were accepted: only the oldest unfinished one of a plate can be claimed.
+- Failed calls are retried with exponential backoff, up to
+  OUTBOX_MAX_ATTEMPTS; running out of quota fails the operation at once.
+- An operation is marked done, with the new permit's ID, as soon as
+  upstream accepts it and before the mirror is written, so a failing
+  mirror write never sends it again. Errors other than the API's end the
+  operation instead of retrying it, since upstream may have acted.
+- Operations claimed by a worker that died mid-call are handed out again
+  after OUTBOX_CLAIM_TIMEOUT_SECONDS, so a create can, rarely, reach
+  upstream twice.
+
+Deletes hide the permit in the mirror as soon as they are accepted. If the
+delete never reaches upstream, the next sync after the local-write grace
+period brings the permit back.
+"""
+import datetime
+import os
+import uuid
+
+from flask import current_app
+from sqlalchemy import exists, func, select, update
+from sqlalchemy.orm import aliased
+
+from server.background import BackgroundWorker
+from server.helpers import parkingboss_api_helper, permit_sync, tenants
+from server.helpers.error_handler import ExternalAPIError, QuotaExceededError, ResponseParsingError
+from server.helpers.plate_search import normalize_plate
+from server.models.database import db, Operation, Permit
+
+OUTBOX_TICK_SECONDS = float(os.environ.get('OUTBOX_TICK_SECONDS', 1))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', 5))
+# Retry n waits OUTBOX_RETRY_BASE_SECONDS * 2 ** (n - 1)
+OUTBOX_RETRY_BASE_SECONDS = float(os.environ.get('OUTBOX_RETRY_BASE_SECONDS', 2))
+OUTBOX_CLAIM_TIMEOUT_SECONDS = float(os.environ.get('OUTBOX_CLAIM_TIMEOUT_SECONDS', 120))
+
+PENDING, RUNNING, DONE, FAILED = 'pending', 'running', 'done', 'failed'
+
+
+def enqueue(kind, plate_key, **values):
+    now = permit_sync.utcnow()
+    operation = Operation(operation_id=str(uuid.uuid4()), tenant=tenants.current().key, kind=kind, plate_key=plate_key,
+                          state=PENDING, created_at=now, next_attempt_at=now, **values)
+    db.session.add(operation)
+    db.session.commit()
+    drainer.wake()
+    return operation
+
+
+def enqueue_create(license_plate, duration):
+    return enqueue('create', normalize_plate(license_plate) or license_plate,
+                   license_plate=license_plate, duration=duration)
+
+
+def enqueue_delete(permit_id):
+    permit = permit_sync.tenant_permits().filter(Permit.permit_id == permit_id).one_or_none()
+    license_plate = permit.license_plate if permit is not None else None
+    # Unknown permits still need an order among themselves; their ID stands in for the plate.
+    operation = enqueue('delete', normalize_plate(license_plate or '') or permit_id,
+                        license_plate=license_plate, permit_id=permit_id)
+    permit_sync.apply_deleted(permit_id)
+    return operation
+
+
+def get(operation_id):
+    return Operation.query.filter_by(operation_id=operation_id, tenant=tenants.current().key).one_or_none()
+
+
+def requeue_stalled(now):
+    """Hands out again the operations of workers that died while sending them.
+
+    Looks first, so an idle outbox costs every worker a read per drain
+    rather than a write and a commit.
+    """
+    stalled = (Operation.state == RUNNING,
+               Operation.claimed_at < now - datetime.timedelta(seconds=OUTBOX_CLAIM_TIMEOUT_SECONDS))
+    if not db.session.scalar(select(exists().where(*stalled))):
+        return
+    db.session.execute(update(Operation).where(*stalled).values(state=PENDING))
+    db.session.commit()
+
+
+def claim_next(now):
+    """Claims the oldest operation that is due and first in line for its plate; None when there is none."""
+    earlier = aliased(Operation)
+    blocked = exists().where(earlier.tenant == Operation.tenant, earlier.plate_key == Operation.plate_key,
+                             earlier.id < Operation.id, earlier.state.in_((PENDING, RUNNING)))
+    while True:
+        operation_id = db.session.scalar(select(Operation.id).where(
+            Operation.state == PENDING, Operation.next_attempt_at <= now, ~blocked).order_by(Operation.id).limit(1))
+        if operation_id is None:
+            return None
+        claimed = db.session.execute(update(Operation).where(
+            Operation.id == operation_id, Operation.state == PENDING).values(
+            state=RUNNING, claimed_at=now, attempts=Operation.attempts + 1)).rowcount
+        db.session.commit()
+        if claimed:
+            return db.session.get(Operation, operation_id, populate_existing=True)
+        # Another worker got there first; look again.
+
+
+def finish(operation, state, error=None):
+    latest = aliased(Operation)
+    db.session.execute(update(Operation).where(Operation.id == operation.id).values(
+        state=state, error=error, permit_id=operation.permit_id, finished_at=permit_sync.utcnow(),
+        finished_seq=select(func.coalesce(func.max(latest.finished_seq), 0) + 1).scalar_subquery()))
+    db.session.commit()
+
+
+def retry_later(operation, error):
+    delay = OUTBOX_RETRY_BASE_SECONDS * 2 ** (operation.attempts - 1)
+    db.session.execute(update(Operation).where(Operation.id == operation.id).values(
+        state=PENDING, error=error, next_attempt_at=permit_sync.utcnow() + datetime.timedelta(seconds=delay)))
+    db.session.commit()
+
+
+def perform(operation):
+    """Sends one operation upstream for the current tenant."""
+    if operation.kind == 'create':
+        operation.permit_id = parkingboss_api_helper.create_permit(license_plate=operation.license_plate,
+                                                                   duration=operation.duration)
+    else:
+        parkingboss_api_helper.delete_permit(operation.permit_id)
+
+
+def apply(operation):
+    """Applies a finished operation to the current tenant's mirror."""
+    if operation.kind == 'create':
+        permit_sync.apply_created(operation.permit_id, operation.license_plate, operation.duration)
+    else:
+        permit_sync.apply_deleted(operation.permit_id)
+
+
+def run(operation):
+    tenant = tenants.registry.get(operation.tenant)
+    if tenant is None:
+        return finish(operation, FAILED, f'Tenant {operation.tenant} is no longer configured')
+    with tenants.scope(tenant):
+        try:
+            perform(operation)
+        except QuotaExceededError as e:
+            db.session.rollback()
+            finish(operation, FAILED, e.message)
+        except (ExternalAPIError, ResponseParsingError) as e:
+            db.session.rollback()
+            if operation.attempts >= OUTBOX_MAX_ATTEMPTS:
+                current_app.logger.warning('Giving up on %s %s after %d attempts: %s',
+                                           operation.kind, operation.operation_id, operation.attempts, e.message)
+                finish(operation, FAILED, e.message)
+            else:
+                retry_later(operation, e.message)
+        except Exception:
+            # Whether upstream acted is unknown, and sending it again could issue a second permit.
+            db.session.rollback()
+            current_app.logger.exception('Unexpected error sending %s %s', operation.kind, operation.operation_id)
+            finish(operation, FAILED, 'Unexpected error')
+        else:
+            # Committed before the mirror is touched: once upstream has acted, nothing sends it again.
+            finish(operation, DONE)
+            try:
+                apply(operation)
+            except Exception:
+                # The next sync brings the mirror in line with upstream.
+                db.session.rollback()
+                current_app.logger.exception('Could not apply %s %s to the mirror', operation.kind, operation.operation_id)
+
+
+def drain():
+    """Sends every operation that is due, one at a time, until none is left for this worker."""
+    now = permit_sync.utcnow()
+    requeue_stalled(now)
+    while True:
+        operation = claim_next(now)
+        if operation is None:
+            return
+        run(operation)
+
+
+def last_finished_seq():
+    return db.session.scalar(select(func.coalesce(func.max(Operation.finished_seq), 0)))
+
+
+def finished_since(seq):
+    """The current tenant's operations finished after ``seq``, and the latest seq seen."""
+    operations = Operation.query.filter(Operation.tenant == tenants.current().key, Operation.finished_seq > seq).order_by(
+        Operation.finished_seq).all()
+    return (operations[-1].finished_seq if operations else seq), [operation.to_dict() for operation in operations]
+
+
+drainer = BackgroundWorker('outbox', OUTBOX_TICK_SECONDS, drain)
@@ -1,26 +1,49 @@
-import requests
 import datetime
-from dateutil import tz
 from decimal import Decimal
 import os
+import time
 
 from flask import current_app, jsonify
 
+from server import log, metrics
+from server.lazy import lazy_import
 from server.helpers.error_handler import ExternalAPIError, ResponseParsingError
+from server.helpers.http_client import ParkingBossClient
+from server.helpers.refresher import StaleWhileRevalidate
+from server.helpers.single_flight import SingleFlight
+from server.helpers.token_manager import TokenManager
+from server.helpers.ttl_cache import TTLCache
+from server.helpers.usage_ledger import UsageLedger, hours_in
+from server.helpers import tenants
 
-# Environment Variables
+# Loaded by the first upstream call rather than at worker boot
+requests = lazy_import('requests')
+tz = lazy_import('dateutil.tz')
+
+# Environment Variables: the default tenant (others come from TENANTS_FILE, see helpers/tenants.py)
 LOCATION_ID = os.environ.get('LOCATION_ID')
 TENANT = os.environ.get('TENANT')
 TENANT_PW = os.environ.get('TENANT_PW')
 CANCEL_EMAIL = os.environ.get('CANCEL_EMAIL')
 MONTHLY_USAGE_QUOTA = os.environ.get('MONTHLY_USAGE_QUOTA')
 TIMEZONE = os.environ.get('TIMEZONE')
+POLICY_TTL_SECONDS = float(os.environ.get('POLICY_TTL_SECONDS', 6 * 60 * 60))
+USAGE_TTL_SECONDS = float(os.environ.get('USAGE_TTL_SECONDS', 60))
+USAGE_MAX_STALE_SECONDS = float(os.environ.get('USAGE_MAX_STALE_SECONDS', 15 * 60))
+
+# API URLS (PARKINGBOSS_API_URL points at a local stand-in for load tests, see loadtest/)
+# Location-specific URLs are built per tenant (Tenant.usage_url, Tenant.permits_url).
+API_URL = os.environ.get('PARKINGBOSS_API_URL', 'https://api.parkingboss.com/v1')
+TOKEN_URL = f'{API_URL}/accounts/auth/tokens'
+CREATE_URL = f"{API_URL}/permits/temporary"
+
+# One pooled client per worker process, shared by every tenant; every upstream call goes through it.
+client = ParkingBossClient()
+
 
-# API URLS
-TOKEN_URL = 'https://api.parkingboss.com/v1/accounts/auth/tokens'
-USAGE_URL = f'https://api.parkingboss.com/v1/locations/{LOCATION_ID}'
-PERMITS_URL = f'https://api.parkingboss.com/v1/locations/{LOCATION_ID}/tenants'
-CREATE_URL = "https://api.parkingboss.com/v1/permits/temporary"
+def tenant_key():
+    """Identifies the current tenant in shared cache keys."""
+    return tenants.current().cache_key
 
 
 # Learning - Z is for Zulu time, which is UTC time.
@@ -29,14 +52,13 @@ def generate_timestamp_z():
 
 
 def generate_timestamp_with_utc_offset():
-    timestamp = datetime.datetime.now(tz=tz.gettz(TIMEZONE))
+    timestamp = datetime.datetime.now(tz=tz.gettz(tenants.current().timezone))
     timestamp_str = timestamp.strftime("%Y-%m-%dT%H:%M:%S.%f%z")
     return timestamp_str[:-8] + '-' + timestamp_str[-3] + ':' + timestamp_str[-2:]
-    return datetime.datetime.now(tz=tz.gettz(TIMEZONE)).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + '-08:00'
 
 
 def generate_timestamp_with_utc_offset_range_1_month():
-    my_tz = tz.gettz(TIMEZONE)
+    my_tz = tz.gettz(tenants.current().timezone)
     start = datetime.datetime.now(tz=my_tz)
     fmt = "%Y-%m-%dT%H:%M:%S.%f%z"
     end = start + datetime.timedelta(days=30)
@@ -47,144 +69,258 @@ def generate_timestamp_with_utc_offset_range_1_month():
     return start + '/' + end
 
 
-def get_tenant_id_and_bearer_token():
-    params = {'viewpoint': generate_timestamp_z(), 'location': LOCATION_ID, 'tenant': TENANT, 'password': TENANT_PW}
-    current_app.logger.info(f'Calling POST to: {TOKEN_URL} with params: {params}')
+@metrics.timed_upstream('token')
+def get_tenant_id_and_bearer_token(tenant=None):
+    tenant = tenant or tenants.current()
+    params = {'viewpoint': generate_timestamp_z(), 'location': tenant.location_id, 'tenant': tenant.tenant, 'password': tenant.password}
+    log.payload(current_app.logger, 'Calling POST to: %s with params: %s', TOKEN_URL, params)
     try:
-        response = requests.post(TOKEN_URL, params=params, headers={"Content-Type": "application/json"},)
+        response = client.post(TOKEN_URL, params=params, headers={"Content-Type": "application/json"}, endpoint='token')
         response.raise_for_status()
         response = response.json()
         return {"tenant_id": response["accounts"]["item"], "bearer": response["token"]}
     except requests.RequestException as e:
-        current_app.logger.exception('Error with API request: %s', str(e))
+        current_app.logger.exception('Error with API request: %s', e)
         raise ExternalAPIError() from e
     except KeyError as e:
-        current_app.logger.exception('Malformatted API response: %s', str(e))
+        current_app.logger.exception('Malformatted API response: %s', e)
         raise ResponseParsingError() from e
 
 
+# The default tenant's token (see tenants.DefaultTenant); looked up through the module
+# so tests can patch get_tenant_id_and_bearer_token.
+token_manager = TokenManager(lambda: get_tenant_id_and_bearer_token())
+
+# Permit policy IDs keyed by (location, tenant); they almost never change.
+policy_cache = TTLCache(POLICY_TTL_SECONDS)
+
+# Concurrent identical reads share one upstream request (blocking and async paths alike).
+flights = SingleFlight()
+
+# The default tenant's hours used against MONTHLY_USAGE_QUOTA, reconciled on every usage fetch.
+usage_ledger = UsageLedger(MONTHLY_USAGE_QUOTA)
+
+
+def call_with_auth(make_request):
+    """Calls make_request(auth_data) with the current tenant's cached token, refreshing it once on a 401."""
+    manager = tenants.current().token_manager
+    auth_data = manager.get()
+    response = make_request(auth_data)
+    if response.status_code == 401:
+        current_app.logger.info('Bearer token rejected, refreshing')
+        manager.invalidate(auth_data["bearer"])
+        response = make_request(manager.get())
+    response.raise_for_status()
+    return response
+
+
+def parse_usage_and_policy_id(j):
+    # Get current usage
+    dic = next(iter(j["usage"]["items"].values()))["used"]
+    usage = next(iter(dic.values()))["display"]
+
+    policy_id = next(iter(j["issuers"]["items"].values()))["policy"]
+    return {"usage": usage.split(' ')[0], "policy_id": policy_id}
+
+
 def get_usage_and_policy_id():
-    auth_data = get_tenant_id_and_bearer_token()
-    params = {"viewpoint": generate_timestamp_with_utc_offset(), "Authorization": f"bearer {auth_data['bearer']}", "sample": "PT24H"}
-    full_url = f"{USAGE_URL}/tenants/{auth_data['tenant_id']}/permits/temporary/usage"
-    current_app.logger.info(f'Calling GET to: {full_url} with params: {params}')
-    try:
-        response = requests.get(full_url, params=params, headers={"Content-Type": "application/json"},)
-        response.raise_for_status()
-        current_app.logger.info(f'Parking API request succeeded')
-        j = response.json()                                                                    
+    return flights.do(('usage', tenant_key()), fetch_usage_and_policy_id)
 
-        # Get current usage
-        dic = next(iter(j["usage"]["items"].values()))["used"]
-        usage = next(iter(dic.values()))["display"]
 
-        policy_id = next(iter(j["issuers"]["items"].values()))["policy"]
-        current_app.logger.info(f'Returning usage: {usage}, policy_id: {policy_id}')
-        return {"usage": usage.split(' ')[0], "policy_id": policy_id}
+@metrics.timed_upstream('usage')
+def fetch_usage_and_policy_id():
+    tenant = tenants.current()
+
+    def make_request(auth_data):
+        params = {"viewpoint": generate_timestamp_with_utc_offset(), "Authorization": f"bearer {auth_data['bearer']}", "sample": "PT24H"}
+        full_url = f"{tenant.usage_url}/tenants/{auth_data['tenant_id']}/permits/temporary/usage"
+        log.payload(current_app.logger, 'Calling GET to: %s with params: %s', full_url, params)
+        return client.get(full_url, params=params, headers={"Content-Type": "application/json"}, endpoint='usage')
+
+    try:
+        started = time.monotonic()
+        response = call_with_auth(make_request)
+        current_app.logger.debug('Parking API request succeeded')
+        usage_dict = parse_usage_and_policy_id(response.json())
+        policy_cache.set((tenant.location_id, tenant.tenant), usage_dict["policy_id"])
+        tenant.usage_ledger.reconcile(usage_dict["usage"], started)
+        current_app.logger.debug('Returning usage: %s, policy_id: %s', usage_dict["usage"], usage_dict["policy_id"])
+        return usage_dict
     except requests.RequestException as e:
-        current_app.logger.exception('Error with API request: %s', str(e))
+        current_app.logger.exception('Error with API request: %s', e)
         raise ExternalAPIError() from e
     except KeyError as e:
-        current_app.logger.exception('Malformatted API response: %s', str(e))
+        current_app.logger.exception('Malformatted API response: %s', e)
         raise ResponseParsingError() from e
     except IndexError as e:
-        current_app.logger.exception('Malformatted API response: %s', str(e))
+        current_app.logger.exception('Malformatted API response: %s', e)
         raise ResponseParsingError() from e
 
-def get_remaining_usage():
-    quota = Decimal(str(MONTHLY_USAGE_QUOTA)).quantize(Decimal('0.01'))
+def remaining_from_usage(usage_dict):
+    quota = Decimal(str(tenants.current().monthly_usage_quota)).quantize(Decimal('0.01'))
     usage = 0
+    if usage_dict is not None and 'usage' in usage_dict and usage_dict["usage"] is not None:
+        usage = Decimal(str(usage_dict["usage"])).quantize(Decimal('0.01'))
+    return str(quota - usage)
+
+
+def get_remaining_usage():
     usage_dict = None
     try:
         usage_dict = get_usage_and_policy_id()
     except ExternalAPIError as e:
-        current_app.logger.exception('Error with API request: %s', str(e))
+        current_app.logger.exception('Error with API request: %s', e)
     except ResponseParsingError as e:
-        current_app.logger.exception('Malformatted API response: %s', str(e))
-    if usage_dict is not None and 'usage' in usage_dict and usage_dict["usage"] is not None:
-        usage = Decimal(str(usage_dict["usage"])).quantize(Decimal('0.01'))
-    return str(quota - usage)
+        current_app.logger.exception('Malformatted API response: %s', e)
+    return remaining_from_usage(usage_dict)
 
 
-# TODO: CHECK HERE TO SEE IF EXPIRED PERMITS SHOW
-# THIS COULD BE CAUSING THE ISSUE WITH THE DELETED PERMITS STILL SHOWING FOR A LITTLE.
-def get_permits():
-    auth_data = get_tenant_id_and_bearer_token()
-    params = {
-        "valid": generate_timestamp_with_utc_offset_range_1_month(),
-        "viewpoint": generate_timestamp_with_utc_offset(),
-        "Authorization": f"bearer {auth_data['bearer']}"
-    }
-    full_url = f"{PERMITS_URL}/{auth_data['tenant_id']}/permits"
-    permits = []
+# The default tenant's usage for the home page, refreshed in the background instead of per request.
+usage_refresher = StaleWhileRevalidate('usage', lambda: get_usage_and_policy_id(),
+                                       ttl=USAGE_TTL_SECONDS, max_stale=USAGE_MAX_STALE_SECONDS,
+                                       active=lambda: tenants.registry.default().active())
+
+
+def get_cached_remaining_usage():
+    """Remaining hours from the current tenant's usage ledger, which includes permits issued since the last fetch."""
+    tenant = tenants.current()
     try:
-        current_app.logger.info(f'Calling GET to: {full_url} with params: {params}')
-        response = requests.get(full_url, params=params)
-        response.raise_for_status()
+        # Keeps the ledger's upstream figure fresh; only a missing or too-stale one is fetched here.
+        tenant.usage_refresher.get()
+    except ExternalAPIError as e:
+        current_app.logger.exception('Error with API request: %s', e)
+    except ResponseParsingError as e:
+        current_app.logger.exception('Malformatted API response: %s', e)
+    remaining = tenant.usage_ledger.remaining()
+    return remaining_from_usage(None) if remaining is None else str(remaining)
+
+
+def iter_permits(response_permits):
+    """Yields permits one at a time, looking up each vehicle as it goes."""
+    vehicles = response_permits["vehicles"]["items"]
+    for permit_id, permit_dict in response_permits["permits"]["items"].items():
+        license_plate = vehicles[permit_dict["vehicle"]]["display"]
+        yield {"license_plate": license_plate, "expiration": permit_dict["lifecycle"]["invalid"], "id": permit_id}
+
+
+def parse_permits(response_permits):
+    # A list rather than the generator: single-flight hands the same result to every waiter.
+    return list(iter_permits(response_permits))
 
-        response_permits = response.json()
-        current_app.logger.info('Got response: %s', str(response_permits))
-        for permit_id, permit_dict in response_permits["permits"]["items"].items():
-            vehicle_id = permit_dict["vehicle"]
-            license_plate = response_permits["vehicles"]["items"][vehicle_id]["display"]
-            permit_expiry = permit_dict["lifecycle"]["invalid"]
-            permits.append({"license_plate": license_plate, "expiration": permit_expiry, "id": permit_id})
 
+def get_permits():
+    return flights.do(('permits', tenant_key()), fetch_permits)
+
+
+@metrics.timed_upstream('permits')
+def fetch_permits():
+    def make_request(auth_data):
+        params = {
+            "valid": generate_timestamp_with_utc_offset_range_1_month(),
+            "viewpoint": generate_timestamp_with_utc_offset(),
+            "Authorization": f"bearer {auth_data['bearer']}"
+        }
+        full_url = f"{tenants.current().permits_url}/{auth_data['tenant_id']}/permits"
+        log.payload(current_app.logger, 'Calling GET to: %s with params: %s', full_url, params)
+        return client.get(full_url, params=params, endpoint='permits')
+
+    try:
+        response = call_with_auth(make_request)
+
+        permits = parse_permits(response.json())
+        # The count only: the full body is hundreds of permits for busy tenants.
+        current_app.logger.info('Got %d permits', len(permits))
         return permits
 
     except requests.RequestException as e:
-        current_app.logger.exception('Error with API request: %s', str(e))
+        current_app.logger.exception('Error with API request: %s', e)
         raise ExternalAPIError() from e
     except KeyError as e:
-        current_app.logger.exception('Malformatted API response: %s', str(e))
+        current_app.logger.exception('Malformatted API response: %s', e)
         raise ResponseParsingError() from e
 
 
-def create_permit(license_plate, duration="PT1H", email=None, phone=None):
-    policy_id = get_usage_and_policy_id()["policy_id"]
-    params = {"viewpoint": generate_timestamp_z(), "location": LOCATION_ID,
-              "policy": policy_id, "vehicle": license_plate, "tenant": TENANT,
-              "token": TENANT_PW, "startDate": "", "duration": "PT1H",
+def policy_key():
+    tenant = tenants.current()
+    return tenant.location_id, tenant.tenant
+
+
+def get_policy_id():
+    policy_id = policy_cache.get(policy_key())
+    if policy_id is None:
+        policy_id = get_usage_and_policy_id()["policy_id"]
+    return policy_id
+
+
+def is_policy_error(response):
+    return response.status_code in (400, 403, 404, 422) and 'policy' in response.text.lower()
+
+
+def build_create_permit_request(policy_id, license_plate, duration, email, phone):
+    tenant = tenants.current()
+    params = {"viewpoint": generate_timestamp_z(), "location": tenant.location_id,
+              "policy": policy_id, "vehicle": license_plate, "tenant": tenant.tenant,
+              "token": tenant.password, "startDate": "", "duration": "PT1H",
               "email": email, "tel": phone}
-    form_data = {"location": LOCATION_ID,
-                 "policy": policy_id, "vehicle": license_plate, "tenant": TENANT,
-                 "token": TENANT_PW, "startDate": "", "duration": duration,
+    form_data = {"location": tenant.location_id,
+                 "policy": policy_id, "vehicle": license_plate, "tenant": tenant.tenant,
+                 "token": tenant.password, "startDate": "", "duration": duration,
                  "email": email, "tel": phone}
-    permit_id = None
+    return params, form_data
 
-    try:
-        # Make a request to the external API
-        current_app.logger.info(f'Calling POST to: {CREATE_URL} with params: {params} and data: {form_data}')
-        response = requests.post(CREATE_URL,
-                                 params=params,
-                                 data=form_data
-                                 )
-        response.raise_for_status()
 
-        dic = response.json()
-        return dic["permits"]["item"]
+@metrics.timed_upstream('create')
+def create_permit(license_plate, duration="PT1H", email=None, phone=None):
+    def make_request(policy_id):
+        params, form_data = build_create_permit_request(policy_id, license_plate, duration, email, phone)
+        log.payload(current_app.logger, 'Calling POST to: %s with params: %s and data: %s', CREATE_URL, params, form_data)
+        return client.post(CREATE_URL,
+                           params=params,
+                           data=form_data,
+                           endpoint='create'
+                           )
 
-    except requests.RequestException as e:
-        current_app.logger.exception('Error with API request: %s', str(e))
-        raise ExternalAPIError() from e
-    except KeyError as e:
-        current_app.logger.exception('Malformatted API response: %s', str(e))
-        raise ResponseParsingError() from e
+    # Checked against the ledger before any network I/O; released again if the create fails.
+    with tenants.current().usage_ledger.reserving(hours_in(duration)):
+        cached = policy_cache.get(policy_key()) is not None
+        policy_id = get_policy_id()
+
+        try:
+            # Make a request to the external API
+            response = make_request(policy_id)
+            if is_policy_error(response):
+                # The cached policy may have been replaced upstream; drop it and retry once.
+                current_app.logger.info('Policy %s rejected, invalidating cached policy', policy_id)
+                policy_cache.delete(policy_key())
+                if cached:
+                    response = make_request(get_policy_id())
+            response.raise_for_status()
+
+            dic = response.json()
+            return dic["permits"]["item"]
+
+        except requests.RequestException as e:
+            current_app.logger.exception('Error with API request: %s', e)
+            raise ExternalAPIError() from e
+        except KeyError as e:
+            current_app.logger.exception('Malformatted API response: %s', e)
+            raise ResponseParsingError() from e
 
 
+@metrics.timed_upstream('delete')
 def delete_permit(permit_id):
-    delete_url = "https://api.parkingboss.com/v1/permits/" + permit_id + "/expires"
-    params = {"viewpoint": generate_timestamp_z(), "permit": permit_id, "to": CANCEL_EMAIL, "_method": "PUT"}
+    delete_url = f"{API_URL}/permits/{permit_id}/expires"
+    params = {"viewpoint": generate_timestamp_z(), "permit": permit_id, "to": tenants.current().cancel_email, "_method": "PUT"}
 
     try:
-        current_app.logger.info(f'Calling PUT to: {delete_url} with params: {params}')
-        response = requests.put(delete_url, params=params)
+        log.payload(current_app.logger, 'Calling PUT to: %s with params: %s', delete_url, params)
+        response = client.put(delete_url, params=params, endpoint='delete')
         response.raise_for_status()
         return {"success": True, "permit_id": permit_id}
     except requests.RequestException as e:
-        current_app.logger.exception('Error with API request: %s', str(e))
+        current_app.logger.exception('Error with API request: %s', e)
         raise ExternalAPIError() from e
     except KeyError as e:
-        current_app.logger.exception('Malformatted API response: %s', str(e))
+        current_app.logger.exception('Malformatted API response: %s', e)
         raise ResponseParsingError() from e
 
@@ -0,0 +1,65 @@
+from sqlalchemy import insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import joinedload, selectinload
+
+from server.helpers import tenants
+from server.models.database import db, Car, Person
+
+
+def person_to_dict(person):
+    return {"id": person.id, "name": person.name, "license_plates": [car.license_plate for car in person.cars]}
+
+
+def tenant_people():
+    return Person.query.filter(Person.tenant == tenants.current().key)
+
+
+def count_people():
+    return tenant_people().count()
+
+
+def list_people(offset=0, limit=None):
+    """One page of the current tenant's people with their vehicles, in two queries whatever the page size."""
+    query = tenant_people().options(selectinload(Person.cars)).order_by(Person.name, Person.id)
+    return [person_to_dict(person) for person in query.offset(offset).limit(limit)]
+
+
+def get_person(person_id):
+    person = tenant_people().options(selectinload(Person.cars)).filter(Person.id == person_id).one_or_none()
+    return person_to_dict(person) if person is not None else None
+
+
+def find_vehicle(license_plate):
+    """The current tenant's vehicle with ``license_plate`` and its owner, through the unique plate index; None if unknown."""
+    return Car.query.options(joinedload(Car.owner)).filter_by(
+        tenant=tenants.current().key, license_plate=license_plate).one_or_none()
+
+
+def upsert_owners(owners):
+    """Sets the owner of each of the current tenant's plates in ``owners`` (plate -> person ID), adding vehicles not seen before, in one statement."""
+    if owners:
+        tenant = tenants.current().key
+        statement = sqlite_insert(Car)
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=['tenant', 'license_plate'], set_={"owner_id": statement.excluded.owner_id}),
+            [{"tenant": tenant, "license_plate": plate, "owner_id": person_id} for plate, person_id in owners.items()])
+
+
+def assign_vehicles(person_id, license_plates):
+    upsert_owners({plate: person_id for plate in license_plates})
+    db.session.commit()
+
+
+def create_people(people):
+    """Adds people (dicts with "name" and optional "license_plates") to the current tenant and returns their IDs in order.
+
+    The people are inserted with one multi-row statement and their vehicles
+    upserted with another, however many there are.
+    """
+    tenant = tenants.current().key
+    ids = db.session.scalars(insert(Person).returning(Person.id, sort_by_parameter_order=True),
+                             [{"tenant": tenant, "name": person["name"]} for person in people]).all()
+    # A plate listed twice goes to the last person naming it.
+    upsert_owners({plate: person_id for person_id, person in zip(ids, people) for plate in person.get("license_plates", ())})
+    db.session.commit()
+    return ids
@@ -0,0 +1,311 @@
+import datetime
+import os
+import threading
+
+from flask import current_app
+from sqlalchemy import and_, delete, func, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from server.background import BackgroundWorker
+from server.cache import bump_permit_generation
+from server.helpers import parkingboss_api_helper, refresher, tenants
+from server.helpers.usage_ledger import hours_in
+from server.lazy import lazy_import
+from server.models.database import db, Car, Permit, Renewal, SyncState
+
+parser = lazy_import('dateutil.parser')
+tz = lazy_import('dateutil.tz')
+
+SYNC_INTERVAL_SECONDS = float(os.environ.get('PERMIT_SYNC_INTERVAL_SECONDS', 30))
+# Past this age the list view syncs in the foreground instead of serving the mirror as is.
+MAX_STALE_SECONDS = float(os.environ.get('PERMIT_MAX_STALE_SECONDS', 10 * 60))
+# How long a local create/delete wins over an upstream list that does not reflect it yet.
+LOCAL_WRITE_GRACE_SECONDS = float(os.environ.get('PERMIT_LOCAL_WRITE_GRACE_SECONDS', 120))
+# How long removed permits are kept as tombstones for delta clients.
+TOMBSTONE_RETENTION_SECONDS = float(os.environ.get('PERMIT_TOMBSTONE_RETENTION_SECONDS', 7 * 24 * 60 * 60))
+
+
+def utcnow():
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def to_utc(expiration):
+    expires_at = parser.isoparse(expiration)
+    if expires_at.tzinfo is not None:
+        expires_at = expires_at.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return expires_at
+
+
+def in_grace(row, now):
+    return row.local_write_at is not None and now - row.local_write_at < datetime.timedelta(seconds=LOCAL_WRITE_GRACE_SECONDS)
+
+
+# Sort orders offered by the permit list
+SORT_COLUMNS = {'expires': Permit.expires_at, 'plate': Permit.license_plate}
+
+
+def tenant_permits():
+    return Permit.query.filter(Permit.tenant == tenants.current().key)
+
+
+def active_permits():
+    return tenant_permits().filter(Permit.deleted.is_(False), Permit.expires_at > utcnow())
+
+
+def count_permits():
+    return active_permits().count()
+
+
+def iter_permits(sort='expires', descending=False, offset=0, limit=None):
+    """Yields one page of the current tenant's active permits as dicts, fetching rows in batches."""
+    column = SORT_COLUMNS[sort]
+    query = active_permits().order_by(column.desc() if descending else column, Permit.permit_id)
+    for row in query.offset(offset).limit(limit).yield_per(100):
+        yield row.to_dict()
+
+
+def list_permits():
+    return list(iter_permits())
+
+
+def permits_for_plate(license_plate):
+    return [row.to_dict() for row in active_permits().filter(Permit.license_plate == license_plate).order_by(Permit.expires_at)]
+
+
+def sync_state():
+    return SyncState.query.filter_by(tenant=tenants.current().key).first()
+
+
+def upsert_sync_state(**values):
+    db.session.execute(sqlite_insert(SyncState).values(tenant=tenants.current().key, **values).on_conflict_do_update(
+        index_elements=['tenant'], set_=values))
+
+
+def last_synced_at():
+    state = sync_state()
+    return state.last_synced_at if state is not None else None
+
+
+def data_age():
+    """Seconds since the tenant's mirror last matched upstream, shared by all workers; None if never."""
+    synced_at = last_synced_at()
+    return None if synced_at is None else (utcnow() - synced_at).total_seconds()
+
+
+def upsert_cars(license_plates):
+    license_plates = set(license_plates)
+    if license_plates:
+        tenant = tenants.current().key
+        db.session.execute(sqlite_insert(Car).on_conflict_do_nothing(index_elements=['tenant', 'license_plate']),
+                           [{"tenant": tenant, "license_plate": plate} for plate in license_plates])
+
+
+def next_version():
+    """Allocates the version for one batch of the current tenant's mirror writes; the counter is shared by every worker."""
+    return db.session.execute(sqlite_insert(SyncState).values(tenant=tenants.current().key, version=1).on_conflict_do_update(
+        index_elements=['tenant'], set_={"version": SyncState.version + 1}).returning(SyncState.version)).scalar_one()
+
+
+def current_version():
+    state = sync_state()
+    return state.version if state is not None else 0
+
+
+def upsert_permits(rows):
+    # Upserts instead of ORM adds, so workers reconciling at the same time do not collide.
+    if rows:
+        statement = sqlite_insert(Permit)
+        db.session.execute(statement.on_conflict_do_update(index_elements=['permit_id'], set_={
+            column: statement.excluded[column]
+            for column in ('license_plate', 'expiration', 'expires_at', 'deleted', 'local_write_at', 'version', 'changed_at')
+        }), rows)
+
+
+def tombstone(condition, version, now):
+    return db.session.execute(update(Permit).where(condition).values(
+        deleted=True, local_write_at=None, version=version, changed_at=now)).rowcount
+
+
+def purge_tombstones(now):
+    """Drops the tenant's confirmed tombstones older than TOMBSTONE_RETENTION_SECONDS and records the last purged version."""
+    condition = and_(Permit.tenant == tenants.current().key, Permit.deleted.is_(True), Permit.local_write_at.is_(None),
+                     Permit.changed_at < now - datetime.timedelta(seconds=TOMBSTONE_RETENTION_SECONDS))
+    purged = db.session.query(func.max(Permit.version)).filter(condition).scalar()
+    if purged is not None:
+        db.session.execute(delete(Permit).where(condition))
+        db.session.execute(update(SyncState).where(SyncState.tenant == tenants.current().key).values(
+            purged_version=func.max(SyncState.purged_version, purged)))
+
+
+def reconcile(permits):
+    """Diff-based upsert of the current tenant's upstream permit list into the local mirror.
+
+    Removed permits stay behind as tombstones so delta clients learn about
+    them. Returns the number of rows added, changed and removed.
+    """
+    now = utcnow()
+    tenant = tenants.current().key
+    existing = {row.permit_id: row for row in db.session.query(
+        Permit.permit_id, Permit.license_plate, Permit.expiration, Permit.deleted, Permit.local_write_at).filter(
+        Permit.tenant == tenant)}
+    counts = {"added": 0, "changed": 0, "removed": 0}
+    upserts = []
+    confirmed = []
+
+    for permit in permits:
+        expires_at = to_utc(permit["expiration"])
+        if expires_at <= now:
+            # Gone as far as the mirror is concerned, even while upstream still lists it.
+            continue
+        row = existing.pop(permit["id"], None)
+        values = {"permit_id": permit["id"], "tenant": tenant, "license_plate": permit["license_plate"], "expiration": permit["expiration"],
+                  "expires_at": expires_at, "deleted": False, "local_write_at": None, "changed_at": now}
+        if row is None:
+            upserts.append(values)
+            counts["added"] += 1
+        elif row.deleted and in_grace(row, now):
+            # Expired locally; upstream has not caught up yet.
+            continue
+        elif row.deleted or row.license_plate != permit["license_plate"] or row.expiration != permit["expiration"]:
+            upserts.append(values)
+            counts["changed"] += 1
+        elif row.local_write_at is not None:
+            confirmed.append(permit["id"])
+
+    removed = []
+    for row in existing.values():
+        if row.deleted:
+            if row.local_write_at is not None:
+                # Upstream no longer lists a permit deleted here: confirmed.
+                confirmed.append(row.permit_id)
+            continue
+        if in_grace(row, now):
+            # Created locally; upstream has not caught up yet.
+            continue
+        removed.append(row.permit_id)
+        counts["removed"] += 1
+
+    if upserts or removed:
+        version = next_version()
+        for values in upserts:
+            values["version"] = version
+        upsert_permits(upserts)
+        if removed:
+            tombstone(Permit.permit_id.in_(removed), version, now)
+    if confirmed:
+        db.session.execute(update(Permit).where(Permit.permit_id.in_(confirmed)).values(local_write_at=None))
+    upsert_cars(permit["license_plate"] for permit in permits)
+    upsert_sync_state(last_synced_at=now)
+    purge_tombstones(now)
+    db.session.commit()
+
+    if any(counts.values()):
+        current_app.logger.info('Permit mirror reconciled: %s', counts)
+        bump_permit_generation(parkingboss_api_helper.tenant_key())
+    return counts
+
+
+def expire_due():
+    """Tombstones permits that have run out since the last sync, so delta clients hear of it within a tick."""
+    condition = and_(Permit.tenant == tenants.current().key, Permit.deleted.is_(False), Permit.expires_at <= utcnow())
+    if db.session.query(Permit.id).filter(condition).first() is None:
+        return 0
+    expired = tombstone(condition, next_version(), utcnow())
+    db.session.commit()
+    bump_permit_generation(parkingboss_api_helper.tenant_key())
+    return expired
+
+
+def changes_since(version):
+    """Permits added or changed after ``version``, and the IDs of those deleted or expired since.
+
+    Returns (current version, changed, deleted, expired), or None when the
+    client has to start over: its version predates purged tombstones or is
+    unknown.
+    """
+    state = sync_state()
+    current = state.version if state is not None else 0
+    if version > current or (state is not None and version < state.purged_version):
+        return None
+    now = utcnow()
+    changed = []
+    deleted = []
+    expired = []
+    for row in tenant_permits().filter(Permit.version > version).order_by(Permit.version, Permit.permit_id).yield_per(100):
+        if row.expires_at <= now:
+            expired.append(row.permit_id)
+        elif row.deleted:
+            deleted.append(row.permit_id)
+        else:
+            changed.append(row.to_dict())
+    return current, changed, deleted, expired
+
+
+def apply_created(permit_id, license_plate, duration):
+    tenant = tenants.current()
+    now = utcnow()
+    expires_at = now + datetime.timedelta(hours=hours_in(duration))
+    local_expiry = expires_at.replace(tzinfo=datetime.timezone.utc).astimezone(tz.gettz(tenant.timezone))
+    upsert_permits([{"permit_id": permit_id, "tenant": tenant.key, "license_plate": license_plate,
+                     "expiration": local_expiry.isoformat(timespec='seconds'), "expires_at": expires_at,
+                     "deleted": False, "local_write_at": now, "version": next_version(), "changed_at": now}])
+    upsert_cars([license_plate])
+    db.session.commit()
+    bump_permit_generation(parkingboss_api_helper.tenant_key())
+    mark_local_write(tenant)
+
+
+def apply_deleted(permit_id):
+    tenant = tenants.current()
+    now = utcnow()
+    result = db.session.execute(update(Permit).where(
+        Permit.permit_id == permit_id, Permit.tenant == tenant.key, Permit.deleted.is_(False)).values(
+        deleted=True, local_write_at=now, version=next_version(), changed_at=now))
+    # A permit deleted by hand is not renewed either.
+    db.session.execute(delete(Renewal).where(Renewal.permit_id == permit_id))
+    db.session.commit()
+    if result.rowcount:
+        bump_permit_generation(parkingboss_api_helper.tenant_key())
+    mark_local_write(tenant)
+
+
+def mark_local_write(tenant):
+    with _local_writes_lock:
+        local_writes.add(tenant.key)
+    syncer.wake()
+
+
+def sync_from_upstream():
+    return reconcile(parkingboss_api_helper.get_permits())
+
+
+def sync_if_due():
+    """Syncs the current tenant shortly before its mirror goes stale, or right after a local write.
+
+    The age lives in the database, so a sync by any worker resets it for all.
+    """
+    expire_due()
+    age = data_age()
+    key = tenants.current().key
+    with _local_writes_lock:
+        written = key in local_writes
+        local_writes.discard(key)
+    if written or age is None or age >= SYNC_INTERVAL_SECONDS - refresher.REFRESH_TICK_SECONDS:
+        return sync_from_upstream()
+
+
+def sync_active_tenants():
+    """Runs sync_if_due for each tenant that served a request within TENANT_IDLE_SECONDS."""
+    for tenant in tenants.registry.active():
+        with tenants.scope(tenant):
+            try:
+                sync_if_due()
+            except Exception:
+                current_app.logger.exception('Permit sync for tenant %s failed', tenant.key)
+                db.session.rollback()
+
+
+# Tenants with local writes not yet followed by a sync
+local_writes = set()
+_local_writes_lock = threading.Lock()
+syncer = BackgroundWorker('permit-sync', refresher.REFRESH_TICK_SECONDS, sync_active_tenants)
@@ -0,0 +1,176 @@
+"""In-memory plate index over a tenant's current permits and known vehicles.
+
+ParkingBoss returns plates as they were typed ("abc 123", "ABC-123"), so
+plates are matched on their normalized form: upper case, letters and
+digits only. Every substring of every normalized plate maps to the plates
+containing it, which makes exact, prefix and partial lookups a dict access
+plus a sort of the few matches. Plates are at most a dozen characters, so
+that is under a hundred keys per plate.
+
+The index follows the mirror incrementally: each search first applies the
+permit changes since the version it last saw (permit_sync.changes_since)
+and the tenant's vehicles added since the last Car ID it saw, and only rebuilds when
+the mirror can no longer give it a delta.
+"""
+import collections
+import heapq
+import re
+import threading
+
+from sqlalchemy import func, select
+
+from server.helpers import permit_sync, tenants
+from server.models.database import db, Car, SyncState
+
+MODES = ('exact', 'prefix', 'partial')
+
+_NOT_PLATE = re.compile(r'[^0-9A-Z]')
+
+
+def normalize_plate(plate):
+    return _NOT_PLATE.sub('', plate.upper())
+
+
+class PlateIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clear()
+
+    def _clear(self):
+        # Permit data version and highest Car ID reflected in the index
+        self.version = None
+        self.last_car_id = 0
+        # permit ID -> normalized plate
+        self._permits = {}
+        # normalized plate -> {permit ID: (permit dict, expires_at)}
+        self._by_plate = collections.defaultdict(dict)
+        self._vehicles = set()
+        # substring -> normalized plates containing it
+        self._substrings = collections.defaultdict(set)
+
+    def _index_plate(self, plate):
+        for start in range(len(plate)):
+            for end in range(start + 1, len(plate) + 1):
+                self._substrings[plate[start:end]].add(plate)
+
+    def _unindex_plate(self, plate):
+        for start in range(len(plate)):
+            for end in range(start + 1, len(plate) + 1):
+                key = plate[start:end]
+                self._substrings[key].discard(plate)
+                if not self._substrings[key]:
+                    del self._substrings[key]
+
+    def _known(self, plate):
+        return plate in self._vehicles or plate in self._by_plate
+
+    def _add_permit(self, permit):
+        self._remove_permit(permit['id'])
+        plate = normalize_plate(permit['license_plate'])
+        if not plate:
+            return
+        if not self._known(plate):
+            self._index_plate(plate)
+        expires_at = permit_sync.to_utc(permit['expiration'])
+        self._permits[permit['id']] = plate
+        self._by_plate[plate][permit['id']] = (permit, expires_at)
+
+    def _remove_permit(self, permit_id):
+        plate = self._permits.pop(permit_id, None)
+        if plate is None:
+            return
+        permits = self._by_plate[plate]
+        permits.pop(permit_id, None)
+        if not permits:
+            del self._by_plate[plate]
+            if not self._known(plate):
+                self._unindex_plate(plate)
+
+    def _add_vehicles(self):
+        for car_id, license_plate in db.session.query(Car.id, Car.license_plate).filter(
+                Car.tenant == tenants.current().key, Car.id > self.last_car_id).order_by(Car.id):
+            plate = normalize_plate(license_plate)
+            if plate and not self._known(plate):
+                self._index_plate(plate)
+            self._vehicles.add(plate)
+            self.last_car_id = car_id
+
+    def _rebuild(self):
+        self._clear()
+        self.version = permit_sync.current_version()
+        for permit in permit_sync.iter_permits():
+            self._add_permit(permit)
+        self._add_vehicles()
+
+    def refresh(self):
+        """Brings the index up to date with the current tenant's mirror; needs an app context.
+
+        When nothing changed this costs one single-row query, which keeps a
+        search well under a millisecond.
+        """
+        tenant = tenants.current().key
+        version, last_car_id = db.session.execute(select(
+            select(SyncState.version).where(SyncState.tenant == tenant).scalar_subquery(),
+            select(func.max(Car.id)).where(Car.tenant == tenant).scalar_subquery())).one()
+        with self._lock:
+            if self.version is not None and self.version == (version or 0) and self.last_car_id == (last_car_id or 0):
+                return
+            self._refresh()
+
+    def _refresh(self):
+        if self.version is None:
+            return self._rebuild()
+        changes = permit_sync.changes_since(self.version)
+        if changes is None:
+            return self._rebuild()
+        self.version, changed, deleted, expired = changes
+        for permit in changed:
+            self._add_permit(permit)
+        for permit_id in deleted + expired:
+            self._remove_permit(permit_id)
+        self._add_vehicles()
+
+    def search(self, query, mode='partial', limit=20, now=None):
+        """Plates matching ``query``: the exact plate first, then prefix matches, then the rest, each alphabetical.
+
+        Each match lists the plate's permits still valid at ``now`` (naive
+        UTC), whether it is a known vehicle, and so whether it is covered.
+        """
+        plate = normalize_plate(query)
+        if not plate:
+            return []
+        now = now or permit_sync.utcnow()
+        with self._lock:
+            if mode == 'exact':
+                candidates = [plate] if self._known(plate) else []
+            else:
+                candidates = self._substrings.get(plate, ())
+                if mode == 'prefix':
+                    candidates = [candidate for candidate in candidates if candidate.startswith(plate)]
+            ranked = heapq.nsmallest(limit, candidates, key=lambda candidate: (
+                candidate != plate, not candidate.startswith(plate), candidate))
+            matches = []
+            for candidate in ranked:
+                permits = [permit for permit, expires_at in sorted(self._by_plate.get(candidate, {}).values(),
+                                                                   key=lambda entry: entry[1]) if expires_at > now]
+                matches.append({'plate': candidate, 'known_vehicle': candidate in self._vehicles,
+                                'valid': bool(permits), 'permits': permits})
+            return matches
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def index_for(tenant):
+    with _indexes_lock:
+        if tenant.key not in _indexes:
+            _indexes[tenant.key] = PlateIndex()
+        return _indexes[tenant.key]
+
+
+def search(query, mode='partial', limit=20):
+    """Searches the current tenant's index after catching it up with the mirror."""
+    index = index_for(tenants.current())
+    index.refresh()
+    return index.search(query, mode, limit)
@@ -0,0 +1,86 @@
+import os
+import threading
+import time
+
+from flask import current_app
+
+from server.background import BackgroundWorker
+
+REFRESH_TICK_SECONDS = float(os.environ.get('REFRESH_TICK_SECONDS', 5))
+
+# Every StaleWhileRevalidate, checked by the refresher worker on each tick.
+refreshers = []
+
+
+class StaleWhileRevalidate:
+    """In-process value that is re-fetched in the background shortly before it expires.
+
+    ``get()`` returns the last good value without touching upstream while it
+    is younger than ``max_stale``; past ``ttl`` it also asks the background
+    worker to refresh it. Only a missing or too-stale value is fetched in the
+    foreground, and a failed refresh keeps serving the last good value.
+    While ``active()`` returns False the worker leaves it alone.
+    """
+    def __init__(self, name, fetch, ttl, max_stale, lead=REFRESH_TICK_SECONDS * 2, active=None):
+        self.name = name
+        self.fetch = fetch
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.lead = lead
+        self.active = active
+        self._lock = threading.Lock()
+        self._value = None
+        self._fetched_at = None
+        refreshers.append(self)
+
+    def age(self):
+        fetched_at = self._fetched_at
+        return None if fetched_at is None else time.monotonic() - fetched_at
+
+    def due(self):
+        if self.active is not None and not self.active():
+            return False
+        age = self.age()
+        return age is None or age >= self.ttl - self.lead
+
+    def get(self):
+        age = self.age()
+        if age is None or age > self.max_stale:
+            return self.refresh(stale_ok=age is not None)
+        if age >= self.ttl:
+            refresher.wake()
+        return self._value
+
+    def refresh(self, stale_ok=True):
+        fetched_at = self._fetched_at
+        with self._lock:
+            if self._fetched_at != fetched_at:
+                # Refreshed by another caller while we waited.
+                return self._value
+            try:
+                value = self.fetch()
+            except Exception:
+                if not stale_ok or self._fetched_at is None:
+                    raise
+                current_app.logger.exception('Refreshing %s failed, serving stale value', self.name)
+                return self._value
+            self._value = value
+            self._fetched_at = time.monotonic()
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._value = None
+            self._fetched_at = None
+
+
+def refresh_due():
+    for entry in refreshers:
+        if entry.due():
+            try:
+                entry.refresh()
+            except Exception:
+                current_app.logger.exception('Background refresh of %s failed', entry.name)
+
+
+refresher = BackgroundWorker('refresher', REFRESH_TICK_SECONDS, refresh_due)
@@ -0,0 +1,179 @@
+"""Auto-renewal of permits that would otherwise run out, e.g. a guest's one-hour permit.
+
+Enrolled permits live in the Renewal table, so any worker can enroll one.
+The scheduler runs in exactly one process: each tick, the worker holding
+the lock on RENEWAL_LOCK_FILE loads the pending expirations into a heap
+and reissues, through create_permit, every permit expiring within
+RENEWAL_LEAD_SECONDS. Permits expiring within RENEWAL_BATCH_WINDOW_SECONDS
+of the first one due are renewed in the same pass, so a block of guests
+registered together shares one policy lookup and one mirror sync instead
+of waking the scheduler once each. When the lock holder exits, the OS drops its lock and the
+next worker to tick takes over.
+"""
+import datetime
+import fcntl
+import heapq
+import os
+import tempfile
+import threading
+
+from flask import current_app
+from sqlalchemy import delete
+
+from server.background import BackgroundWorker
+from server.helpers import parkingboss_api_helper, permit_sync, tenants
+from server.helpers.error_handler import ExternalAPIError, QuotaExceededError, ResponseParsingError
+from server.models.database import db, Permit, Renewal
+
+RENEWAL_TICK_SECONDS = float(os.environ.get('RENEWAL_TICK_SECONDS', 15))
+# Reissue this long before the permit runs out, leaving time for a retry or two.
+RENEWAL_LEAD_SECONDS = float(os.environ.get('RENEWAL_LEAD_SECONDS', 5 * 60))
+RENEWAL_BATCH_WINDOW_SECONDS = float(os.environ.get('RENEWAL_BATCH_WINDOW_SECONDS', 60))
+# How long a permit is kept alive when enrolled without a limit, and the longest allowed.
+RENEWAL_DEFAULT_HOURS = float(os.environ.get('RENEWAL_DEFAULT_HOURS', 24))
+RENEWAL_MAX_HOURS = float(os.environ.get('RENEWAL_MAX_HOURS', 7 * 24))
+# Shared by every worker on the host; only the process holding it renews.
+RENEWAL_LOCK_FILE = os.environ.get('RENEWAL_LOCK_FILE', os.path.join(tempfile.gettempdir(), 'parkingmanager-renewals.lock'))
+
+
+class LeaderLock:
+    """Non-blocking flock on a file, held by at most one process on the host until it exits."""
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+        self._pid = None
+
+    def acquire(self):
+        """True if this process holds the lock, taking it when it is free."""
+        with self._lock:
+            if self._pid == os.getpid():
+                return True
+            # A descriptor inherited across fork is the parent's; start over with our own.
+            if self._file is not None:
+                self._file.close()
+            self._file = open(self.path, 'a')
+            try:
+                fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self._file.close()
+                self._file = None
+                return False
+            self._pid = os.getpid()
+            return True
+
+    def release(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                fcntl.flock(self._file, fcntl.LOCK_UN)
+                self._file.close()
+            self._file = None
+            self._pid = None
+
+
+def enroll(permit_id, duration='PT1H', hours=None):
+    """Keeps the current tenant's permit ``permit_id`` alive for ``hours``; None if the mirror does not know it."""
+    permit = permit_sync.active_permits().filter(Permit.permit_id == permit_id).one_or_none()
+    if permit is None:
+        return None
+    renew_until = permit_sync.utcnow() + datetime.timedelta(hours=hours or RENEWAL_DEFAULT_HOURS)
+    renewal = Renewal.query.filter_by(permit_id=permit_id).one_or_none()
+    if renewal is None:
+        renewal = Renewal(tenant=tenants.current().key, permit_id=permit_id)
+        db.session.add(renewal)
+    renewal.license_plate = permit.license_plate
+    renewal.duration = duration
+    renewal.renew_until = renew_until
+    db.session.commit()
+    scheduler.wake()
+    return renewal
+
+
+def cancel(permit_id):
+    """Stops renewing the current tenant's permit ``permit_id``; True if it was enrolled."""
+    result = db.session.execute(delete(Renewal).where(
+        Renewal.permit_id == permit_id, Renewal.tenant == tenants.current().key))
+    db.session.commit()
+    return bool(result.rowcount)
+
+
+def load_schedule(now):
+    """Heap of (expires_at, renewal ID) for every renewal still needed, dropping those that are not.
+
+    A renewal is done once its permit covers renew_until, and void once its
+    permit was deleted before running out.
+    """
+    heap = []
+    finished = []
+    for renewal, permit in db.session.query(Renewal, Permit).outerjoin(Permit, Permit.permit_id == Renewal.permit_id):
+        if (permit is None or permit.expires_at >= renewal.renew_until or renewal.renew_until <= now
+                or (permit.deleted and permit.expires_at > now)):
+            finished.append(renewal.id)
+        else:
+            heap.append((permit.expires_at, renewal.id))
+    if finished:
+        db.session.execute(delete(Renewal).where(Renewal.id.in_(finished)))
+        db.session.commit()
+    heapq.heapify(heap)
+    return heap
+
+
+def next_batch(heap, now):
+    """Pops the renewals due by now + RENEWAL_LEAD_SECONDS, along with those due within the batch window after them."""
+    if not heap or heap[0][0] > now + datetime.timedelta(seconds=RENEWAL_LEAD_SECONDS):
+        return []
+    closes = heap[0][0] + datetime.timedelta(seconds=RENEWAL_BATCH_WINDOW_SECONDS)
+    batch = []
+    while heap and heap[0][0] <= closes:
+        batch.append(heapq.heappop(heap)[1])
+    return batch
+
+
+def renew(renewal):
+    """Reissues one permit for the current tenant and moves the renewal onto the new one."""
+    permit_id = parkingboss_api_helper.create_permit(license_plate=renewal.license_plate, duration=renewal.duration)
+    old_permit_id = renewal.permit_id
+    renewal.permit_id = permit_id
+    # Commits the move along with the new permit's mirror row.
+    permit_sync.apply_created(permit_id, renewal.license_plate, renewal.duration)
+    current_app.logger.info('Renewed permit %s for %s as %s', old_permit_id, renewal.license_plate, permit_id)
+
+
+def renew_batch(renewal_ids):
+    renewals = Renewal.query.filter(Renewal.id.in_(renewal_ids)).order_by(Renewal.tenant).all()
+    for renewal in renewals:
+        tenant = tenants.registry.get(renewal.tenant)
+        if tenant is None:
+            current_app.logger.warning('Dropping renewal of %s: tenant %s is no longer configured',
+                                       renewal.permit_id, renewal.tenant)
+            db.session.delete(renewal)
+            db.session.commit()
+            continue
+        with tenants.scope(tenant):
+            try:
+                renew(renewal)
+            except QuotaExceededError as e:
+                current_app.logger.warning('Stopped renewing %s: %s', renewal.permit_id, e.message)
+                db.session.delete(renewal)
+                db.session.commit()
+            except (ExternalAPIError, ResponseParsingError) as e:
+                # Retried on the next tick; the lead leaves room for a few tries.
+                current_app.logger.warning('Renewing %s failed: %s', renewal.permit_id, e.message)
+                db.session.rollback()
+
+
+def run_due():
+    """Renews every batch that is due, in the one process holding the leader lock."""
+    if not leader.acquire():
+        return
+    now = permit_sync.utcnow()
+    heap = load_schedule(now)
+    while True:
+        batch = next_batch(heap, now)
+        if not batch:
+            return
+        renew_batch(batch)
+
+
+leader = LeaderLock(RENEWAL_LOCK_FILE)
+scheduler = BackgroundWorker('renewals', RENEWAL_TICK_SECONDS, run_due)
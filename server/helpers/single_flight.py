@@ -0,0 +1,90 @@
+import asyncio
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = []  # (loop, future) pairs for asyncio callers
+
+    def finish(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.done.set()
+        for loop, future in self.waiters:
+            loop.call_soon_threadsafe(self._resolve, future)
+
+    def _resolve(self, future):
+        if future.done():
+            return
+        if self.error is not None:
+            future.set_exception(self.error)
+        else:
+            future.set_result(self.result)
+
+    def outcome(self):
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SingleFlight:
+    """Coalesces concurrent identical calls into one.
+
+    While a call for ``key`` is in flight, further callers with the same key
+    wait for it and get its result or exception instead of starting their
+    own. Threads and asyncio tasks (on any event loop) share the same
+    in-flight calls, so the blocking and async helpers coalesce together.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def _join(self, key):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                return call, False
+            call = self._calls[key] = _Call()
+            return call, True
+
+    def _finish(self, key, call, result=None, error=None):
+        # Under the lock, so an asyncio waiter registering concurrently is never missed.
+        with self._lock:
+            del self._calls[key]
+            call.finish(result, error)
+
+    def do(self, key, fn):
+        call, leader = self._join(key)
+        if not leader:
+            call.done.wait()
+            return call.outcome()
+        try:
+            result = fn()
+        except BaseException as e:
+            # Includes cancellation, so waiters are never left hanging.
+            self._finish(key, call, error=e)
+            raise
+        self._finish(key, call, result=result)
+        return result
+
+    async def do_async(self, key, coro_fn):
+        call, leader = self._join(key)
+        if not leader:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            with self._lock:
+                if call.done.is_set():
+                    return call.outcome()
+                call.waiters.append((loop, future))
+            return await future
+        try:
+            result = await coro_fn()
+        except BaseException as e:
+            # Includes cancellation, so waiters are never left hanging.
+            self._finish(key, call, error=e)
+            raise
+        self._finish(key, call, result=result)
+        return result
@@ -0,0 +1,175 @@
+"""Registry of the ParkingBoss tenants this deployment serves.
+
+Tenants come from the JSON file named by TENANTS_FILE, keyed by the name
+used in tenant-scoped URLs (/t/<key>/...)::
+
+    {"unit-12": {"location_id": "...", "tenant": "12", "password": "...",
+                 "cancel_email": "...", "monthly_usage_quota": 100, "timezone": "America/Los_Angeles"}}
+
+The tenant configured through the environment (LOCATION_ID, TENANT, ...)
+is always available as ``default`` and serves the unprefixed routes.
+
+A tenant's token, usage ledger and usage refresher are created on first
+use, and background jobs only visit tenants used within
+TENANT_IDLE_SECONDS, so configured but idle tenants cost a dict entry. All
+tenants share one upstream connection pool: they talk to the same host.
+"""
+import contextlib
+import json
+import os
+import threading
+import time
+
+from flask import g, has_app_context, url_for as flask_url_for
+
+from server import log
+from server.helpers import parkingboss_api_helper as pb
+from server.helpers.refresher import StaleWhileRevalidate
+from server.helpers.token_manager import TokenManager
+from server.helpers.usage_ledger import UsageLedger
+
+TENANTS_FILE = os.environ.get('TENANTS_FILE')
+# Tenants without a request for this long are skipped by background sync and refresh
+TENANT_IDLE_SECONDS = float(os.environ.get('TENANT_IDLE_SECONDS', 15 * 60))
+
+DEFAULT_KEY = 'default'
+
+
+class Tenant:
+    """One ParkingBoss tenant: its credentials and the upstream state kept for it."""
+    def __init__(self, key, location_id, tenant, password, cancel_email=None, monthly_usage_quota=None, timezone=None):
+        self.key = key
+        self.location_id = location_id
+        self.tenant = tenant
+        self.password = password
+        self.cancel_email = cancel_email
+        self.monthly_usage_quota = monthly_usage_quota
+        self.timezone = timezone
+        # Looked up through the module so tests can patch get_tenant_id_and_bearer_token.
+        self.token_manager = TokenManager(lambda: pb.get_tenant_id_and_bearer_token(self))
+        self.usage_ledger = UsageLedger(monthly_usage_quota)
+        self.usage_refresher = StaleWhileRevalidate(f'usage:{key}', self.fetch_usage,
+                                                    ttl=pb.USAGE_TTL_SECONDS, max_stale=pb.USAGE_MAX_STALE_SECONDS,
+                                                    active=self.active)
+        self.last_used = None
+
+    @property
+    def cache_key(self):
+        """Identifies the tenant in shared cache keys."""
+        return f'{self.location_id}:{self.tenant}'
+
+    @property
+    def usage_url(self):
+        return f'{pb.API_URL}/locations/{self.location_id}'
+
+    @property
+    def permits_url(self):
+        return f'{pb.API_URL}/locations/{self.location_id}/tenants'
+
+    def fetch_usage(self):
+        with scope(self):
+            return pb.get_usage_and_policy_id()
+
+    def touch(self):
+        self.last_used = time.monotonic()
+
+    def active(self):
+        return self.last_used is not None and time.monotonic() - self.last_used < TENANT_IDLE_SECONDS
+
+
+class DefaultTenant(Tenant):
+    """The tenant configured through the environment.
+
+    Its settings are read from parkingboss_api_helper on every use and its
+    state is the helper's own token manager, ledger and refresher, so
+    single-tenant deployments are configured exactly as before.
+    """
+    def __init__(self):
+        self.key = DEFAULT_KEY
+        self.last_used = None
+
+    token_manager = property(lambda self: pb.token_manager)
+    usage_ledger = property(lambda self: pb.usage_ledger)
+    usage_refresher = property(lambda self: pb.usage_refresher)
+    location_id = property(lambda self: pb.LOCATION_ID)
+    tenant = property(lambda self: pb.TENANT)
+    password = property(lambda self: pb.TENANT_PW)
+    cancel_email = property(lambda self: pb.CANCEL_EMAIL)
+    monthly_usage_quota = property(lambda self: pb.MONTHLY_USAGE_QUOTA)
+    timezone = property(lambda self: pb.TIMEZONE)
+
+
+class TenantRegistry:
+    def __init__(self, configs):
+        self._configs = dict(configs)
+        for config in self._configs.values():
+            log.add_secret(config.get('password'))
+        self._tenants = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """The tenant for ``key``, built on first use; None if it is not configured."""
+        tenant = self._tenants.get(key)
+        if tenant is None:
+            with self._lock:
+                tenant = self._tenants.get(key)
+                if tenant is None:
+                    if key == DEFAULT_KEY:
+                        tenant = DefaultTenant()
+                    elif key in self._configs:
+                        tenant = Tenant(key, **self._configs[key])
+                    else:
+                        return None
+                    self._tenants[key] = tenant
+        return tenant
+
+    def default(self):
+        return self.get(DEFAULT_KEY)
+
+    def keys(self):
+        return [DEFAULT_KEY] + sorted(key for key in self._configs if key != DEFAULT_KEY)
+
+    def active(self):
+        """Tenants that served a request within TENANT_IDLE_SECONDS."""
+        with self._lock:
+            tenants = list(self._tenants.values())
+        return [tenant for tenant in tenants if tenant.active()]
+
+
+def load(path=TENANTS_FILE):
+    if not path:
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+registry = TenantRegistry(load())
+
+
+def current():
+    """The tenant of the request being served (or the job running), else the default tenant."""
+    if has_app_context() and 'tenant' in g:
+        return g.tenant
+    return registry.default()
+
+
+@contextlib.contextmanager
+def scope(tenant):
+    """Makes ``tenant`` current for the block; needs an app context."""
+    previous = g.pop('tenant', None)
+    g.tenant = tenant
+    try:
+        yield tenant
+    finally:
+        if previous is None:
+            g.pop('tenant', None)
+        else:
+            g.tenant = previous
+
+
+def url_for(endpoint, **values):
+    """url_for that stays within the current tenant: /t/<tenant>/... for all but the default one."""
+    tenant = current()
+    if tenant.key == DEFAULT_KEY:
+        return flask_url_for(endpoint, **values)
+    return flask_url_for('tenant_' + endpoint, tenant=tenant.key, **values)
@@ -0,0 +1,63 @@
+import os
+import threading
+import time
+
+# How long a bearer token is trusted before it is refreshed, and how long
+# before that expiry a refresh is started while the old token stays in use.
+TOKEN_TTL_SECONDS = float(os.environ.get('TOKEN_TTL_SECONDS', 1800))
+TOKEN_REFRESH_MARGIN_SECONDS = float(os.environ.get('TOKEN_REFRESH_MARGIN_SECONDS', 60))
+
+
+class TokenManager:
+    """Keeps the {tenant_id, bearer} pair in memory and refreshes it on demand.
+
+    Only one refresh runs at a time per process. While a refresh is in
+    progress, callers keep using the current token as long as it has not
+    actually expired; only callers without any usable token wait for it.
+    """
+    def __init__(self, fetch, ttl=TOKEN_TTL_SECONDS, refresh_margin=TOKEN_REFRESH_MARGIN_SECONDS):
+        self._fetch = fetch
+        self._ttl = ttl
+        self._refresh_margin = refresh_margin
+        self._lock = threading.Lock()
+        self._auth_data = None
+        self._expires_at = 0.0
+
+    def cached(self):
+        """Returns the current token if it needs no refresh, otherwise None. Never blocks."""
+        auth_data, expires_at = self._auth_data, self._expires_at
+        if auth_data is not None and time.monotonic() < expires_at - self._refresh_margin:
+            return auth_data
+        return None
+
+    def get(self):
+        auth_data, expires_at = self._auth_data, self._expires_at
+        now = time.monotonic()
+        if auth_data is not None and now < expires_at - self._refresh_margin:
+            return auth_data
+
+        usable = auth_data is not None and now < expires_at
+        if not self._lock.acquire(blocking=not usable):
+            # Someone else is refreshing and our token is still valid.
+            return auth_data
+        try:
+            # Another caller may have refreshed while we waited for the lock.
+            if self._auth_data is not None and time.monotonic() < self._expires_at - self._refresh_margin:
+                return self._auth_data
+            auth_data = self._fetch()
+            self._auth_data = auth_data
+            self._expires_at = time.monotonic() + self._ttl
+            return auth_data
+        finally:
+            self._lock.release()
+
+    def invalidate(self, bearer=None):
+        """Drops the cached token, e.g. after upstream answered 401.
+
+        If ``bearer`` is given, the cache is only cleared when it still holds
+        that token, so a token refreshed by a concurrent caller survives.
+        """
+        with self._lock:
+            if bearer is None or (self._auth_data is not None and self._auth_data["bearer"] == bearer):
+                self._auth_data = None
+                self._expires_at = 0.0
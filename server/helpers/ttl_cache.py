@@ -0,0 +1,33 @@
+import threading
+import time
+
+
+class TTLCache:
+    """Small thread-safe in-process cache whose entries expire after ``ttl`` seconds."""
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._items = {}
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if time.monotonic() >= expires_at:
+                del self._items[key]
+                return None
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._items[key] = (value, time.monotonic() + self.ttl)
+
+    def delete(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
@@ -0,0 +1,108 @@
+import contextlib
+import threading
+import time
+from decimal import Decimal, InvalidOperation
+
+from server.helpers.error_handler import QuotaExceededError
+
+
+def hours_in(duration):
+    # Durations are sent as PT<n>H; ParkingBoss falls back to one hour.
+    if duration and duration.startswith('PT') and duration.endswith('H') and duration[2:-1].isnumeric():
+        return int(duration[2:-1])
+    return 1
+
+
+def to_hours(value):
+    return Decimal(str(value)).quantize(Decimal('0.01'))
+
+
+class _Entry:
+    def __init__(self, hours):
+        self.hours = hours
+        self.confirmed_at = None
+
+
+class UsageLedger:
+    """Hours used against the monthly quota, answered from memory.
+
+    The figure is the hours upstream last reported plus the permits issued
+    by this worker since. Each reconcile with the usage endpoint replaces the
+    upstream figure and drops the permits it already counts. Permits issued
+    by other workers show up at their next reconcile.
+    """
+    def __init__(self, quota):
+        self.quota = None if quota is None else to_hours(quota)
+        self._lock = threading.Lock()
+        self._upstream_used = None
+        self._entries = []
+
+    def used(self):
+        with self._lock:
+            return self._used()
+
+    def _used(self):
+        if self._upstream_used is None:
+            return None
+        return self._upstream_used + sum((entry.hours for entry in self._entries), Decimal(0))
+
+    def remaining(self):
+        used = self.used()
+        if used is None or self.quota is None:
+            return None
+        return self.quota - used
+
+    def reserve(self, hours):
+        """Counts ``hours`` against the quota, or raises QuotaExceededError if they do not fit.
+
+        Nothing is rejected before the first reconcile; upstream enforces the
+        quota itself in that case.
+        """
+        hours = to_hours(hours)
+        with self._lock:
+            used = self._used()
+            if self.quota is not None and used is not None and used + hours > self.quota:
+                raise QuotaExceededError(f'Only {self.quota - used} of {self.quota} monthly hours left')
+            entry = _Entry(hours)
+            self._entries.append(entry)
+            return entry
+
+    def release(self, entry):
+        with self._lock:
+            if entry in self._entries:
+                self._entries.remove(entry)
+
+    def confirm(self, entry):
+        entry.confirmed_at = time.monotonic()
+
+    @contextlib.contextmanager
+    def reserving(self, hours):
+        """Reserves ``hours`` for the block: confirmed if it succeeds, released if it raises."""
+        entry = self.reserve(hours)
+        try:
+            yield entry
+        except BaseException:
+            self.release(entry)
+            raise
+        self.confirm(entry)
+
+    def reconcile(self, used, fetch_started):
+        """Takes the hours upstream reported from a fetch started at ``fetch_started`` (monotonic).
+
+        Permits confirmed before the fetch started are counted upstream by
+        now; later and still pending ones are kept on top.
+        """
+        try:
+            used = to_hours(used)
+        except InvalidOperation:
+            return False
+        with self._lock:
+            self._upstream_used = used
+            self._entries = [entry for entry in self._entries
+                             if entry.confirmed_at is None or entry.confirmed_at >= fetch_started]
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._upstream_used = None
+            self._entries = []
@@ -0,0 +1,33 @@
+import importlib
+import threading
+
+
+class LazyModule:
+    """Stands in for a module that is imported on first attribute access.
+
+    Keeps heavy dependencies (requests, httpx, dateutil) out of worker boot
+    when only some code paths need them. ``importlib.import_module`` holds
+    the import lock, so concurrent first uses import the module once.
+    """
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f'<lazy module {self._name!r} ({state})>'
+
+
+def lazy_import(name):
+    return LazyModule(name)
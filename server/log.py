@@ -0,0 +1,117 @@
+"""Logging for the app: records are queued on the request thread and written by a listener thread.
+
+Records are formatted and redacted once, when they are queued, so the
+listener only writes finished lines and no secret ever reaches a handler.
+Verbose upstream payload logs go through ``payload()``, which samples them.
+"""
+import atexit
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import urllib.parse
+from logging.handlers import QueueHandler, QueueListener
+
+from flask.logging import default_handler
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = '%(asctime)s - %(process)d - %(levelname)s - %(name)s - %(message)s'
+# Fraction of upstream calls whose URL, params and form data are logged (at DEBUG)
+LOG_PAYLOAD_SAMPLE_RATE = float(os.environ.get('LOG_PAYLOAD_SAMPLE_RATE', 0.01))
+
+REDACTED = '***'
+SECRET_PATTERNS = (
+    # Bearer tokens, also URL-encoded in a query string ("bearer+..." or "bearer%20...")
+    re.compile(r'(?i)(bearer(?:\s|\+|%20)+)[^\s\'",}&]+'),
+    # Whole query-string values of secret parameters, up to the next parameter
+    re.compile(r'(?i)([?&](?:authorization|password|token)=)[^&#\s]*'),
+    # Quoted password/token values in logged params and payloads, spaces and commas included
+    re.compile(r'(?i)([\'"]?(?:password|token)[\'"]?\s*[:=]\s*([\'"]))(?:(?!\2).)*(?=\2)'),
+    # Unquoted ones, up to the next separator
+    re.compile(r'(?i)((?:password|token)\s*[:=]\s*)[^\s\'",}&]+'),
+)
+# Known secret values (tenant passwords), masked wherever they appear
+_secrets = set()
+
+
+def add_secret(value):
+    """Masks ``value``, as is and URL-encoded, in every record logged from now on."""
+    if value:
+        _secrets.update((value, urllib.parse.quote_plus(value), urllib.parse.quote(value, safe='')))
+
+
+def redact(message):
+    secrets = set(_secrets)
+    if os.environ.get('TENANT_PW'):
+        secrets.add(os.environ['TENANT_PW'])
+    # Longest first, so a secret containing another is masked whole.
+    for secret in sorted(secrets, key=len, reverse=True):
+        message = message.replace(secret, REDACTED)
+    for pattern in SECRET_PATTERNS:
+        message = pattern.sub(r'\1' + REDACTED, message)
+    return message
+
+
+class RedactingQueueHandler(QueueHandler):
+    """Formats and redacts a record on the calling thread, then queues the finished line."""
+    def prepare(self, record):
+        record = super().prepare(record)
+        record.msg = record.message = redact(record.msg)
+        return record
+
+
+def payload(logger, message, *args):
+    """Logs an upstream request payload at DEBUG, for a sampled fraction of calls only."""
+    if LOG_PAYLOAD_SAMPLE_RATE <= 0 or not logger.isEnabledFor(logging.DEBUG):
+        return
+    if LOG_PAYLOAD_SAMPLE_RATE >= 1 or random.random() < LOG_PAYLOAD_SAMPLE_RATE:
+        logger.debug(message, *args)
+
+
+_queue = queue.SimpleQueue()
+handler = RedactingQueueHandler(_queue)
+handler.setFormatter(logging.Formatter(LOG_FORMAT))
+_listener = None
+
+
+def start_listener():
+    global _listener
+    if _listener is None:
+        _listener = QueueListener(_queue, logging.StreamHandler(sys.stderr))
+        _listener.start()
+
+
+def stop_listener():
+    # Writes out whatever is still queued.
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _after_fork():
+    # The listener thread does not survive a fork, and the queue may be mid-operation.
+    global _queue, _listener
+    was_running = _listener is not None
+    _queue = handler.queue = queue.SimpleQueue()
+    _listener = None
+    if was_running:
+        start_listener()
+
+
+def configure(app):
+    """Routes the app's (and every module logger's) records through the queue."""
+    root = logging.getLogger()
+    if handler not in root.handlers:
+        root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+    # app.logger propagates to the root; Flask's own handler would write every line twice.
+    app.logger.removeHandler(default_handler)
+    app.logger.setLevel(LOG_LEVEL)
+    start_listener()
+
+
+atexit.register(stop_listener)
+os.register_at_fork(after_in_child=_after_fork)
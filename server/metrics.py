@@ -0,0 +1,268 @@
+"""Prometheus-style metrics that aggregate across gunicorn workers.
+
+Recording touches only a per-thread shard: a dict lookup and a few
+integer adds. The first metric a thread records registers its shard under
+a lock, and the shard is folded into the worker's retired totals under the
+same lock when the thread exits, so threads do not pile up shards. Async
+views run each request on a new thread, so on their routes that is two
+short lock holds per request; on request threads it is once per thread.
+
+Each worker periodically writes its merged shards to METRICS_DIR/<pid>.json,
+and /metrics sums the files of every worker. The file of a worker that
+exited is folded into METRICS_DIR/retired.json rather than dropped, so the
+sums never go down (which Prometheus would read as a counter reset).
+"""
+import asyncio
+import fcntl
+import functools
+import json
+import os
+import tempfile
+import threading
+import time
+import weakref
+from bisect import bisect_left
+
+from server.background import BackgroundWorker
+
+METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'parkingmanager-metrics'))
+METRICS_FLUSH_SECONDS = float(os.environ.get('METRICS_FLUSH_SECONDS', 5))
+# Counts of exited workers, in METRICS_DIR
+RETIRED_FILE = 'retired.json'
+
+# Latency buckets in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    'parkingboss_upstream_seconds': ('histogram', 'Latency of ParkingBoss calls by operation'),
+    'parkingboss_upstream_errors_total': ('counter', 'Failed ParkingBoss calls by operation'),
+    'parkingboss_circuit_transitions_total': ('counter', 'Circuit breaker state changes by endpoint'),
+    'http_request_seconds': ('histogram', 'Latency of requests served by endpoint'),
+    'cache_requests_total': ('counter', 'server.cache lookups by result'),
+}
+
+_local = threading.local()
+# id(shard) -> shard, for every live thread that has recorded something
+_shards = {}
+# Counts of threads that have exited, in the same shape as a shard
+_retired = ({}, {})
+_shards_lock = threading.Lock()
+
+
+class _ThreadMark:
+    """Lives in a thread's local storage, which is cleared when the thread exits."""
+
+
+def _merge(into, counters, histograms):
+    into_counters, into_histograms = into
+    for key, value in dict(counters).items():
+        into_counters[key] = into_counters.get(key, 0) + value
+    for key, values in dict(histograms).items():
+        merged = into_histograms.setdefault(key, [0] * len(values))
+        for i, value in enumerate(list(values)):
+            merged[i] += value
+
+
+def _retire(shard):
+    with _shards_lock:
+        _merge(_retired, *shard)
+        del _shards[id(shard)]
+
+
+def _shard():
+    shard = getattr(_local, 'shard', None)
+    if shard is None:
+        # Once per thread, never per request.
+        shard = _local.shard = ({}, {})
+        _local.mark = _ThreadMark()
+        with _shards_lock:
+            _shards[id(shard)] = shard
+        weakref.finalize(_local.mark, _retire, shard)
+    return shard
+
+
+def inc(name, labels=(), amount=1):
+    counters = _shard()[0]
+    key = (name, labels)
+    counters[key] = counters.get(key, 0) + amount
+
+
+def observe(name, labels, seconds):
+    histograms = _shard()[1]
+    key = (name, labels)
+    histogram = histograms.get(key)
+    if histogram is None:
+        # One slot per bucket plus +Inf, then sum and count.
+        histogram = histograms[key] = [0] * (len(BUCKETS) + 1) + [0.0, 0]
+    histogram[bisect_left(BUCKETS, seconds)] += 1
+    histogram[-2] += seconds
+    histogram[-1] += 1
+
+
+def timed_upstream(operation):
+    """Records latency, and errors when the call raises, for a (sync or async) upstream helper."""
+    labels = (('operation', operation),)
+
+    def decorator(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                except Exception:
+                    inc('parkingboss_upstream_errors_total', labels)
+                    raise
+                finally:
+                    observe('parkingboss_upstream_seconds', labels, time.perf_counter() - start)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                inc('parkingboss_upstream_errors_total', labels)
+                raise
+            finally:
+                observe('parkingboss_upstream_seconds', labels, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def snapshot():
+    """Merges every thread's shard of this process, live or retired, into plain dicts."""
+    merged = ({}, {})
+    # Under the lock, so a shard retiring meanwhile is counted exactly once.
+    with _shards_lock:
+        _merge(merged, *_retired)
+        for shard in _shards.values():
+            _merge(merged, *shard)
+    return merged
+
+
+def encode_key(key):
+    name, labels = key
+    return json.dumps([name, list(labels)])
+
+
+def decode_key(encoded):
+    name, labels = json.loads(encoded)
+    return name, tuple(tuple(label) for label in labels)
+
+
+def write(path, data):
+    """Replaces ``path`` with ``data`` atomically."""
+    fd, tmp_path = tempfile.mkstemp(dir=METRICS_DIR, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def flush():
+    """Writes this worker's snapshot to METRICS_DIR atomically."""
+    counters, histograms = snapshot()
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    write(os.path.join(METRICS_DIR, f'{os.getpid()}.json'),
+          {'counters': {encode_key(k): v for k, v in counters.items()},
+           'histograms': {encode_key(k): v for k, v in histograms.items()}})
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def merge_file(into, data):
+    """Adds one file's counters and histograms (keys still encoded) to ``into``, in the same form."""
+    for encoded, value in data['counters'].items():
+        into['counters'][encoded] = into['counters'].get(encoded, 0) + value
+    for encoded, values in data['histograms'].items():
+        merged = into['histograms'].setdefault(encoded, [0] * len(values))
+        for i, value in enumerate(values):
+            merged[i] += value
+
+
+def collect():
+    """Sums the snapshots of all live workers and the retired totals of exited ones.
+
+    Runs under an exclusive lock on METRICS_DIR, so an exited worker's file
+    is folded into RETIRED_FILE exactly once and never counted twice.
+    """
+    if not os.path.isdir(METRICS_DIR):
+        return {}, {}
+    total = {'counters': {}, 'histograms': {}}
+    with open(os.path.join(METRICS_DIR, '.lock'), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        retired_path = os.path.join(METRICS_DIR, RETIRED_FILE)
+        retired = read(retired_path) or {'counters': {}, 'histograms': {}}
+        exited = []
+        for filename in os.listdir(METRICS_DIR):
+            if not filename.endswith('.json') or filename == RETIRED_FILE:
+                continue
+            path = os.path.join(METRICS_DIR, filename)
+            data = read(path)
+            pid = int(filename[:-5]) if filename[:-5].isdigit() else None
+            if pid is not None and not pid_alive(pid):
+                exited.append(path)
+                if data is not None:
+                    merge_file(retired, data)
+            elif data is not None:
+                merge_file(total, data)
+        if exited:
+            write(retired_path, retired)
+            for path in exited:
+                os.remove(path)
+        merge_file(total, retired)
+    counters = {decode_key(encoded): value for encoded, value in total['counters'].items()}
+    histograms = {decode_key(encoded): values for encoded, values in total['histograms'].items()}
+    return counters, histograms
+
+
+def format_labels(labels, extra=()):
+    labels = tuple(labels) + tuple(extra)
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels) + '}'
+
+
+def render(counters, histograms):
+    lines = []
+    described = set()
+
+    def describe(name):
+        if name not in described and name in HELP:
+            kind, text = HELP[name]
+            lines.append(f'# HELP {name} {text}')
+            lines.append(f'# TYPE {name} {kind}')
+            described.add(name)
+
+    for (name, labels), value in sorted(counters.items()):
+        describe(name)
+        lines.append(f'{name}{format_labels(labels)} {value}')
+    for (name, labels), values in sorted(histograms.items()):
+        describe(name)
+        cumulative = 0
+        for bound, count in zip(BUCKETS + ('+Inf',), values[:len(BUCKETS) + 1]):
+            cumulative += count
+            lines.append(f'{name}_bucket{format_labels(labels, (("le", bound),))} {cumulative}')
+        lines.append(f'{name}_sum{format_labels(labels)} {values[-2]}')
+        lines.append(f'{name}_count{format_labels(labels)} {values[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+flusher = BackgroundWorker('metrics-flush', METRICS_FLUSH_SECONDS, flush)
@@ -1,26 +1,144 @@
+import os
+
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 
 db = SQLAlchemy()
 
 
+# Relationships load lazily, one query per object. Code that walks them for many rows
+# loads them up front with selectinload/joinedload instead (see helpers/people.py).
 class Person(db.Model):
+    __table_args__ = (db.Index('ix_person_tenant_name', 'tenant', 'name'),)
+
     id = db.Column(db.Integer, primary_key=True)
+    # Registry key of the tenant the person belongs to (see helpers/tenants.py)
+    tenant = db.Column(db.String(100), nullable=False, default='default')
     name = db.Column(db.String(100), nullable=False)
 
 
 class Car(db.Model):
+    # Unique per tenant, so "who owns this plate" is one index lookup
+    __table_args__ = (db.UniqueConstraint('tenant', 'license_plate'),)
+
     id = db.Column(db.Integer, primary_key=True)
-    license_plate = db.Column(db.String(7), nullable=False)
-    owner_id = db.Column(db.Integer, db.ForeignKey('person.id'), nullable=False)
-    owner = db.relationship('Person', backref=db.backref('cars', lazy=True))
+    tenant = db.Column(db.String(100), nullable=False, default='default')
+    license_plate = db.Column(db.String(20), nullable=False)
+    # Vehicles mirrored from ParkingBoss have no known owner yet.
+    owner_id = db.Column(db.Integer, db.ForeignKey('person.id'), nullable=True, index=True)
+    owner = db.relationship('Person', backref=db.backref('cars', lazy=True, order_by='Car.license_plate'))
 
 
 class Permit(db.Model):
+    # The permit list reads a tenant's live permits in expiry order
+    __table_args__ = (db.Index('ix_permit_tenant_live', 'tenant', 'deleted', 'expires_at'),)
+
     id = db.Column(db.Integer, primary_key=True)
-    permit_id = db.Column(db.String(100), nullable=False)
-    person_id = db.Column(db.Integer, db.ForeignKey('person.id'), nullable=False)
+    permit_id = db.Column(db.String(100), nullable=False, unique=True)
+    # Registry key of the tenant the permit belongs to (see helpers/tenants.py)
+    tenant = db.Column(db.String(100), nullable=False, default='default', index=True)
+    license_plate = db.Column(db.String(20), nullable=False, index=True)
+    # Upstream lifecycle.invalid as displayed, plus the same instant in naive UTC for queries.
+    expiration = db.Column(db.String(40), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    # Deleted rows are tombstones for delta clients; local writes not yet confirmed by a sync
+    # carry local_write_at. See helpers/permit_sync.py.
+    deleted = db.Column(db.Boolean, nullable=False, default=False)
+    local_write_at = db.Column(db.DateTime, nullable=True)
+    # SyncState.version of the write batch that last changed the row, and when that was.
+    version = db.Column(db.Integer, nullable=False, default=0, index=True)
+    changed_at = db.Column(db.DateTime, nullable=True)
+    person_id = db.Column(db.Integer, db.ForeignKey('person.id'), nullable=True, index=True)
     person = db.relationship('Person', backref=db.backref('permits', lazy=True))
 
+    def to_dict(self):
+        return {"license_plate": self.license_plate, "expiration": self.expiration, "id": self.permit_id}
+
+
+class SyncState(db.Model):
+    """One row per tenant recording when its permit mirror last matched upstream, and its data version."""
+    id = db.Column(db.Integer, primary_key=True)
+    tenant = db.Column(db.String(100), nullable=False, unique=True, default='default')
+    last_synced_at = db.Column(db.DateTime, nullable=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    # Tombstones up to this version have been purged; older delta clients must start over.
+    purged_version = db.Column(db.Integer, nullable=False, default=0)
+
+
+class Renewal(db.Model):
+    """A permit the renewal scheduler reissues shortly before it expires, until renew_until (see helpers/renewals.py)."""
+    id = db.Column(db.Integer, primary_key=True)
+    tenant = db.Column(db.String(100), nullable=False, default='default', index=True)
+    # The latest permit issued for it; moves to the new permit on every renewal
+    permit_id = db.Column(db.String(100), nullable=False, unique=True)
+    license_plate = db.Column(db.String(20), nullable=False)
+    duration = db.Column(db.String(20), nullable=False, default='PT1H')
+    renew_until = db.Column(db.DateTime, nullable=False)
+
+
+class Operation(db.Model):
+    """A permit create or delete accepted from a user and sent to ParkingBoss later (see helpers/outbox.py)."""
+    __table_args__ = (db.Index('ix_operation_queue', 'state', 'tenant', 'plate_key', 'id'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    operation_id = db.Column(db.String(36), nullable=False, unique=True)
+    tenant = db.Column(db.String(100), nullable=False, default='default')
+    kind = db.Column(db.String(10), nullable=False)
+    # Operations on the same normalized plate reach upstream in the order they were accepted.
+    plate_key = db.Column(db.String(20), nullable=False)
+    license_plate = db.Column(db.String(20), nullable=True)
+    duration = db.Column(db.String(20), nullable=True)
+    # The permit to delete, or the one created
+    permit_id = db.Column(db.String(100), nullable=True)
+    # pending, running, done or failed
+    state = db.Column(db.String(10), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.String(200), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False)
+    next_attempt_at = db.Column(db.DateTime, nullable=False)
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    # Order in which operations finished, across workers; event streams report them from it.
+    finished_seq = db.Column(db.Integer, nullable=True, unique=True)
+
+    def to_dict(self):
+        return {"id": self.operation_id, "kind": self.kind, "state": self.state, "license_plate": self.license_plate,
+                "permit_id": self.permit_id, "attempts": self.attempts, "error": self.error}
+
+
+def configure_sqlite(busy_timeout_ms):
+    """Connect hook: WAL lets readers run while a worker writes, and writers wait for the lock instead of failing."""
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # In-memory databases keep their own journal mode; the pragma is a no-op there.
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute(f'PRAGMA busy_timeout={int(busy_timeout_ms)}')
+        cursor.close()
+    return on_connect
+
+
+MEMORY_URIS = ('sqlite://', 'sqlite:///:memory:')
+
+
+def is_sqlite_file(uri):
+    return uri.startswith('sqlite:') and uri not in MEMORY_URIS
+
 
 def init_app(app):
+    if is_sqlite_file(app.config['SQLALCHEMY_DATABASE_URI']):
+        # Sized for a gthread worker: one connection per request thread plus the background jobs
+        options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+        options.setdefault('pool_size', app.config['SQLITE_POOL_SIZE'])
+        options.setdefault('max_overflow', app.config['SQLITE_POOL_OVERFLOW'])
     db.init_app(app)
+    os.makedirs(app.instance_path, exist_ok=True)
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            event.listen(db.engine, 'connect', configure_sqlite(app.config['SQLITE_BUSY_TIMEOUT_MS']))
+        db.create_all()
+        # With --preload this runs in the gunicorn master, whose pooled connections forked
+        # workers would otherwise inherit and share. An in-memory database only lives as
+        # long as its connection, so that one is kept.
+        if app.config['SQLALCHEMY_DATABASE_URI'] not in MEMORY_URIS:
+            db.engine.dispose()
@@ -1,7 +1,4 @@
 """Routes"""
 
-import glob
-from os.path import dirname, basename, isfile
-
-modules = glob.glob(dirname(__file__) + "/*.py")
-__all__ = [basename(f)[:-3] for f in modules if isfile(f) and not f.endswith('__init__.py')]
+# Listed explicitly: globbing the package directory cost a filesystem scan on every import.
+__all__ = ['static']
@@ -1,29 +1,41 @@
 import os
 
-from flask import jsonify, send_from_directory
+from flask import Blueprint, current_app, jsonify, send_from_directory
 
-from server import app
+from server.helpers import circuit_breaker
 
+# Create a Blueprint for health checks and fixed-URL static files
+static_blueprint = Blueprint('static_routes', __name__)
 
-@app.route("/health")
+
+@static_blueprint.route("/health")
 def health():
     """health route"""
     state = {"status": "UP"}
     return jsonify(state)
 
 
-@app.route('/favicon.ico')
+@static_blueprint.route("/health/upstream")
+def upstream_health():
+    """Circuit breaker state of each ParkingBoss endpoint, as seen by the worker that answers"""
+    breakers = circuit_breaker.states()
+    degraded = any(status['state'] != circuit_breaker.CLOSED for status in breakers.values())
+    return jsonify({"status": "DEGRADED" if degraded else "UP", "breakers": breakers})
+
+
+# Both are sent with SEND_FILE_MAX_AGE_DEFAULT, and answer conditional requests with 304.
+@static_blueprint.route('/favicon.ico')
 def favicon():
     return send_from_directory(
-        os.path.join(app.root_path, 'static'),
+        os.path.join(current_app.root_path, 'static'),
         'favicon/favicon.ico',
         mimetype='image/vnd.microsoft.icon'
     )
 
 
-@app.route('/robots.txt')
+@static_blueprint.route('/robots.txt')
 def robots():
     return send_from_directory(
-        os.path.join(app.root_path, 'static'),
+        os.path.join(current_app.root_path, 'static'),
         'robots.txt'
     )
@@ -0,0 +1,98 @@
+from flask import Blueprint, jsonify, request
+from server.cache import not_modified, revalidate
+from server.helpers import permit_sync, plate_search
+from server.views.permit_views import read_page_args, sync_if_stale
+
+# Create a Blueprint for the JSON API used by scripts and the kiosk
+api_blueprint = Blueprint('api', __name__, url_prefix='/api')
+
+# Fields of a permit, as normalized by parkingboss_api_helper.parse_permits
+PERMIT_FIELDS = ('id', 'license_plate', 'expiration')
+
+
+def read_fields():
+    """Fields to include per permit, from ?fields=id,license_plate (default: all)."""
+    value = request.args.get('fields')
+    if not value:
+        return PERMIT_FIELDS, None
+    fields = tuple(field.strip() for field in value.split(',') if field.strip())
+    unknown = [field for field in fields if field not in PERMIT_FIELDS]
+    if unknown or not fields:
+        return None, f'"fields" must be a comma-separated subset of {", ".join(PERMIT_FIELDS)}'
+    return fields, None
+
+
+def select(permits, fields):
+    if fields == PERMIT_FIELDS:
+        return list(permits)
+    return [{field: permit[field] for field in fields} for permit in permits]
+
+
+@api_blueprint.route('/permits', methods=['GET'])
+async def list_permits():
+    page_args, error = read_page_args()
+    if error is None:
+        fields, error = read_fields()
+    if error is not None:
+        return jsonify({'error': error}), 400
+
+    error_response = await sync_if_stale()
+    if error_response is not None:
+        return error_response
+
+    version = permit_sync.current_version()
+    etag = f'permits-v{version}'
+    response = not_modified(etag)
+    if response is not None:
+        return response
+    page, per_page = page_args['page'], page_args['per_page']
+    permits = permit_sync.iter_permits(page_args['sort'], page_args['order'] == 'desc', (page - 1) * per_page, per_page)
+    return revalidate(jsonify({
+        'version': version,
+        'page': page,
+        'per_page': per_page,
+        'total': permit_sync.count_permits(),
+        'permits': select(permits, fields),
+    }), etag)
+
+
+# Clients keep the returned version and pass it back as ?since= to get only what changed.
+# When that is no longer possible ("reset": true) the full list comes back instead.
+@api_blueprint.route('/permits/changes', methods=['GET'])
+async def permit_changes():
+    fields, error = read_fields()
+    since = request.args.get('since', '')
+    if error is None and not since.isnumeric():
+        error = '"since" must be a version returned by this API'
+    if error is not None:
+        return jsonify({'error': error}), 400
+
+    error_response = await sync_if_stale()
+    if error_response is not None:
+        return error_response
+
+    changes = permit_sync.changes_since(int(since))
+    if changes is None:
+        return jsonify({'version': permit_sync.current_version(), 'reset': True,
+                        'permits': select(permit_sync.iter_permits(), fields)})
+    version, changed, deleted, expired = changes
+    return jsonify({'version': version, 'reset': False, 'changed': select(changed, fields),
+                    'deleted': deleted, 'expired': expired})
+
+
+# For staff checking plates from the lot: ?q=abc 12&mode=exact|prefix|partial (default partial).
+# Case and punctuation are ignored; each match says whether the plate has a valid permit.
+@api_blueprint.route('/plates/search', methods=['GET'])
+async def search_plates():
+    query = plate_search.normalize_plate(request.args.get('q', ''))
+    mode = request.args.get('mode', 'partial')
+    limit = request.args.get('limit', '20')
+    if not query or mode not in plate_search.MODES or not limit.isnumeric() or not 1 <= int(limit) <= 100:
+        return jsonify({'error': f'Expected a plate "q", "mode" one of {", ".join(plate_search.MODES)} '
+                                 f'and "limit" from 1 to 100'}), 400
+
+    error_response = await sync_if_stale()
+    if error_response is not None:
+        return error_response
+
+    return jsonify({'query': query, 'mode': mode, 'matches': plate_search.search(query, mode, int(limit))})
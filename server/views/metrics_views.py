@@ -0,0 +1,13 @@
+from flask import Blueprint, Response
+
+from server import metrics
+
+# Create a Blueprint for the Prometheus scrape endpoint
+metrics_blueprint = Blueprint('metrics', __name__)
+
+
+@metrics_blueprint.route('/metrics')
+def get_metrics():
+    # Publish this worker's latest numbers before summing every worker's file.
+    metrics.flush()
+    return Response(metrics.render(*metrics.collect()), mimetype='text/plain; version=0.0.4')
@@ -1,12 +1,158 @@
-from flask import Blueprint, current_app, jsonify, render_template, request
-from server.cache import cache
-from server.helpers import parkingboss_api_helper
-from server.helpers.error_handler import ExternalAPIError, ResponseParsingError
+import contextvars
+import math
+
+from flask import Blueprint, Response, current_app, jsonify, make_response, render_template, request
+from flask.globals import request_ctx
+from server.cache import (cache, not_modified, permit_generation, permit_list_cache_key, revalidate,
+                          PERMIT_LIST_CACHE_TIMEOUT)
+from server.helpers import async_parkingboss_api_helper as parkingboss_api_helper
+from server.helpers.parkingboss_api_helper import tenant_key
+from server.helpers import event_stream, outbox, permit_sync, renewals, tenants
+from server.helpers.usage_ledger import hours_in
+from server.helpers.error_handler import ExternalAPIError, QuotaExceededError, ResponseParsingError
 
 # Create a Blueprint for the person-related views
 permit_blueprint = Blueprint('permits', __name__, url_prefix='/permits')
 
 
+def to_iso_duration(hours):
+    hours = str(hours) if hours is not None else ''
+    return f"PT{hours}H" if hours and hours.isnumeric() else None
+
+
+def read_page_args():
+    """Page, page size and sort order for the permit list, from the query string."""
+    try:
+        page = int(request.args.get('page', 1))
+        per_page = int(request.args.get('per_page', current_app.config['PERMITS_PER_PAGE']))
+    except ValueError:
+        return None, '"page" and "per_page" must be integers'
+    if page < 1 or not 1 <= per_page <= current_app.config['PERMITS_MAX_PER_PAGE']:
+        return None, f'"page" must be positive and "per_page" at most {current_app.config["PERMITS_MAX_PER_PAGE"]}'
+    sort = request.args.get('sort', 'expires')
+    order = request.args.get('order', 'asc')
+    if sort not in permit_sync.SORT_COLUMNS or order not in ('asc', 'desc'):
+        return None, f'"sort" must be one of {", ".join(permit_sync.SORT_COLUMNS)} and "order" asc or desc'
+    return {'page': page, 'per_page': per_page, 'sort': sort, 'order': order}, None
+
+
+def stream_and_cache(key, template, context):
+    """Streams a template and caches the page once it has been sent in full.
+
+    Async views run on their own event loop, so stream_with_context and
+    stream_template (which enter the request context right away) cannot be
+    used. A copy of the request context is entered lazily instead, inside a
+    context of its own so it never leaks to whatever iterates the response.
+    """
+    ctx = request_ctx.copy()
+    tenant = tenants.current()
+
+    def generate():
+        with ctx, tenants.scope(tenant):
+            app = current_app._get_current_object()
+            app.update_template_context(context)
+            parts = []
+            for chunk in app.jinja_env.get_template(template).generate(context):
+                parts.append(chunk)
+                yield chunk
+            # Never reached when the client goes away, so partial pages are not cached.
+            cache.set(key, ''.join(parts), timeout=PERMIT_LIST_CACHE_TIMEOUT)
+
+    def drive():
+        run = contextvars.Context().run
+        chunks = generate()
+        try:
+            while True:
+                try:
+                    yield run(next, chunks)
+                except StopIteration:
+                    return
+        finally:
+            run(chunks.close)
+
+    return drive()
+
+
+def render_permit_list(page=1, per_page=None, sort='expires', order='asc', stream=False):
+    """Returns one page of the permit list, rendering it from the mirror on a cache miss.
+
+    The key carries the tenant's permit generation, which is read before
+    rendering so a concurrent write can never be cached under the new one.
+    With ``stream``, a miss returns the rows as they are rendered instead of
+    building the whole page first.
+    """
+    per_page = per_page or current_app.config['PERMITS_PER_PAGE']
+    key = permit_list_cache_key(tenant_key(), f'{sort}/{order}/{per_page}/{page}')
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    # Read first: the page's event stream resumes from it, and replaying a change twice is harmless.
+    version = permit_sync.current_version()
+    total = permit_sync.count_permits()
+    context = {
+        'version': version,
+        'permits': permit_sync.iter_permits(sort, order == 'desc', (page - 1) * per_page, per_page),
+        'synced_at': permit_sync.last_synced_at(),
+        'total': total,
+        'pages': max(1, math.ceil(total / per_page)),
+        'page': page,
+        'per_page': per_page,
+        'sort': sort,
+        'order': order,
+    }
+    if stream:
+        return stream_and_cache(key, "list_permits.html", context)
+    # Cached by hand because Flask-Caching's @cache.cached does not await coroutine views.
+    rendered = render_template("list_permits.html", **context)
+    cache.set(key, rendered, timeout=PERMIT_LIST_CACHE_TIMEOUT)
+    return rendered
+
+
+async def sync_if_stale():
+    """Syncs the mirror in the foreground when it is cold or too stale.
+
+    Within MAX_STALE_SECONDS the background syncer keeps it fresh and
+    requests never wait on upstream. Returns an error response only when a
+    cold mirror could not be filled.
+    """
+    age = permit_sync.data_age()
+    if age is None or age > permit_sync.MAX_STALE_SECONDS:
+        try:
+            permit_sync.reconcile(await parkingboss_api_helper.get_permits())
+        except (ExternalAPIError, ResponseParsingError) as e:
+            if age is None:
+                return jsonify({'error': e.message}), e.status_code
+            current_app.logger.warning('Serving permits %d seconds old: %s', age, e.message)
+    return None
+
+
+async def refresh_permit_list():
+    """Reconciles the local mirror with upstream once and re-renders the page."""
+    permit_sync.reconcile(await parkingboss_api_helper.get_permits())
+    render_permit_list()
+    return permit_sync.list_permits()
+
+
+def read_bulk_items(key):
+    payload = request.get_json(silent=True) or {}
+    items = payload.get(key)
+    if not isinstance(items, list) or not items:
+        return None, f'Expected a non-empty "{key}" list'
+    if len(items) > current_app.config['BULK_PERMIT_MAX_ITEMS']:
+        return None, f'At most {current_app.config["BULK_PERMIT_MAX_ITEMS"]} items per request'
+    return items, None
+
+
+async def bulk_response(results):
+    body = {'results': results}
+    try:
+        body['permits'] = await refresh_permit_list()
+    except (ExternalAPIError, ResponseParsingError) as e:
+        body['permits_error'] = e.message
+    return jsonify(body), 200
+
+
 # Define a route for /person/hello
 @permit_blueprint.route('/hello')
 def hello_person():
@@ -14,43 +160,166 @@ def hello_person():
 
 
 @permit_blueprint.route('', methods=['GET'])
-@cache.cached(timeout=50)
-def list_permits():
-    try:
-        return render_template("list_permits.html", permits=parkingboss_api_helper.get_permits())
-    except (ExternalAPIError, ResponseParsingError) as e:
-        return jsonify({'error': e.message}), e.status_code
+async def list_permits():
+    page_args, error = read_page_args()
+    if error is not None:
+        return jsonify({'error': error}), 400
+
+    error_response = await sync_if_stale()
+    if error_response is not None:
+        return error_response
+    # The generation changes with every permit change, so an unchanged one means an unchanged page.
+    etag = f'permits-{permit_generation(tenant_key())}'
+    response = not_modified(etag)
+    if response is None:
+        response = revalidate(make_response(render_permit_list(stream=True, **page_args)), etag)
+    response.headers['X-Data-Age'] = str(int(permit_sync.data_age() or 0))
+    return response
+
+
+def accepted(operation):
+    """202 for an operation queued in the outbox, pointing at its status."""
+    status_url = tenants.url_for('permits.operation_status', operation_id=operation.operation_id)
+    return jsonify({'operation_id': operation.operation_id, 'state': operation.state, 'status_url': status_url}), 202, \
+        {'Location': status_url}
 
 
-# TODO: CHECK WITH DURATIONS
+# Creates and deletes are queued in the outbox (helpers/outbox.py) and answered right away;
+# the result comes from the status URL or as an "operation" event on /permits/events.
 @permit_blueprint.route('', methods=['POST'])
 def create_permit():
-    try:
-        form = request.form.to_dict()
-        print(form)
-        duration = f"PT{form['duration']}H" if form['duration'] and form['duration'].isnumeric() else None
-        print(duration)
-        parkingboss_api_helper.create_permit(license_plate=form['licenseplate'], duration=duration, email=None, phone=None)
-        cache.delete('permits/list_permits')
-        return render_template("list_permits.html", permits=parkingboss_api_helper.get_permits())
-    except (ExternalAPIError, ResponseParsingError) as e:
+    form = request.get_json(silent=True) or request.form.to_dict()
+    license_plate = str(form.get('licenseplate', '')).strip()
+    duration = to_iso_duration(form.get('duration'))
+    if not license_plate or duration is None:
+        return jsonify({'error': 'Expected a "licenseplate" and a whole number of hours as "duration"'}), 400
+    # Advisory: queued creates hold no reservation, the drain checks the ledger again.
+    remaining = tenants.current().usage_ledger.remaining()
+    if remaining is not None and remaining < hours_in(duration):
+        e = QuotaExceededError()
         return jsonify({'error': e.message}), e.status_code
+    current_app.logger.debug('Queueing permit for %s, duration %s', license_plate, duration)
+    return accepted(outbox.enqueue_create(license_plate, duration))
 
 
-# TODO: Fix the page still showing deleted permit for a little bit
-# Might be a caching issue, might be better to return a non refresh
-# code and have the javascript manually remove the permit from the
-# list anyways after clicking the button and receiving the success?
+# The mirror hides a deleted permit right away, even while the upstream
+# permit list still reports it.
 @permit_blueprint.route('/<permit_id>', methods=['DELETE'])
 def delete_permit(permit_id):
+    return accepted(outbox.enqueue_delete(permit_id))
+
+
+@permit_blueprint.route('/operations/<operation_id>', methods=['GET'])
+def operation_status(operation_id):
+    operation = outbox.get(operation_id)
+    if operation is None:
+        return jsonify({'error': f'No operation {operation_id}'}), 404
+    return jsonify(operation.to_dict())
+
+
+@permit_blueprint.route('/<permit_id>/renewal', methods=['POST'])
+def enroll_renewal(permit_id):
+    payload = request.get_json(silent=True) or request.form.to_dict()
+    hours = str(payload.get('hours', ''))
+    duration = to_iso_duration(payload.get('duration', 1))
+    if (hours and not hours.isnumeric()) or duration is None or (hours and not 0 < int(hours) <= renewals.RENEWAL_MAX_HOURS):
+        return jsonify({'error': f'"hours" must be a whole number up to {renewals.RENEWAL_MAX_HOURS:g} '
+                                 f'and "duration" a whole number of hours'}), 400
+    renewal = renewals.enroll(permit_id, duration, int(hours) if hours else None)
+    if renewal is None:
+        return jsonify({'error': f'No active permit {permit_id}'}), 404
+    return jsonify({'permit_id': permit_id, 'renew_until': renewal.renew_until.isoformat() + 'Z'}), 200
+
+
+@permit_blueprint.route('/<permit_id>/renewal', methods=['DELETE'])
+def cancel_renewal(permit_id):
+    if not renewals.cancel(permit_id):
+        return jsonify({'error': f'Permit {permit_id} is not being renewed'}), 404
+    return jsonify({'permit_id': permit_id}), 200
+
+
+@permit_blueprint.route('/bulk', methods=['POST'])
+async def bulk_create_permits():
+    items, error = read_bulk_items('permits')
+    if error is None:
+        # Checked like a single create; "duration" defaults to an hour.
+        if not all(isinstance(item, dict) and isinstance(item.get('license_plate'), str)
+                   and item['license_plate'].strip() and to_iso_duration(item.get('duration', 1)) is not None
+                   for item in items):
+            error = 'Every permit needs a "license_plate" and, if given, a whole number of hours as "duration"'
+    if error is not None:
+        return jsonify({'error': error}), 400
+    durations = [to_iso_duration(item.get('duration', 1)) for item in items]
+
     try:
-        parkingboss_api_helper.delete_permit(permit_id)
-        cache.delete('permits/list_permits')
-        return jsonify({'permit_id': permit_id}), 200
-        return render_template("list_permits.html", permits=parkingboss_api_helper.get_permits())
+        # Resolve the policy once up front instead of once per item.
+        await parkingboss_api_helper.get_policy_id()
     except (ExternalAPIError, ResponseParsingError) as e:
         return jsonify({'error': e.message}), e.status_code
 
+    async def create(item):
+        license_plate, duration = item
+        return await parkingboss_api_helper.create_permit(license_plate=license_plate, duration=duration,
+                                                          email=None, phone=None)
+
+    items = [(item['license_plate'].strip(), duration) for item, duration in zip(items, durations)]
+    outcomes = await parkingboss_api_helper.gather_bounded(items, create, current_app.config['BULK_PERMIT_CONCURRENCY'])
+    results = []
+    for (license_plate, duration), (permit_id, error) in zip(items, outcomes):
+        result = {'license_plate': license_plate, 'success': error is None}
+        if error is None:
+            result['permit_id'] = permit_id
+            permit_sync.apply_created(permit_id, license_plate, duration)
+        else:
+            result['error'] = error.message
+        results.append(result)
+    return await bulk_response(results)
+
+
+@permit_blueprint.route('/bulk', methods=['DELETE'])
+async def bulk_delete_permits():
+    permit_ids, error = read_bulk_items('permit_ids')
+    if error is None and not all(isinstance(permit_id, str) and permit_id for permit_id in permit_ids):
+        error = 'Every permit ID must be a non-empty string'
+    if error is not None:
+        return jsonify({'error': error}), 400
+
+    outcomes = await parkingboss_api_helper.gather_bounded(permit_ids, parkingboss_api_helper.delete_permit,
+                                                           current_app.config['BULK_PERMIT_CONCURRENCY'])
+    results = []
+    for permit_id, (_, error) in zip(permit_ids, outcomes):
+        result = {'permit_id': permit_id, 'success': error is None}
+        if error is None:
+            permit_sync.apply_deleted(permit_id)
+        else:
+            result['error'] = error.message
+        results.append(result)
+    return await bulk_response(results)
+
+
+# Server-sent events: permit (created or changed), deleted, expired and usage. Reconnects
+# resume from Last-Event-ID, the permit data version of the last change received. Each
+# stream here holds a request thread; under gunicorn pages use the workers' event server
+# on EVENTS_PORT instead (helpers/event_server.py), and this route serves the rest.
+@permit_blueprint.route('/events', methods=['GET'])
+def permit_events():
+    since = request.headers.get('Last-Event-ID') or request.args.get('since')
+    if since is not None and not since.isnumeric():
+        return jsonify({'error': '"since" must be a permit data version'}), 400
+    broadcaster = event_stream.channel(tenants.current()).broadcaster
+    if not broadcaster.join():
+        return jsonify({'error': 'Too many event streams, retry later'}), 503, {'Retry-After': '30'}
+    try:
+        messages = event_stream.stream(int(since) if since is not None else None)
+    except Exception:
+        broadcaster.leave()
+        raise
+    response = Response(messages, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Tells nginx not to buffer the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 
 @permit_blueprint.route('/create', methods=['GET'])
 def render_create_permit_form():
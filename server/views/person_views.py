@@ -1,8 +1,28 @@
-from flask import Blueprint
+from flask import Blueprint, current_app, jsonify, request
+from server.helpers import people, permit_sync
+from server.views.permit_views import read_bulk_items
 
 # Create a Blueprint for the person-related views
 person_blueprint = Blueprint('person', __name__, url_prefix='/person')
 
+# And one for vehicles, looked up by plate
+vehicle_blueprint = Blueprint('vehicles', __name__, url_prefix='/vehicles')
+
+
+def read_people_page_args():
+    try:
+        page = int(request.args.get('page', 1))
+        per_page = int(request.args.get('per_page', current_app.config['PEOPLE_PER_PAGE']))
+    except ValueError:
+        return None, '"page" and "per_page" must be integers'
+    if page < 1 or not 1 <= per_page <= current_app.config['PEOPLE_MAX_PER_PAGE']:
+        return None, f'"page" must be positive and "per_page" at most {current_app.config["PEOPLE_MAX_PER_PAGE"]}'
+    return (page, per_page), None
+
+
+def is_plate_list(value):
+    return isinstance(value, list) and all(isinstance(plate, str) and plate for plate in value)
+
 
 # Define a route for /person/hello
 @person_blueprint.route('/hello')
@@ -10,6 +30,57 @@ def hello_person():
     return 'Hello, World! This is the person view.'
 
 
-@person_blueprint.route('/get')
-def get_people():
-    return 'GET DATA RETURNED HERE'
\ No newline at end of file
+@person_blueprint.route('', methods=['GET'])
+def list_people():
+    page_args, error = read_people_page_args()
+    if error is not None:
+        return jsonify({'error': error}), 400
+    page, per_page = page_args
+    return jsonify({
+        'page': page,
+        'per_page': per_page,
+        'total': people.count_people(),
+        'people': people.list_people((page - 1) * per_page, per_page),
+    })
+
+
+@person_blueprint.route('', methods=['POST'])
+def create_people():
+    items, error = read_bulk_items('people')
+    if error is None and not all(isinstance(item, dict) and isinstance(item.get('name'), str) and item['name']
+                                 and is_plate_list(item.get('license_plates', [])) for item in items):
+        error = 'Every person needs a "name", and "license_plates" must be a list of plates'
+    if error is not None:
+        return jsonify({'error': error}), 400
+    return jsonify({'ids': people.create_people(items)}), 201
+
+
+@person_blueprint.route('/<int:person_id>', methods=['GET'])
+def get_person(person_id):
+    person = people.get_person(person_id)
+    if person is None:
+        return jsonify({'error': f'No person {person_id}'}), 404
+    return jsonify(person)
+
+
+# Plates already registered to someone else move to this person.
+@person_blueprint.route('/<int:person_id>/vehicles', methods=['PUT'])
+def assign_vehicles(person_id):
+    license_plates = (request.get_json(silent=True) or {}).get('license_plates')
+    if not license_plates or not is_plate_list(license_plates):
+        return jsonify({'error': 'Expected a non-empty "license_plates" list'}), 400
+    if people.get_person(person_id) is None:
+        return jsonify({'error': f'No person {person_id}'}), 404
+    people.assign_vehicles(person_id, license_plates)
+    return jsonify(people.get_person(person_id))
+
+
+@vehicle_blueprint.route('/<license_plate>', methods=['GET'])
+def get_vehicle(license_plate):
+    """The vehicle's owner and its active permits, from the local mirror."""
+    car = people.find_vehicle(license_plate)
+    if car is None:
+        return jsonify({'error': f'No vehicle {license_plate}'}), 404
+    owner = {'id': car.owner.id, 'name': car.owner.name} if car.owner is not None else None
+    return jsonify({'license_plate': car.license_plate, 'owner': owner,
+                    'permits': permit_sync.permits_for_plate(license_plate)})
@@ -0,0 +1,89 @@
+"""Gunicorn serving profiles, shared by ``manage.py start`` and ``manage.py bench``.
+
+Each profile picks a worker model and sizes it from the CPUs this process
+may use. ``WEB_CONCURRENCY`` overrides the worker count and
+``GUNICORN_BACKLOG`` the listen backlog. Workers also serve event streams
+on ``EVENTS_PORT``, by default the port after the app's.
+"""
+import os
+import shlex
+
+# Application entry point; create_app is a factory, so gunicorn calls it once per worker (or once with --preload)
+APP = 'server:create_app()'
+
+# Pending connections the kernel queues while every worker is busy
+BACKLOG = int(os.environ.get('GUNICORN_BACKLOG', 2048))
+# Above REQUEST_DEADLINE_SECONDS (config.py), so upstream stalls fail the request, not the worker
+TIMEOUT = 30
+GRACEFUL_TIMEOUT = 10
+
+
+def cpu_count():
+    # Respects CPU affinity (containers, taskset) where the platform reports it.
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+PROFILES = {
+    # One request per process at a time. gunicorn's sync worker closes every
+    # connection (no keep-alive); event streams are served off the request path
+    # on EVENTS_PORT, so none pins a worker.
+    'sync': {
+        'worker_class': 'sync',
+        'workers': lambda cpus: 2 * cpus + 1,
+        'threads': 1,
+        'preload': True,
+        'keepalive': 0,
+    },
+    # Threads share their worker's connection pools, caches and token, and
+    # background jobs run once per worker, so fewer, wider workers.
+    'gthread': {
+        'worker_class': 'gthread',
+        'workers': lambda cpus: cpus + 1,
+        'threads': 8,
+        'preload': True,
+        'keepalive': 5,
+    },
+}
+# No gevent profile: Flask runs each async view on its own asyncio loop, asyncio allows one
+# running loop per OS thread, and a gevent worker's greenlets all share one, so concurrent
+# async views fail there. gthread is the concurrent profile for this app.
+DEFAULT_PROFILE = 'gthread'
+
+
+def worker_count(profile, cpus=None):
+    if os.environ.get('WEB_CONCURRENCY', '').isdigit():
+        return int(os.environ['WEB_CONCURRENCY'])
+    return PROFILES[profile]['workers'](cpus or cpu_count())
+
+
+def events_port(port):
+    if os.environ.get('EVENTS_PORT', '').isdigit():
+        return int(os.environ['EVENTS_PORT'])
+    return int(port) + 1
+
+
+def gunicorn_args(profile, host, port, app=APP, cpus=None):
+    settings = PROFILES[profile]
+    args = ['gunicorn',
+            '--bind', f'{host}:{port}',
+            '--worker-class', settings['worker_class'],
+            '--workers', str(worker_count(profile, cpus)),
+            '--keep-alive', str(settings['keepalive']),
+            '--backlog', str(BACKLOG),
+            '--timeout', str(TIMEOUT),
+            '--graceful-timeout', str(GRACEFUL_TIMEOUT),
+            # Event streams are served from an asyncio loop in each worker (helpers/event_server.py)
+            '--env', f'EVENTS_PORT={events_port(port)}']
+    if 'threads' in settings:
+        # Event streams size their per-worker cap from it (helpers/event_stream.py).
+        args += ['--threads', str(settings['threads']), '--env', f'WORKER_THREADS={settings["threads"]}']
+    if settings['preload']:
+        args.append('--preload')
+    args.append(app)
+    return args
+
+
+def gunicorn_command(profile, host, port, app=APP, cpus=None):
+    return shlex.join(gunicorn_args(profile, host, port, app, cpus))
@@ -0,0 +1,94 @@
+"""Reports where application startup time goes.
+
+Imports the app and runs create_app() in a fresh interpreter with
+``-X importtime``, then prints the slowest imports (each ``server`` module
+on its own, other packages summed per top-level package) and the time
+spent in each create_app phase:
+
+    python manage.py startup
+    python startup_report.py --top 20 --max-ms 800
+
+With ``--max-ms`` it exits non-zero when import plus create_app takes
+longer, so a slow new dependency fails CI instead of slowing every worker boot.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+CHILD = """
+import json, time
+started = time.perf_counter()
+from server import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+print(json.dumps({'import_seconds': imported - started, 'create_seconds': created - imported,
+                  'phases': app.extensions.get('startup_seconds', {})}))
+"""
+
+
+def parse_importtime(stderr):
+    """(module, self microseconds) for every import line of ``-X importtime`` output."""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        modules.append((name.strip(), int(self_us)))
+    return modules
+
+
+def group(modules):
+    """Microseconds per server module, and per top-level package for everything else."""
+    totals = defaultdict(int)
+    for name, self_us in modules:
+        key = name if name == 'server' or name.startswith('server.') else name.split('.')[0]
+        totals[key] += self_us
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+
+def measure():
+    env = dict(os.environ, DATABASE_URL='sqlite://')
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', CHILD],
+                            cwd=ROOT, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr)
+    return json.loads(result.stdout.strip().splitlines()[-1]), group(parse_importtime(result.stderr))
+
+
+def format_report(timings, imports, top):
+    lines = [f"{'import':<44}{'ms':>9}"]
+    for name, self_us in imports[:top]:
+        lines.append(f'{name:<44}{self_us / 1000:>9.1f}')
+    lines.append('')
+    lines.append(f"{'create_app phase':<44}{'ms':>9}")
+    for phase, seconds in timings['phases'].items():
+        lines.append(f'{phase:<44}{seconds * 1000:>9.1f}')
+    lines.append('')
+    lines.append(f"{'import server':<44}{timings['import_seconds'] * 1000:>9.1f}")
+    lines.append(f"{'create_app()':<44}{timings['create_seconds'] * 1000:>9.1f}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Report import and create_app time')
+    parser.add_argument('--top', type=int, default=15, help='imports to list')
+    parser.add_argument('--max-ms', type=float, help='fail when import plus create_app takes longer')
+    args = parser.parse_args(argv)
+
+    timings, imports = measure()
+    print(format_report(timings, imports, args.top))
+    total_ms = (timings['import_seconds'] + timings['create_seconds']) * 1000
+    if args.max_ms is not None and total_ms > args.max_ms:
+        print(f'startup took {total_ms:.0f} ms, over the {args.max_ms:.0f} ms budget', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
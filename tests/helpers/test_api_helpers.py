@@ -3,7 +3,7 @@ from mock import Mock, patch
 from decimal import Decimal
 from requests import RequestException
 from server import create_app
-from server.helpers import parkingboss_api_helper
+from server.helpers import parkingboss_api_helper, tenants
 from server.helpers.error_handler import ExternalAPIError, ResponseParsingError
 from flask import Flask
 
@@ -33,7 +33,7 @@ class TestGetTenantIdAndBearerToken(unittest.TestCase):
         self.app_context.pop()
 
 
-    @patch('server.helpers.parkingboss_api_helper.requests.post')
+    @patch('server.helpers.parkingboss_api_helper.client.post')
     @patch('server.helpers.parkingboss_api_helper.generate_timestamp_z')
     @patch('server.helpers.parkingboss_api_helper.current_app')
     def test_success_flow(self, mock_app, mock_timestamp, mock_post):
@@ -45,7 +45,7 @@ class TestGetTenantIdAndBearerToken(unittest.TestCase):
         self.assertEqual(self.expected_response, response)
 
 
-    @patch('server.helpers.parkingboss_api_helper.requests.post')
+    @patch('server.helpers.parkingboss_api_helper.client.post')
     @patch('server.helpers.parkingboss_api_helper.generate_timestamp_z')
     @patch('server.helpers.parkingboss_api_helper.current_app')
     def test_request_exception_flow(self, mock_app, mock_timestamp, mock_post):
@@ -56,7 +56,7 @@ class TestGetTenantIdAndBearerToken(unittest.TestCase):
         mock_app.logger.exception.assert_called_once()
 
 
-    @patch('server.helpers.parkingboss_api_helper.requests.post')
+    @patch('server.helpers.parkingboss_api_helper.client.post')
     @patch('server.helpers.parkingboss_api_helper.generate_timestamp_z')
     @patch('server.helpers.parkingboss_api_helper.current_app')
     def test_key_error_in_response(self, mock_app, mock_timestamp, mock_post):
@@ -83,6 +83,7 @@ class TestGetUsageAndPolicyID(unittest.TestCase):
         parkingboss_api_helper.TENANT = self.tenant
         parkingboss_api_helper.TENANT_PW = self.tenant_pw
         self.mock_auth_data = {"bearer": self.mock_bearer, "tenant_id": self.tenant_id}
+        parkingboss_api_helper.token_manager.invalidate()
         self.mock_response = Mock()
         self.mock_response.json.return_value = {"usage": {"items": {"item_id": {"used": {"item_id2": {"display": self.returned_usage}}}}}, "issuers": {"items": {"item_id": {"policy": self.policy_id}}}}
         self.expected_response = {"usage": self.usage, "policy_id": self.policy_id}
@@ -97,7 +98,7 @@ class TestGetUsageAndPolicyID(unittest.TestCase):
 
     @patch('server.helpers.parkingboss_api_helper.get_tenant_id_and_bearer_token')
     @patch('server.helpers.parkingboss_api_helper.generate_timestamp_with_utc_offset')
-    @patch('server.helpers.parkingboss_api_helper.requests.get')
+    @patch('server.helpers.parkingboss_api_helper.client.get')
     @patch('server.helpers.parkingboss_api_helper.current_app')
     def test_success_flow(self, mock_app, mock_get, mock_timestamp, mock_get_tenant_id):
         mock_get_tenant_id.return_value = self.mock_auth_data
@@ -110,7 +111,7 @@ class TestGetUsageAndPolicyID(unittest.TestCase):
 
     @patch('server.helpers.parkingboss_api_helper.get_tenant_id_and_bearer_token')
     @patch('server.helpers.parkingboss_api_helper.generate_timestamp_with_utc_offset')
-    @patch('server.helpers.parkingboss_api_helper.requests.get')
+    @patch('server.helpers.parkingboss_api_helper.client.get')
     @patch('server.helpers.parkingboss_api_helper.current_app')
     def test_get_tenant_id_exception_flow(self, mock_app, mock_get, mock_timestamp, mock_get_tenant_id):
         mock_get_tenant_id.side_effect = ExternalAPIError("message")
@@ -122,7 +123,7 @@ class TestGetUsageAndPolicyID(unittest.TestCase):
 
     @patch('server.helpers.parkingboss_api_helper.get_tenant_id_and_bearer_token')
     @patch('server.helpers.parkingboss_api_helper.generate_timestamp_with_utc_offset')
-    @patch('server.helpers.parkingboss_api_helper.requests.get')
+    @patch('server.helpers.parkingboss_api_helper.client.get')
     @patch('server.helpers.parkingboss_api_helper.current_app')
     def test_requests_exception_flow(self, mock_app, mock_get, mock_timestamp, mock_get_tenant_id):
         mock_get_tenant_id.return_value = self.mock_auth_data
@@ -134,7 +135,7 @@ class TestGetUsageAndPolicyID(unittest.TestCase):
 
     @patch('server.helpers.parkingboss_api_helper.get_tenant_id_and_bearer_token')
     @patch('server.helpers.parkingboss_api_helper.generate_timestamp_with_utc_offset')
-    @patch('server.helpers.parkingboss_api_helper.requests.get')
+    @patch('server.helpers.parkingboss_api_helper.client.get')
     @patch('server.helpers.parkingboss_api_helper.current_app')
     def test_key_error_flow(self, mock_app, mock_get, mock_timestamp, mock_get_tenant_id):
         mock_get_tenant_id.return_value = self.mock_auth_data
@@ -145,6 +146,37 @@ class TestGetUsageAndPolicyID(unittest.TestCase):
         with self.assertRaises(ResponseParsingError):
             response = parkingboss_api_helper.get_usage_and_policy_id()
 
+    @patch('server.helpers.parkingboss_api_helper.get_tenant_id_and_bearer_token')
+    @patch('server.helpers.parkingboss_api_helper.generate_timestamp_with_utc_offset')
+    @patch('server.helpers.parkingboss_api_helper.client.get')
+    @patch('server.helpers.parkingboss_api_helper.current_app')
+    def test_token_is_reused_across_calls(self, mock_app, mock_get, mock_timestamp, mock_get_tenant_id):
+        mock_get_tenant_id.return_value = self.mock_auth_data
+        mock_timestamp.return_value = self.mock_timestamp
+        mock_get.return_value = self.mock_response
+
+        parkingboss_api_helper.get_usage_and_policy_id()
+        parkingboss_api_helper.get_usage_and_policy_id()
+
+        mock_get_tenant_id.assert_called_once()
+        self.assertEqual(2, mock_get.call_count)
+
+    @patch('server.helpers.parkingboss_api_helper.get_tenant_id_and_bearer_token')
+    @patch('server.helpers.parkingboss_api_helper.generate_timestamp_with_utc_offset')
+    @patch('server.helpers.parkingboss_api_helper.client.get')
+    @patch('server.helpers.parkingboss_api_helper.current_app')
+    def test_unauthorized_refreshes_token_once(self, mock_app, mock_get, mock_timestamp, mock_get_tenant_id):
+        mock_get_tenant_id.side_effect = [{"bearer": "expired", "tenant_id": self.tenant_id}, self.mock_auth_data]
+        mock_timestamp.return_value = self.mock_timestamp
+        unauthorized = Mock(status_code=401)
+        mock_get.side_effect = [unauthorized, self.mock_response]
+
+        response = parkingboss_api_helper.get_usage_and_policy_id()
+
+        self.assertEqual(self.expected_response, response)
+        self.assertEqual(2, mock_get_tenant_id.call_count)
+        self.assertEqual(f"bearer {self.mock_bearer}", mock_get.call_args.kwargs["params"]["Authorization"])
+
 class TestGetRemainingUsage(unittest.TestCase):
     def setUp(self):
         pass
@@ -190,6 +222,7 @@ class TestGetPermits(unittest.TestCase):
         self.location = "LOCATION"
         self.tenant_pw = "TENANT_PW"
         self.mock_timestamp = "now"
+        self.mock_range = "now/later"
         self.mock_bearer = "bearer_token"
         self.policy_id = "policy_id"
         self.usage = "123"
@@ -197,6 +230,7 @@ class TestGetPermits(unittest.TestCase):
         parkingboss_api_helper.TENANT = self.tenant
         parkingboss_api_helper.TENANT_PW = self.tenant_pw
         self.mock_auth_data = {"bearer": self.mock_bearer, "tenant_id": self.tenant_id}
+        parkingboss_api_helper.token_manager.invalidate()
         self.mock_response = Mock()
         self.mock_response.json.return_value = {"permits": {"items": {"permit_id1": {"vehicle": "vehicle_id1", "lifecycle": {"invalid": "permit_expiry1"}}, "permit_id2": {"vehicle": "vehicle_id2", "lifecycle": {"invalid": "permit_expiry2"}}}}, "vehicles": {"items": {"vehicle_id1": {"display": "license_plate1"}, "vehicle_id2": {"display": "license_plate2"}}}}
         self.expected_response = [{"license_plate": "license_plate1", "expiration": "permit_expiry1", "id": "permit_id1"}, {"license_plate": "license_plate2", "expiration": "permit_expiry2", "id": "permit_id2"}]
@@ -206,43 +240,47 @@ class TestGetPermits(unittest.TestCase):
         self.app_context.push()
 
     @patch('server.helpers.parkingboss_api_helper.get_tenant_id_and_bearer_token')
+    @patch('server.helpers.parkingboss_api_helper.generate_timestamp_with_utc_offset_range_1_month')
     @patch('server.helpers.parkingboss_api_helper.generate_timestamp_with_utc_offset')
-    @patch('server.helpers.parkingboss_api_helper.requests.get')
+    @patch('server.helpers.parkingboss_api_helper.client.get')
     @patch('server.helpers.parkingboss_api_helper.current_app')
-    def test_success_flow(self, mock_app, mock_get, mock_timestamp, mock_get_tenant_id):
+    def test_success_flow(self, mock_app, mock_get, mock_timestamp, mock_range, mock_get_tenant_id):
         mock_get_tenant_id.return_value = self.mock_auth_data
         mock_timestamp.return_value = self.mock_timestamp
+        mock_range.return_value = self.mock_range
         mock_get.return_value = self.mock_response
 
-        expected_params = {"sample": "PT24H", "viewpoint": self.mock_timestamp, "Authorization": f"bearer {self.mock_bearer}"}
-        expected_full_url = f"{parkingboss_api_helper.PERMITS_URL}/{self.tenant_id}/permits"
+        expected_params = {"valid": self.mock_range, "viewpoint": self.mock_timestamp, "Authorization": f"bearer {self.mock_bearer}"}
+        expected_full_url = f"{tenants.current().permits_url}/{self.tenant_id}/permits"
 
         response = parkingboss_api_helper.get_permits()
-        mock_get.assert_called_once_with(expected_full_url, params=expected_params)
+        mock_get.assert_called_once_with(expected_full_url, params=expected_params, endpoint="permits")
 
         self.assertEqual(self.expected_response, response)
 
     @patch('server.helpers.parkingboss_api_helper.get_tenant_id_and_bearer_token')
+    @patch('server.helpers.parkingboss_api_helper.generate_timestamp_with_utc_offset_range_1_month')
     @patch('server.helpers.parkingboss_api_helper.generate_timestamp_with_utc_offset')
-    @patch('server.helpers.parkingboss_api_helper.requests.get')
+    @patch('server.helpers.parkingboss_api_helper.client.get')
     @patch('server.helpers.parkingboss_api_helper.current_app')
-    def test_empty_list_flow(self, mock_app, mock_get, mock_timestamp, mock_get_tenant_id):
+    def test_empty_list_flow(self, mock_app, mock_get, mock_timestamp, mock_range, mock_get_tenant_id):
         mock_get_tenant_id.return_value = self.mock_auth_data
         mock_timestamp.return_value = self.mock_timestamp
+        mock_range.return_value = self.mock_range
         self.mock_response.json.return_value = {"permits": {"items": {}}, "vehicles": {"items": {}}}
         mock_get.return_value = self.mock_response
 
-        expected_params = {"sample": "PT24H", "viewpoint": self.mock_timestamp, "Authorization": f"bearer {self.mock_bearer}"}
-        expected_full_url = f"{parkingboss_api_helper.PERMITS_URL}/{self.tenant_id}/permits"
+        expected_params = {"valid": self.mock_range, "viewpoint": self.mock_timestamp, "Authorization": f"bearer {self.mock_bearer}"}
+        expected_full_url = f"{tenants.current().permits_url}/{self.tenant_id}/permits"
 
         response = parkingboss_api_helper.get_permits()
-        mock_get.assert_called_once_with(expected_full_url, params=expected_params)
+        mock_get.assert_called_once_with(expected_full_url, params=expected_params, endpoint="permits")
 
         self.assertEqual([], response)
 
     @patch('server.helpers.parkingboss_api_helper.get_tenant_id_and_bearer_token')
     @patch('server.helpers.parkingboss_api_helper.generate_timestamp_with_utc_offset')
-    @patch('server.helpers.parkingboss_api_helper.requests.get')
+    @patch('server.helpers.parkingboss_api_helper.client.get')
     @patch('server.helpers.parkingboss_api_helper.current_app')
     def test_get_tenant_id_exception_flow(self, mock_app, mock_get, mock_timestamp, mock_get_tenant_id):
         mock_get_tenant_id.side_effect = ExternalAPIError("message")
@@ -254,7 +292,7 @@ class TestGetPermits(unittest.TestCase):
 
     @patch('server.helpers.parkingboss_api_helper.get_tenant_id_and_bearer_token')
     @patch('server.helpers.parkingboss_api_helper.generate_timestamp_with_utc_offset')
-    @patch('server.helpers.parkingboss_api_helper.requests.get')
+    @patch('server.helpers.parkingboss_api_helper.client.get')
     @patch('server.helpers.parkingboss_api_helper.current_app')
     def test_requests_exception_flow(self, mock_app, mock_get, mock_timestamp, mock_get_tenant_id):
         mock_get_tenant_id.return_value = self.mock_auth_data
@@ -266,7 +304,7 @@ class TestGetPermits(unittest.TestCase):
 
     @patch('server.helpers.parkingboss_api_helper.get_tenant_id_and_bearer_token')
     @patch('server.helpers.parkingboss_api_helper.generate_timestamp_with_utc_offset')
-    @patch('server.helpers.parkingboss_api_helper.requests.get')
+    @patch('server.helpers.parkingboss_api_helper.client.get')
     @patch('server.helpers.parkingboss_api_helper.current_app')
     def test_key_error_flow(self, mock_app, mock_get, mock_timestamp, mock_get_tenant_id):
         mock_get_tenant_id.return_value = self.mock_auth_data
@@ -294,6 +332,7 @@ class TestCreatePermit(unittest.TestCase):
         parkingboss_api_helper.TENANT = self.tenant
         parkingboss_api_helper.TENANT_PW = self.tenant_pw
         self.mock_get_usage = {"usage": self.usage, "policy_id": self.policy_id}
+        parkingboss_api_helper.policy_cache.clear()
         self.mock_response = Mock()
         self.mock_response.json.return_value = {"permits": {"item": "returned_permit_id"}}
         self.expected_response = "returned_permit_id"
@@ -312,7 +351,7 @@ class TestCreatePermit(unittest.TestCase):
 
     @patch('server.helpers.parkingboss_api_helper.get_usage_and_policy_id')
     @patch('server.helpers.parkingboss_api_helper.generate_timestamp_z')
-    @patch('server.helpers.parkingboss_api_helper.requests.post')
+    @patch('server.helpers.parkingboss_api_helper.client.post')
     @patch('server.helpers.parkingboss_api_helper.current_app')
     def test_success_flow(self, mock_app, mock_post, mock_timestamp, mock_get_usage):
         mock_get_usage.return_value = self.mock_get_usage
@@ -322,14 +361,14 @@ class TestCreatePermit(unittest.TestCase):
         expected_params = {"sample": "PT24H", "viewpoint": self.mock_timestamp, "Authorization": f"bearer {self.mock_bearer}"}
         expected_full_url = f"{parkingboss_api_helper.CREATE_URL}"
         response = parkingboss_api_helper.create_permit(license_plate=self.license_plate)
-        mock_post.assert_called_once_with(expected_full_url, params=self.expected_params, data=self.expected_form_data)
+        mock_post.assert_called_once_with(expected_full_url, params=self.expected_params, data=self.expected_form_data, endpoint="create")
 
         self.assertEqual(self.expected_response, response)
 
 
     @patch('server.helpers.parkingboss_api_helper.get_usage_and_policy_id')
     @patch('server.helpers.parkingboss_api_helper.generate_timestamp_z')
-    @patch('server.helpers.parkingboss_api_helper.requests.post')
+    @patch('server.helpers.parkingboss_api_helper.client.post')
     @patch('server.helpers.parkingboss_api_helper.current_app')
     def test_requests_exception_flow(self, mock_app, mock_get, mock_timestamp, mock_get_usage):
         mock_get_usage.return_value = self.mock_get_usage
@@ -341,7 +380,7 @@ class TestCreatePermit(unittest.TestCase):
 
     @patch('server.helpers.parkingboss_api_helper.get_usage_and_policy_id')
     @patch('server.helpers.parkingboss_api_helper.generate_timestamp_z')
-    @patch('server.helpers.parkingboss_api_helper.requests.post')
+    @patch('server.helpers.parkingboss_api_helper.client.post')
     @patch('server.helpers.parkingboss_api_helper.current_app')
     def test_key_error_flow(self, mock_app, mock_get, mock_timestamp, mock_get_usage):
         mock_get_usage.return_value = self.mock_get_usage
@@ -352,6 +391,38 @@ class TestCreatePermit(unittest.TestCase):
         with self.assertRaises(ResponseParsingError):
             response = parkingboss_api_helper.create_permit(license_plate=self.license_plate)
 
+    @patch('server.helpers.parkingboss_api_helper.get_usage_and_policy_id')
+    @patch('server.helpers.parkingboss_api_helper.generate_timestamp_z')
+    @patch('server.helpers.parkingboss_api_helper.client.post')
+    @patch('server.helpers.parkingboss_api_helper.current_app')
+    def test_cached_policy_skips_usage_call(self, mock_app, mock_post, mock_timestamp, mock_get_usage):
+        parkingboss_api_helper.policy_cache.set((self.location, self.tenant), self.policy_id)
+        mock_timestamp.return_value = self.mock_timestamp
+        mock_post.return_value = self.mock_response
+
+        response = parkingboss_api_helper.create_permit(license_plate=self.license_plate)
+
+        mock_get_usage.assert_not_called()
+        mock_post.assert_called_once_with(parkingboss_api_helper.CREATE_URL, params=self.expected_params, data=self.expected_form_data, endpoint="create")
+        self.assertEqual(self.expected_response, response)
+
+    @patch('server.helpers.parkingboss_api_helper.get_usage_and_policy_id')
+    @patch('server.helpers.parkingboss_api_helper.generate_timestamp_z')
+    @patch('server.helpers.parkingboss_api_helper.client.post')
+    @patch('server.helpers.parkingboss_api_helper.current_app')
+    def test_policy_error_invalidates_cached_policy(self, mock_app, mock_post, mock_timestamp, mock_get_usage):
+        parkingboss_api_helper.policy_cache.set((self.location, self.tenant), "stale_policy_id")
+        mock_get_usage.return_value = self.mock_get_usage
+        mock_timestamp.return_value = self.mock_timestamp
+        rejected = Mock(status_code=400, text="Invalid policy")
+        mock_post.side_effect = [rejected, self.mock_response]
+
+        response = parkingboss_api_helper.create_permit(license_plate=self.license_plate)
+
+        mock_get_usage.assert_called_once()
+        self.assertEqual(self.policy_id, mock_post.call_args.kwargs["data"]["policy"])
+        self.assertEqual(self.expected_response, response)
+
 
 if __name__ == '__main__':
     unittest.main()
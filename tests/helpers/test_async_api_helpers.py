@@ -0,0 +1,198 @@
+import asyncio
+import unittest
+from mock import AsyncMock, Mock, patch
+import httpx
+from flask import Flask
+
+from server.helpers import async_parkingboss_api_helper
+from server.helpers import parkingboss_api_helper
+from server.helpers.error_handler import ExternalAPIError, QuotaExceededError, ResponseParsingError
+from server.helpers.usage_ledger import UsageLedger
+
+
+class AsyncHelperTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tenant_id = "12345"
+        self.tenant = "tenant"
+        self.location = "LOCATION"
+        self.policy_id = "policy_id"
+        self.mock_auth_data = {"bearer": "bearer_token", "tenant_id": self.tenant_id}
+        parkingboss_api_helper.LOCATION_ID = self.location
+        parkingboss_api_helper.TENANT = self.tenant
+        parkingboss_api_helper.token_manager.invalidate()
+        parkingboss_api_helper.policy_cache.clear()
+        parkingboss_api_helper.usage_ledger.clear()
+        self.app = Flask(__name__)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    def make_response(self, payload, status_code=200):
+        return httpx.Response(status_code, json=payload, request=httpx.Request("GET", "https://example.com"))
+
+    def make_html_response(self):
+        return httpx.Response(200, text="<html>Maintenance</html>", request=httpx.Request("GET", "https://example.com"))
+
+
+class TestAsyncGetUsageAndPolicyID(AsyncHelperTestCase):
+    def setUp(self):
+        super().setUp()
+        self.payload = {"usage": {"items": {"item_id": {"used": {"item_id2": {"display": "123 hours"}}}}}, "issuers": {"items": {"item_id": {"policy": self.policy_id}}}}
+
+    @patch('server.helpers.parkingboss_api_helper.get_tenant_id_and_bearer_token')
+    @patch('server.helpers.async_parkingboss_api_helper.client.get', new_callable=AsyncMock)
+    async def test_success_flow(self, mock_get, mock_get_tenant_id):
+        mock_get_tenant_id.return_value = self.mock_auth_data
+        mock_get.return_value = self.make_response(self.payload)
+
+        response = await async_parkingboss_api_helper.get_usage_and_policy_id()
+
+        self.assertEqual({"usage": "123", "policy_id": self.policy_id}, response)
+        self.assertEqual(self.policy_id, parkingboss_api_helper.policy_cache.get((self.location, self.tenant)))
+
+    @patch('server.helpers.parkingboss_api_helper.get_tenant_id_and_bearer_token')
+    @patch('server.helpers.async_parkingboss_api_helper.client.get', new_callable=AsyncMock)
+    async def test_unauthorized_refreshes_token_once(self, mock_get, mock_get_tenant_id):
+        mock_get_tenant_id.side_effect = [{"bearer": "expired", "tenant_id": self.tenant_id}, self.mock_auth_data]
+        mock_get.side_effect = [self.make_response({}, status_code=401), self.make_response(self.payload)]
+
+        response = await async_parkingboss_api_helper.get_usage_and_policy_id()
+
+        self.assertEqual("123", response["usage"])
+        self.assertEqual(2, mock_get_tenant_id.call_count)
+
+    @patch('server.helpers.parkingboss_api_helper.get_tenant_id_and_bearer_token')
+    @patch('server.helpers.async_parkingboss_api_helper.client.get', new_callable=AsyncMock)
+    async def test_requests_exception_flow(self, mock_get, mock_get_tenant_id):
+        mock_get_tenant_id.return_value = self.mock_auth_data
+        mock_get.side_effect = httpx.ConnectError("Test Exception")
+
+        with self.assertRaises(ExternalAPIError):
+            await async_parkingboss_api_helper.get_usage_and_policy_id()
+
+    @patch('server.helpers.parkingboss_api_helper.get_tenant_id_and_bearer_token')
+    @patch('server.helpers.async_parkingboss_api_helper.client.get', new_callable=AsyncMock)
+    async def test_key_error_flow(self, mock_get, mock_get_tenant_id):
+        mock_get_tenant_id.return_value = self.mock_auth_data
+        mock_get.return_value = self.make_response({"mocked": "response"})
+
+        with self.assertRaises(ResponseParsingError):
+            await async_parkingboss_api_helper.get_usage_and_policy_id()
+
+    @patch('server.helpers.parkingboss_api_helper.get_tenant_id_and_bearer_token')
+    @patch('server.helpers.async_parkingboss_api_helper.client.get', new_callable=AsyncMock)
+    async def test_non_json_body_is_an_external_api_error(self, mock_get, mock_get_tenant_id):
+        mock_get_tenant_id.return_value = self.mock_auth_data
+        mock_get.return_value = self.make_html_response()
+
+        with self.assertRaises(ExternalAPIError):
+            await async_parkingboss_api_helper.get_usage_and_policy_id()
+
+
+class TestAsyncGetPermits(AsyncHelperTestCase):
+    @patch('server.helpers.parkingboss_api_helper.get_tenant_id_and_bearer_token')
+    @patch('server.helpers.async_parkingboss_api_helper.client.get', new_callable=AsyncMock)
+    async def test_success_flow(self, mock_get, mock_get_tenant_id):
+        mock_get_tenant_id.return_value = self.mock_auth_data
+        mock_get.return_value = self.make_response({"permits": {"items": {"permit_id1": {"vehicle": "vehicle_id1", "lifecycle": {"invalid": "permit_expiry1"}}}}, "vehicles": {"items": {"vehicle_id1": {"display": "license_plate1"}}}})
+
+        response = await async_parkingboss_api_helper.get_permits()
+
+        self.assertEqual([{"license_plate": "license_plate1", "expiration": "permit_expiry1", "id": "permit_id1"}], response)
+
+    @patch('server.helpers.parkingboss_api_helper.get_tenant_id_and_bearer_token')
+    @patch('server.helpers.async_parkingboss_api_helper.client.get', new_callable=AsyncMock)
+    async def test_key_error_flow(self, mock_get, mock_get_tenant_id):
+        mock_get_tenant_id.return_value = self.mock_auth_data
+        mock_get.return_value = self.make_response({"mocked": "response"})
+
+        with self.assertRaises(ResponseParsingError):
+            await async_parkingboss_api_helper.get_permits()
+
+    @patch('server.helpers.parkingboss_api_helper.get_tenant_id_and_bearer_token')
+    @patch('server.helpers.async_parkingboss_api_helper.client.get', new_callable=AsyncMock)
+    async def test_non_json_body_is_an_external_api_error(self, mock_get, mock_get_tenant_id):
+        mock_get_tenant_id.return_value = self.mock_auth_data
+        mock_get.return_value = self.make_html_response()
+
+        with self.assertRaises(ExternalAPIError):
+            await async_parkingboss_api_helper.get_permits()
+
+
+class TestAsyncCreatePermit(AsyncHelperTestCase):
+    @patch('server.helpers.async_parkingboss_api_helper.client.post', new_callable=AsyncMock)
+    async def test_cached_policy_success_flow(self, mock_post):
+        parkingboss_api_helper.policy_cache.set((self.location, self.tenant), self.policy_id)
+        mock_post.return_value = self.make_response({"permits": {"item": "returned_permit_id"}})
+
+        response = await async_parkingboss_api_helper.create_permit(license_plate="license_plate")
+
+        self.assertEqual("returned_permit_id", response)
+        form_data = mock_post.call_args.kwargs["data"]
+        self.assertEqual(self.policy_id, form_data["policy"])
+        self.assertNotIn("email", form_data)
+
+    @patch('server.helpers.async_parkingboss_api_helper.client.post', new_callable=AsyncMock)
+    async def test_requests_exception_flow(self, mock_post):
+        parkingboss_api_helper.policy_cache.set((self.location, self.tenant), self.policy_id)
+        mock_post.return_value = self.make_response({}, status_code=500)
+
+        with self.assertRaises(ExternalAPIError):
+            await async_parkingboss_api_helper.create_permit(license_plate="license_plate")
+
+    @patch('server.helpers.async_parkingboss_api_helper.client.post', new_callable=AsyncMock)
+    async def test_non_json_body_is_an_external_api_error(self, mock_post):
+        parkingboss_api_helper.policy_cache.set((self.location, self.tenant), self.policy_id)
+        mock_post.return_value = self.make_html_response()
+
+        with self.assertRaises(ExternalAPIError):
+            await async_parkingboss_api_helper.create_permit(license_plate="license_plate")
+
+    @patch('server.helpers.async_parkingboss_api_helper.client.post', new_callable=AsyncMock)
+    async def test_over_quota_rejected_before_any_request(self, mock_post):
+        ledger = UsageLedger(quota=10)
+        ledger.reconcile("9", fetch_started=0)
+
+        with patch('server.helpers.parkingboss_api_helper.usage_ledger', ledger):
+            with self.assertRaises(QuotaExceededError):
+                await async_parkingboss_api_helper.create_permit(license_plate="license_plate", duration="PT2H")
+
+        mock_post.assert_not_awaited()
+
+
+class TestAsyncDeletePermit(AsyncHelperTestCase):
+    @patch('server.helpers.async_parkingboss_api_helper.client.put', new_callable=AsyncMock)
+    async def test_success_flow(self, mock_put):
+        mock_put.return_value = self.make_response({})
+
+        response = await async_parkingboss_api_helper.delete_permit("permit_id")
+
+        self.assertEqual({"success": True, "permit_id": "permit_id"}, response)
+
+
+class TestGatherBounded(unittest.IsolatedAsyncioTestCase):
+    async def test_limits_calls_in_flight_and_keeps_order(self):
+        in_flight = 0
+        peak = 0
+
+        async def call(item):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            if item == 3:
+                raise ExternalAPIError()
+            return item * 10
+
+        outcomes = await async_parkingboss_api_helper.gather_bounded(range(6), call, 2)
+
+        self.assertEqual(2, peak)
+        self.assertEqual([0, 10, 20, None, 40, 50], [result for result, _ in outcomes])
+        self.assertIsInstance(outcomes[3][1], ExternalAPIError)
+
+
+if __name__ == '__main__':
+    unittest.main()
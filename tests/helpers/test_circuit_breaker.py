@@ -0,0 +1,61 @@
+import unittest
+from mock import patch
+
+from server.helpers import circuit_breaker
+from server.helpers.circuit_breaker import CircuitBreaker
+from server.helpers.error_handler import ExternalAPIError
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.breaker = CircuitBreaker('usage', failure_threshold=2, reset_seconds=30, half_open_probes=1)
+
+    def open(self):
+        self.breaker.before()
+        self.breaker.failure()
+        self.breaker.before()
+        self.breaker.failure()
+
+    def test_opens_after_failures_in_a_row(self):
+        self.breaker.failure()
+        self.breaker.success()
+        self.breaker.failure()
+        self.assertEqual(circuit_breaker.CLOSED, self.breaker.state)
+
+        self.breaker.failure()
+
+        self.assertEqual(circuit_breaker.OPEN, self.breaker.state)
+        with self.assertRaises(ExternalAPIError) as raised:
+            self.breaker.before()
+        self.assertEqual(503, raised.exception.status_code)
+
+    @patch('server.helpers.circuit_breaker.time.monotonic')
+    def test_half_open_probe_closes_on_success(self, mock_monotonic):
+        mock_monotonic.return_value = 100
+        self.open()
+        mock_monotonic.return_value = 131
+
+        self.breaker.before()
+        self.assertEqual(circuit_breaker.HALF_OPEN, self.breaker.state)
+        # Only one probe at a time
+        with self.assertRaises(ExternalAPIError):
+            self.breaker.before()
+        self.breaker.success()
+
+        self.assertEqual(circuit_breaker.CLOSED, self.breaker.state)
+        self.breaker.before()
+
+    @patch('server.helpers.circuit_breaker.time.monotonic')
+    def test_half_open_probe_reopens_on_failure(self, mock_monotonic):
+        mock_monotonic.return_value = 100
+        self.open()
+        mock_monotonic.return_value = 131
+        self.breaker.before()
+
+        self.breaker.failure()
+
+        self.assertEqual({'state': circuit_breaker.OPEN, 'failures': 3, 'retry_in': 30.0}, self.breaker.status())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import datetime
+import socket
+import threading
+import unittest
+from mock import patch
+
+from server import create_app
+from server.helpers import event_server, event_stream, permit_sync, tenants
+
+
+class TestEventServer(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        future = (datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=2)).isoformat()
+        permit_sync.reconcile([{"license_plate": "ABC123", "expiration": future, "id": "permit_id1"}])
+        self.port = event_server.EventServer().start(self.app, '127.0.0.1', 0)
+        self.broadcaster = event_stream.channel(tenants.registry.default()).broadcaster
+        self.clients = []
+
+    def tearDown(self):
+        for client in self.clients:
+            client.close()
+        self.app_context.pop()
+
+    def open(self, path):
+        client = socket.create_connection(('127.0.0.1', self.port), timeout=5)
+        client.sendall(f'GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode())
+        self.clients.append(client)
+        return client
+
+    def read_until(self, client, marker):
+        data = b''
+        while marker not in data:
+            chunk = client.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+        return data.decode()
+
+    def test_idle_streams_share_the_loop_thread(self):
+        threads = threading.active_count()
+        clients = [self.open('/permits/events') for _ in range(100)]
+        for client in clients:
+            self.assertIn('retry: 3000', self.read_until(client, b'retry: 3000\n\n'))
+
+        # The loop's thread and the executor that reads catch-ups, not one thread per stream
+        self.assertLess(threading.active_count() - threads, 40)
+        self.broadcaster.publish(None, [event_stream.format_event('usage', {'remaining': '5'})])
+        for client in clients:
+            self.assertIn('data: {"remaining":"5"}', self.read_until(client, b'\n\n'))
+
+    def test_stream_catches_up_from_since(self):
+        response = self.read_until(self.open('/permits/events?since=0'), b'event: permit')
+
+        self.assertTrue(response.startswith('HTTP/1.1 200 OK\r\n'))
+        self.assertIn('Content-Type: text/event-stream', response)
+        self.assertIn('Access-Control-Allow-Origin: *', response)
+        self.assertIn('event: permit', response)
+
+    def test_requests_it_cannot_serve(self):
+        self.assertIn('404 Not Found', self.read_until(self.open('/t/nobody/permits/events'), b'}'))
+        self.assertIn('400 Bad Request', self.read_until(self.open('/permits/events?since=x'), b'}'))
+        with patch.object(event_server.slots, 'limit', event_server.slots.open):
+            response = self.read_until(self.open('/permits/events'), b'}')
+        self.assertIn('503 Service Unavailable', response)
+        self.assertIn('Retry-After: 30', response)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import datetime
+import threading
+import unittest
+from mock import patch
+
+from server import create_app
+from server.cache import cache
+from server.helpers import event_stream, outbox, permit_sync, tenants
+from server.helpers.error_handler import QuotaExceededError
+
+
+class TestBroadcaster(unittest.TestCase):
+    def test_wait_wakes_on_publish(self):
+        broadcaster = event_stream.Broadcaster()
+        cursor = broadcaster.cursor()
+        threading.Timer(0.05, broadcaster.publish, args=(3, ['message'])).start()
+
+        cursor, messages = broadcaster.wait(cursor, timeout=5)
+
+        self.assertEqual([(3, 'message')], messages)
+        self.assertEqual((cursor, []), broadcaster.wait(cursor, timeout=0))
+
+    def test_client_behind_the_buffer_must_reset(self):
+        broadcaster = event_stream.Broadcaster(size=2)
+        broadcaster.publish(1, ['a', 'b', 'c'])
+
+        self.assertEqual((3, None), broadcaster.wait(0, timeout=0))
+
+    @patch.object(event_stream.thread_slots, 'limit', 1)
+    def test_join_is_capped_across_broadcasters(self):
+        broadcaster = event_stream.Broadcaster()
+
+        self.assertTrue(broadcaster.join())
+        self.assertFalse(broadcaster.join())
+        self.assertFalse(event_stream.Broadcaster().join())
+        broadcaster.leave()
+        self.assertTrue(broadcaster.join())
+        broadcaster.leave()
+
+
+class TestEventStream(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        cache.clear()
+        self.future = (datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=2)).isoformat()
+        permit_sync.reconcile([{"license_plate": "ABC123", "expiration": self.future, "id": "permit_id1"}])
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    @patch('server.helpers.permit_sync.syncer')
+    def test_poll_publishes_permit_changes(self, mock_syncer):
+        channel = event_stream.Channel()
+        broadcaster = channel.broadcaster
+        broadcaster.clients = 1
+        with patch.dict('server.helpers.event_stream._channels', {tenants.DEFAULT_KEY: channel}, clear=True):
+            event_stream.poll()
+            permit_sync.apply_deleted("permit_id1")
+            event_stream.poll()
+
+        _, messages = broadcaster.wait(0, timeout=0)
+        version, message = messages[0]
+        self.assertEqual(permit_sync.current_version(), version)
+        self.assertEqual(f'id: {version}\nevent: deleted\ndata: {{"id":"permit_id1"}}\n\n', message)
+
+
+    @patch('server.helpers.outbox.drainer')
+    @patch('server.helpers.outbox.parkingboss_api_helper.create_permit', side_effect=QuotaExceededError())
+    def test_poll_publishes_finished_operations(self, mock_create_permit, mock_drainer):
+        channel = event_stream.Channel()
+        channel.broadcaster.clients = 1
+        with patch.dict('server.helpers.event_stream._channels', {tenants.DEFAULT_KEY: channel}, clear=True):
+            event_stream.poll()
+            operation = outbox.enqueue_create("XYZ789", "PT1H")
+            outbox.drain()
+            event_stream.poll()
+
+        _, messages = channel.broadcaster.wait(0, timeout=0)
+        self.assertEqual(1, len(messages))
+        self.assertIn('event: operation', messages[0][1])
+        self.assertIn(f'"id":"{operation.operation_id}","kind":"create","state":"failed"', messages[0][1])
+
+    @patch('server.helpers.event_stream.EVENTS_MAX_STREAM_SECONDS', 0)
+    def test_stream_catches_up_from_a_version(self):
+        event_stream.channel(tenants.current()).broadcaster.join()
+
+        messages = list(event_stream.stream(0))
+
+        self.assertEqual('retry: 3000\n\n', messages[0])
+        self.assertIn('event: permit', messages[1])
+        self.assertIn('"license_plate":"ABC123"', messages[1])
+        self.assertEqual(2, len(messages))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+import asyncio
+import os
+import unittest
+import httpx
+import requests
+import urllib3
+from flask import g
+from mock import Mock, patch
+
+from server import create_app
+from server.helpers import circuit_breaker
+from server.helpers.error_handler import ExternalAPIError
+from server.helpers.http_client import AsyncParkingBossClient, ParkingBossClient
+
+
+class TestParkingBossClient(unittest.TestCase):
+    def test_session_is_reused(self):
+        client = ParkingBossClient()
+        self.assertIs(client.session, client.session)
+
+    def test_pool_and_retry_configuration(self):
+        client = ParkingBossClient(pool_connections=2, pool_maxsize=7, get_retries=3)
+        adapter = client.session.get_adapter('https://api.parkingboss.com')
+
+        self.assertEqual(7, adapter._pool_maxsize)
+        # Retries are driven by request(), against the deadline
+        self.assertEqual(0, adapter.max_retries.total)
+        self.assertEqual(3, client.get_retries)
+
+    def test_keep_alive_disabled_sends_connection_close(self):
+        client = ParkingBossClient(keep_alive=False)
+        self.assertEqual('close', client.session.headers['Connection'])
+
+    @patch('server.helpers.http_client.os.getpid')
+    def test_session_is_rebuilt_after_fork(self, mock_getpid):
+        client = ParkingBossClient()
+        mock_getpid.return_value = 1
+        parent_session = client.session
+        mock_getpid.return_value = 2
+
+        self.assertIsNot(parent_session, client.session)
+
+
+class TestAsyncParkingBossClient(unittest.TestCase):
+    def setUp(self):
+        circuit_breaker.reset()
+        self.client = AsyncParkingBossClient()
+        self.built = []
+
+        def build_client():
+            client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200)))
+            self.built.append(client)
+            return client
+        self.client._build_client = build_client
+
+    def tearDown(self):
+        self.client.close()
+        circuit_breaker.reset()
+
+    def test_one_client_serves_every_request_loop(self):
+        # Flask runs each async view on a new event loop.
+        for _ in range(3):
+            response = asyncio.run(self.client.get('https://api.parkingboss.com/v1/x', endpoint='usage'))
+            self.assertEqual(200, response.status_code)
+
+        self.assertEqual(1, len(self.built))
+        self.assertFalse(self.built[0].is_closed)
+
+    def test_close_closes_the_client(self):
+        asyncio.run(self.client.get('https://api.parkingboss.com/v1/x', endpoint='usage'))
+        self.client.close()
+
+        self.assertTrue(self.built[0].is_closed)
+
+
+class TestDeadlinesAndBreakers(unittest.TestCase):
+    def setUp(self):
+        circuit_breaker.reset()
+        self.app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
+        self.client = ParkingBossClient()
+        self.session = Mock()
+        self.session.request.return_value = Mock(status_code=200)
+        self.client._session = self.session
+        self.client._pid = os.getpid()
+
+    def tearDown(self):
+        circuit_breaker.reset()
+
+    @patch('server.helpers.deadline.UPSTREAM_TIMEOUT_SECONDS', 10)
+    def test_timeout_is_what_is_left_of_the_request_budget(self):
+        with self.app.test_request_context():
+            self.app.preprocess_request()
+            with patch('server.helpers.deadline.time.monotonic', return_value=g.deadline - 4):
+                self.client.get('https://api.parkingboss.com/v1/x', endpoint='usage')
+
+        self.assertEqual(4, self.session.request.call_args.kwargs['timeout'])
+
+    def test_spent_budget_fails_without_calling_upstream(self):
+        with self.app.test_request_context():
+            self.app.preprocess_request()
+            g.deadline = 0
+            with self.assertRaises(ExternalAPIError) as raised:
+                self.client.get('https://api.parkingboss.com/v1/x', endpoint='usage')
+
+        self.assertEqual(504, raised.exception.status_code)
+        self.session.request.assert_not_called()
+
+    def test_unreachable_upstream_fails_within_the_request_budget(self):
+        clock = [1000.0]
+        attempts = []
+
+        def connect_times_out(conn, method, url, timeout, **kwargs):
+            attempts.append(method)
+            clock[0] += timeout.connect_timeout
+            raise urllib3.exceptions.ConnectTimeoutError(conn, 'timed out')
+
+        client = ParkingBossClient()
+        with patch('server.helpers.deadline.time') as mock_time, \
+                patch('urllib3.connectionpool.HTTPConnectionPool._make_request', side_effect=connect_times_out):
+            mock_time.monotonic.side_effect = lambda: clock[0]
+            for method in ('GET', 'POST'):
+                started = clock[0]
+                with self.app.test_request_context():
+                    self.app.preprocess_request()
+                    with self.assertRaises(requests.ConnectionError):
+                        client.request(method, 'https://api.parkingboss.com/v1/x', endpoint=method)
+                self.assertLess(clock[0] - started, self.app.config['REQUEST_DEADLINE_SECONDS'])
+
+        # Connecting is not retried, so each call gets one attempt.
+        self.assertEqual(['GET', 'POST'], attempts)
+
+    @patch('server.helpers.http_client.time.sleep')
+    def test_only_gets_are_retried_with_what_is_left_of_the_budget(self, mock_sleep):
+        self.session.request.side_effect = [Mock(status_code=503), Mock(status_code=200), Mock(status_code=503)]
+        with self.app.test_request_context():
+            self.app.preprocess_request()
+            self.assertEqual(200, self.client.get('https://api.parkingboss.com/v1/x', endpoint='usage').status_code)
+            self.assertEqual(503, self.client.post('https://api.parkingboss.com/v1/y', endpoint='create').status_code)
+
+        self.assertEqual(3, self.session.request.call_count)
+        first, second = (call.kwargs['timeout'] for call in self.session.request.call_args_list[:2])
+        self.assertLessEqual(second, first)
+        mock_sleep.assert_called_once_with(self.client.retry_backoff)
+
+    def test_repeated_timeouts_open_the_endpoint_breaker(self):
+        self.session.request.side_effect = requests.Timeout()
+        for _ in range(circuit_breaker.CIRCUIT_FAILURE_THRESHOLD):
+            with self.assertRaises(requests.Timeout):
+                self.client.get('https://api.parkingboss.com/v1/x', endpoint='permits')
+
+        with self.assertRaises(ExternalAPIError):
+            self.client.get('https://api.parkingboss.com/v1/x', endpoint='permits')
+        self.assertEqual(circuit_breaker.CIRCUIT_FAILURE_THRESHOLD, self.session.request.call_count)
+        # Other endpoints are unaffected
+        self.session.request.side_effect = None
+        self.client.post('https://api.parkingboss.com/v1/y', endpoint='create')
+        self.assertEqual('open', circuit_breaker.states()['permits']['state'])
+
+
+if __name__ == '__main__':
+    unittest.main()
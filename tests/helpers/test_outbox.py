@@ -0,0 +1,143 @@
+import datetime
+import unittest
+from mock import patch
+from sqlalchemy import event
+
+from server import create_app
+from server.helpers import outbox, permit_sync
+from server.helpers.error_handler import ExternalAPIError, QuotaExceededError
+from server.models.database import db, Operation, Permit
+
+
+@patch('server.helpers.permit_sync.syncer')
+@patch('server.helpers.outbox.drainer')
+class TestOutbox(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.future = (datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=2)).isoformat()
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    @patch('server.helpers.outbox.parkingboss_api_helper.create_permit')
+    def test_create_is_sent_and_applied_to_the_mirror(self, mock_create_permit, mock_drainer, mock_syncer):
+        mock_create_permit.return_value = "permit_id1"
+        operation = outbox.enqueue_create("abc 123", "PT2H")
+        self.assertEqual(outbox.PENDING, operation.state)
+
+        outbox.drain()
+
+        mock_create_permit.assert_called_once_with(license_plate="abc 123", duration="PT2H")
+        operation = outbox.get(operation.operation_id)
+        self.assertEqual((outbox.DONE, "permit_id1", 1), (operation.state, operation.permit_id, operation.finished_seq))
+        self.assertEqual(["permit_id1"], [permit["id"] for permit in permit_sync.list_permits()])
+        self.assertEqual((1, [operation.to_dict()]), outbox.finished_since(0))
+
+    @patch('server.helpers.outbox.parkingboss_api_helper.create_permit')
+    def test_operations_on_a_plate_wait_for_earlier_ones(self, mock_create_permit, mock_drainer, mock_syncer):
+        mock_create_permit.side_effect = ExternalAPIError()
+        first = outbox.enqueue_create("ABC123", "PT1H")
+        second = outbox.enqueue_create("abc-123", "PT1H")
+        other = outbox.enqueue_create("XYZ789", "PT1H")
+
+        outbox.drain()
+
+        # Both heads were tried once; the second ABC123 create waits behind the first one's retry.
+        self.assertEqual(2, mock_create_permit.call_count)
+        self.assertEqual(1, outbox.get(first.operation_id).attempts)
+        self.assertEqual(0, outbox.get(second.operation_id).attempts)
+        self.assertEqual(outbox.PENDING, outbox.get(other.operation_id).state)
+
+        mock_create_permit.side_effect = None
+        mock_create_permit.return_value = "permit_id1"
+        db.session.query(Operation).update({Operation.next_attempt_at: permit_sync.utcnow()})
+        db.session.commit()
+        outbox.drain()
+        self.assertEqual([outbox.DONE] * 3, [outbox.get(operation.operation_id).state
+                                             for operation in (first, second, other)])
+        self.assertEqual("ABC123", mock_create_permit.call_args_list[2].kwargs["license_plate"])
+
+    @patch('server.helpers.outbox.OUTBOX_MAX_ATTEMPTS', 1)
+    @patch('server.helpers.outbox.parkingboss_api_helper.create_permit')
+    def test_failures_end_the_operation(self, mock_create_permit, mock_drainer, mock_syncer):
+        mock_create_permit.side_effect = [ExternalAPIError(), QuotaExceededError()]
+        exhausted = outbox.enqueue_create("ABC123", "PT1H")
+        over_quota = outbox.enqueue_create("XYZ789", "PT1H")
+
+        outbox.drain()
+
+        self.assertEqual(outbox.FAILED, outbox.get(exhausted.operation_id).state)
+        self.assertEqual('Monthly usage quota exceeded', outbox.get(over_quota.operation_id).error)
+
+    @patch('server.helpers.outbox.permit_sync.apply_created')
+    @patch('server.helpers.outbox.parkingboss_api_helper.create_permit')
+    def test_mirror_failure_never_sends_the_create_again(self, mock_create_permit, mock_apply_created,
+                                                         mock_drainer, mock_syncer):
+        mock_create_permit.return_value = "permit_id1"
+        mock_apply_created.side_effect = RuntimeError("disk I/O error")
+        operation = outbox.enqueue_create("ABC123", "PT1H")
+
+        outbox.drain()
+        outbox.requeue_stalled(permit_sync.utcnow() + datetime.timedelta(seconds=outbox.OUTBOX_CLAIM_TIMEOUT_SECONDS + 1))
+        outbox.drain()
+
+        mock_create_permit.assert_called_once()
+        operation = outbox.get(operation.operation_id)
+        self.assertEqual((outbox.DONE, "permit_id1"), (operation.state, operation.permit_id))
+
+    @patch('server.helpers.outbox.parkingboss_api_helper.create_permit')
+    def test_unexpected_errors_end_the_operation_without_a_retry(self, mock_create_permit, mock_drainer, mock_syncer):
+        mock_create_permit.side_effect = KeyError("id")
+        operation = outbox.enqueue_create("ABC123", "PT1H")
+
+        outbox.drain()
+        outbox.requeue_stalled(permit_sync.utcnow() + datetime.timedelta(seconds=outbox.OUTBOX_CLAIM_TIMEOUT_SECONDS + 1))
+        outbox.drain()
+
+        mock_create_permit.assert_called_once()
+        self.assertEqual(outbox.FAILED, outbox.get(operation.operation_id).state)
+
+    @patch('server.helpers.outbox.parkingboss_api_helper.delete_permit')
+    def test_delete_hides_the_permit_before_it_is_sent(self, mock_delete_permit, mock_drainer, mock_syncer):
+        permit_sync.reconcile([{"license_plate": "ABC123", "expiration": self.future, "id": "permit_id1"}])
+
+        operation = outbox.enqueue_delete("permit_id1")
+        self.assertEqual([], permit_sync.list_permits())
+        self.assertEqual("ABC123", operation.plate_key)
+        mock_delete_permit.assert_not_called()
+
+        outbox.drain()
+        mock_delete_permit.assert_called_once_with("permit_id1")
+        self.assertEqual(outbox.DONE, outbox.get(operation.operation_id).state)
+        self.assertTrue(Permit.query.filter_by(permit_id="permit_id1").one().deleted)
+
+    def test_operations_of_a_dead_worker_are_handed_out_again(self, mock_drainer, mock_syncer):
+        operation = outbox.enqueue_create("ABC123", "PT1H")
+        now = permit_sync.utcnow()
+        self.assertEqual(operation.id, outbox.claim_next(now).id)
+        self.assertIsNone(outbox.claim_next(now))
+
+        outbox.requeue_stalled(now + datetime.timedelta(seconds=outbox.OUTBOX_CLAIM_TIMEOUT_SECONDS + 1))
+
+        self.assertEqual(operation.id, outbox.claim_next(now).id)
+
+    def test_idle_outbox_is_drained_without_writes(self, mock_drainer, mock_syncer):
+        operation = outbox.enqueue_create("ABC123", "PT1H")
+        outbox.claim_next(permit_sync.utcnow())
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            outbox.drain()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+
+        # The one operation is running and not yet stalled: nothing to requeue or claim.
+        self.assertEqual(outbox.RUNNING, outbox.get(operation.operation_id).state)
+        self.assertEqual([], [statement for statement in statements if not statement.startswith('SELECT')])
+
+
+if __name__ == '__main__':
+    unittest.main()
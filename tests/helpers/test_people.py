@@ -0,0 +1,76 @@
+import os
+import tempfile
+import unittest
+
+from sqlalchemy import event, text
+
+from server import create_app
+from server.helpers import people
+from server.models.database import db
+
+
+class TestPeople(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    def count_queries(self, function):
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            result = function()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        return result, len(statements)
+
+    def test_listing_people_does_not_query_per_person(self):
+        people.create_people([{"name": f"Person {i}", "license_plates": [f"PLATE{i}A", f"PLATE{i}B"]} for i in range(20)])
+        db.session.expunge_all()
+
+        listed, queries = self.count_queries(lambda: people.list_people(limit=20))
+
+        self.assertEqual(2, queries)
+        self.assertEqual(["PLATE0A", "PLATE0B"], listed[0]["license_plates"])
+
+    def test_assigning_a_plate_moves_it_to_the_new_owner(self):
+        first, second = people.create_people([{"name": "Ann", "license_plates": ["ABC123"]}, {"name": "Bob"}])
+
+        people.assign_vehicles(second, ["ABC123", "XYZ789"])
+
+        self.assertEqual([], people.get_person(first)["license_plates"])
+        self.assertEqual(["ABC123", "XYZ789"], people.get_person(second)["license_plates"])
+        self.assertEqual("Bob", people.find_vehicle("ABC123").owner.name)
+
+    def test_plate_lookup_uses_an_index(self):
+        plan = db.session.execute(text("EXPLAIN QUERY PLAN SELECT * FROM car WHERE tenant = 'default' AND license_plate = 'ABC123'")).all()
+
+        self.assertIn('USING INDEX', ' '.join(row[-1] for row in plan))
+
+
+class TestSqliteSettings(unittest.TestCase):
+    def test_file_databases_use_wal_and_wait_for_locks(self):
+        with tempfile.TemporaryDirectory() as directory:
+            app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(directory, 'app.db')}",
+                              'SQLITE_BUSY_TIMEOUT_MS': 1234})
+            with app.app_context():
+                self.assertEqual('wal', db.session.execute(text('PRAGMA journal_mode')).scalar())
+                self.assertEqual(1234, db.session.execute(text('PRAGMA busy_timeout')).scalar())
+                self.assertEqual(10, db.engine.pool.size())
+                db.session.remove()
+                db.engine.dispose()
+
+    def test_startup_leaves_no_pooled_connection_for_forked_workers(self):
+        with tempfile.TemporaryDirectory() as directory:
+            app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(directory, 'app.db')}"})
+            with app.app_context():
+                self.assertEqual(0, db.engine.pool.checkedin())
+                db.engine.dispose()
+
+
+if __name__ == '__main__':
+    unittest.main()
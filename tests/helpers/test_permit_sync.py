@@ -0,0 +1,148 @@
+import datetime
+import unittest
+from mock import patch
+
+from server import create_app
+from server.cache import cache, permit_generation, permit_list_cache_key
+from server.helpers import permit_sync, tenants
+from server.models.database import Car, Permit
+
+
+class TestPermitSync(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        cache.clear()
+        self.future = (datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=2)).isoformat()
+        self.later = (datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=5)).isoformat()
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    def test_reconcile_adds_changes_and_removes(self):
+        permit_sync.reconcile([
+            {"license_plate": "ABC123", "expiration": self.future, "id": "permit_id1"},
+            {"license_plate": "XYZ789", "expiration": self.future, "id": "permit_id2"},
+        ])
+
+        counts = permit_sync.reconcile([
+            {"license_plate": "ABC123", "expiration": self.later, "id": "permit_id1"},
+            {"license_plate": "NEW111", "expiration": self.future, "id": "permit_id3"},
+        ])
+
+        self.assertEqual({"added": 1, "changed": 1, "removed": 1}, counts)
+        self.assertEqual(["permit_id3", "permit_id1"], [permit["id"] for permit in permit_sync.list_permits()])
+        self.assertEqual(3, Car.query.count())
+        self.assertIsNotNone(permit_sync.last_synced_at())
+
+    def test_reconcile_without_changes(self):
+        permits = [{"license_plate": "ABC123", "expiration": self.future, "id": "permit_id1"}]
+        permit_sync.reconcile(permits)
+
+        self.assertEqual({"added": 0, "changed": 0, "removed": 0}, permit_sync.reconcile(permits))
+
+    def test_iter_permits_sorts_and_pages(self):
+        permit_sync.reconcile([
+            {"license_plate": "BBB222", "expiration": self.future, "id": "permit_id1"},
+            {"license_plate": "AAA111", "expiration": self.later, "id": "permit_id2"},
+            {"license_plate": "CCC333", "expiration": self.later, "id": "permit_id3"},
+        ])
+
+        by_plate = [permit["license_plate"] for permit in permit_sync.iter_permits('plate', descending=True)]
+        second_page = [permit["id"] for permit in permit_sync.iter_permits('expires', offset=2, limit=2)]
+
+        self.assertEqual(["CCC333", "BBB222", "AAA111"], by_plate)
+        self.assertEqual(["permit_id3"], second_page)
+        self.assertEqual(3, permit_sync.count_permits())
+
+    def test_expired_permits_are_hidden(self):
+        past = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(minutes=1)).isoformat()
+        permit_sync.reconcile([{"license_plate": "ABC123", "expiration": past, "id": "permit_id1"}])
+
+        self.assertEqual([], permit_sync.list_permits())
+
+    @patch('server.helpers.permit_sync.syncer')
+    def test_local_create_survives_lagging_upstream(self, mock_syncer):
+        permit_sync.apply_created("permit_id1", "ABC123", "PT3H")
+        mock_syncer.wake.assert_called_once()
+
+        permit_sync.reconcile([])
+
+        self.assertEqual(["permit_id1"], [permit["id"] for permit in permit_sync.list_permits()])
+
+    @patch('server.helpers.permit_sync.syncer')
+    def test_local_delete_hides_permit_still_listed_upstream(self, mock_syncer):
+        permits = [{"license_plate": "ABC123", "expiration": self.future, "id": "permit_id1"}]
+        permit_sync.reconcile(permits)
+
+        permit_sync.apply_deleted("permit_id1")
+        permit_sync.reconcile(permits)
+        self.assertEqual([], permit_sync.list_permits())
+
+        # Confirmed: kept as a tombstone for delta clients.
+        permit_sync.reconcile([])
+        tombstone = Permit.query.filter_by(permit_id="permit_id1").one()
+        self.assertTrue(tombstone.deleted)
+        self.assertIsNone(tombstone.local_write_at)
+
+    @patch('server.helpers.permit_sync.syncer')
+    def test_changes_since(self, mock_syncer):
+        permit_sync.reconcile([
+            {"license_plate": "ABC123", "expiration": self.future, "id": "permit_id1"},
+            {"license_plate": "XYZ789", "expiration": self.future, "id": "permit_id2"},
+        ])
+        seen = permit_sync.current_version()
+
+        permit_sync.reconcile([
+            {"license_plate": "ABC123", "expiration": self.later, "id": "permit_id1"},
+            {"license_plate": "NEW111", "expiration": self.future, "id": "permit_id3"},
+        ])
+        permit_sync.apply_deleted("permit_id3")
+
+        version, changed, deleted, expired = permit_sync.changes_since(seen)
+        self.assertEqual(permit_sync.current_version(), version)
+        self.assertEqual(["permit_id1"], [permit["id"] for permit in changed])
+        self.assertEqual({"permit_id2", "permit_id3"}, set(deleted))
+        self.assertEqual([], expired)
+        self.assertEqual((version, [], [], []), permit_sync.changes_since(version))
+        self.assertIsNone(permit_sync.changes_since(version + 1))
+
+    def test_changes_since_purged_tombstones_starts_over(self):
+        permit_sync.reconcile([{"license_plate": "ABC123", "expiration": self.future, "id": "permit_id1"}])
+        seen = permit_sync.current_version()
+        permit_sync.reconcile([])
+
+        with patch('server.helpers.permit_sync.TOMBSTONE_RETENTION_SECONDS', -1):
+            permit_sync.reconcile([])
+
+        self.assertIsNone(permit_sync.changes_since(seen))
+        self.assertEqual(0, Permit.query.count())
+
+    @patch('server.helpers.permit_sync.parkingboss_api_helper.get_permits')
+    def test_sync_if_due(self, mock_get_permits):
+        mock_get_permits.return_value = [{"license_plate": "ABC123", "expiration": self.future, "id": "permit_id1"}]
+
+        permit_sync.sync_if_due()
+        permit_sync.sync_if_due()
+        mock_get_permits.assert_called_once()
+
+        permit_sync.mark_local_write(tenants.current())
+        permit_sync.sync_if_due()
+        self.assertEqual(2, mock_get_permits.call_count)
+
+    @patch('server.helpers.permit_sync.syncer')
+    def test_writes_bump_the_shared_permit_generation(self, mock_syncer):
+        tenant = permit_sync.parkingboss_api_helper.tenant_key()
+        key = permit_list_cache_key(tenant)
+
+        permit_sync.apply_created("permit_id1", "ABC123", "PT1H")
+        self.assertNotEqual(key, permit_list_cache_key(tenant))
+
+        generation = permit_generation(tenant)
+        permit_sync.reconcile([])
+        self.assertEqual(generation, permit_generation(tenant))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import datetime
+import unittest
+from mock import patch
+
+from server import create_app
+from server.helpers import people, permit_sync, plate_search
+
+
+class TestNormalizePlate(unittest.TestCase):
+    def test_case_and_punctuation_are_ignored(self):
+        self.assertEqual('ABC123', plate_search.normalize_plate(' abc-12 3 '))
+        self.assertEqual('', plate_search.normalize_plate('- .'))
+
+
+class TestPlateIndex(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.future = (datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=2)).isoformat()
+        permit_sync.reconcile([
+            {"license_plate": "abc 123", "expiration": self.future, "id": "permit_id1"},
+            {"license_plate": "XABC12", "expiration": self.future, "id": "permit_id2"},
+        ])
+        self.index = plate_search.PlateIndex()
+        self.index.refresh()
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    def plates(self, query, mode='partial'):
+        return [match['plate'] for match in self.index.search(query, mode)]
+
+    def test_exact_prefix_and_partial_matches(self):
+        self.assertEqual(['ABC123'], self.plates('Abc-123', 'exact'))
+        self.assertEqual(['ABC123'], self.plates('abc', 'prefix'))
+        self.assertEqual(['ABC123', 'XABC12'], self.plates('abc'))
+        self.assertEqual([], self.plates('ZZZ'))
+        self.assertEqual(['permit_id1'], [permit['id'] for permit in self.index.search('ABC123', 'exact')[0]['permits']])
+
+    @patch('server.helpers.permit_sync.syncer')
+    def test_index_follows_permit_and_vehicle_changes(self, mock_syncer):
+        permit_sync.apply_deleted("permit_id2")
+        people.create_people([{"name": "Ann", "license_plates": ["NEW 1"]}])
+        self.index.refresh()
+
+        match = self.index.search('XABC12', 'exact')[0]
+        self.assertFalse(match['valid'])
+        self.assertTrue(match['known_vehicle'])
+        self.assertEqual(['NEW1'], self.plates('new'))
+
+    def test_permits_past_their_expiry_are_not_valid(self):
+        later = permit_sync.utcnow() + datetime.timedelta(hours=3)
+
+        self.assertFalse(self.index.search('ABC123', 'exact', now=later)[0]['valid'])
+
+    def test_index_rebuilds_when_the_mirror_cannot_give_a_delta(self):
+        with patch('server.helpers.permit_sync.changes_since', return_value=None):
+            permit_sync.reconcile([{"license_plate": "QRS987", "expiration": self.future, "id": "permit_id3"}])
+            self.index.refresh()
+
+        self.assertEqual(['QRS987'], [match['plate'] for match in self.index.search('QRS', 'prefix')])
+        self.assertFalse(self.index.search('ABC123', 'exact')[0]['valid'])
+
+
+if __name__ == '__main__':
+    unittest.main()
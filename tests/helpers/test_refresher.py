@@ -0,0 +1,70 @@
+import unittest
+from mock import Mock, patch
+from flask import Flask
+
+from server.helpers import refresher
+from server.helpers.refresher import StaleWhileRevalidate
+
+
+class TestStaleWhileRevalidate(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.fetch = Mock(side_effect=["value1", "value2"])
+        self.entry = StaleWhileRevalidate('test', self.fetch, ttl=60, max_stale=600)
+        self.now = 1000.0
+        self.monotonic = patch('server.helpers.refresher.time.monotonic', side_effect=lambda: self.now).start()
+
+    def tearDown(self):
+        patch.stopall()
+        refresher.refreshers.remove(self.entry)
+        self.app_context.pop()
+
+    def test_first_get_fetches_in_foreground(self):
+        self.assertEqual("value1", self.entry.get())
+        self.assertEqual(0, self.entry.age())
+
+    @patch('server.helpers.refresher.refresher')
+    def test_expired_value_is_served_while_refresh_is_scheduled(self, mock_worker):
+        self.entry.get()
+        self.now += 120
+
+        self.assertEqual("value1", self.entry.get())
+        mock_worker.wake.assert_called_once()
+        self.fetch.assert_called_once()
+
+    def test_too_stale_value_is_refreshed_in_foreground(self):
+        self.entry.get()
+        self.now += 601
+
+        self.assertEqual("value2", self.entry.get())
+
+    def test_failed_refresh_keeps_last_good_value(self):
+        self.fetch.side_effect = ["value1", RuntimeError("upstream down")]
+        self.entry.get()
+        self.now += 601
+
+        self.assertEqual("value1", self.entry.get())
+
+    def test_failed_first_fetch_raises(self):
+        self.fetch.side_effect = RuntimeError("upstream down")
+
+        with self.assertRaises(RuntimeError):
+            self.entry.get()
+
+    def test_refresh_due_only_refreshes_entries_near_expiry(self):
+        self.entry.get()
+        self.now += 30
+        self.assertFalse(self.entry.due())
+        self.now += 25
+        self.assertTrue(self.entry.due())
+
+        refresher.refresh_due()
+
+        self.assertEqual(2, self.fetch.call_count)
+        self.assertEqual(0, self.entry.age())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import datetime
+import os
+import tempfile
+import unittest
+from mock import patch
+
+from server import create_app
+from server.helpers import permit_sync, renewals
+from server.helpers.error_handler import ExternalAPIError, QuotaExceededError
+from server.models.database import Permit, Renewal
+
+
+class TestLeaderLock(unittest.TestCase):
+    def test_only_one_holder_at_a_time(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'renewals.lock')
+            first, second = renewals.LeaderLock(path), renewals.LeaderLock(path)
+
+            self.assertTrue(first.acquire())
+            self.assertTrue(first.acquire())
+            self.assertFalse(second.acquire())
+            first.release()
+            self.assertTrue(second.acquire())
+            second.release()
+
+
+class TestNextBatch(unittest.TestCase):
+    @patch('server.helpers.renewals.RENEWAL_LEAD_SECONDS', 300)
+    @patch('server.helpers.renewals.RENEWAL_BATCH_WINDOW_SECONDS', 60)
+    def test_renewals_due_close_together_are_batched(self):
+        now = datetime.datetime(2024, 1, 1, 12, 0)
+        heap = [(now + datetime.timedelta(minutes=minutes), renewal_id)
+                for renewal_id, minutes in ((1, 4), (2, 4.5), (3, 30))]
+
+        self.assertEqual([1, 2], renewals.next_batch(heap, now))
+        self.assertEqual([], renewals.next_batch(heap, now))
+        self.assertEqual(1, len(heap))
+
+
+@patch('server.helpers.permit_sync.syncer')
+@patch('server.helpers.renewals.scheduler')
+class TestRenewals(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.directory = tempfile.TemporaryDirectory()
+        self.leader = renewals.LeaderLock(os.path.join(self.directory.name, 'renewals.lock'))
+        soon = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(minutes=2)
+        permit_sync.reconcile([{"license_plate": "ABC123", "expiration": soon.isoformat(), "id": "permit_id1"}])
+
+    def tearDown(self):
+        self.leader.release()
+        self.directory.cleanup()
+        self.app_context.pop()
+
+    def run_due(self):
+        with patch('server.helpers.renewals.leader', self.leader):
+            renewals.run_due()
+
+    @patch('server.helpers.renewals.parkingboss_api_helper.create_permit')
+    def test_permit_is_reissued_before_it_expires(self, mock_create_permit, mock_scheduler, mock_syncer):
+        mock_create_permit.return_value = "permit_id2"
+        renewals.enroll("permit_id1", hours=3)
+
+        self.run_due()
+
+        mock_create_permit.assert_called_once_with(license_plate="ABC123", duration="PT1H")
+        self.assertEqual("permit_id2", Renewal.query.one().permit_id)
+        self.assertIsNotNone(Permit.query.filter_by(permit_id="permit_id2").one_or_none())
+        # The new permit is not due yet.
+        self.run_due()
+        mock_create_permit.assert_called_once()
+
+    @patch('server.helpers.renewals.parkingboss_api_helper.create_permit')
+    def test_failed_renewals_are_retried_and_quota_stops_them(self, mock_create_permit, mock_scheduler, mock_syncer):
+        renewals.enroll("permit_id1", hours=3)
+
+        mock_create_permit.side_effect = ExternalAPIError()
+        self.run_due()
+        self.assertEqual("permit_id1", Renewal.query.one().permit_id)
+
+        mock_create_permit.side_effect = QuotaExceededError()
+        self.run_due()
+        self.assertEqual(0, Renewal.query.count())
+
+    def test_deleting_a_permit_stops_its_renewal(self, mock_scheduler, mock_syncer):
+        renewals.enroll("permit_id1")
+
+        permit_sync.apply_deleted("permit_id1")
+
+        self.assertEqual(0, Renewal.query.count())
+        self.assertIsNone(renewals.enroll("permit_id1"))
+
+    def test_lock_held_elsewhere_skips_the_run(self, mock_scheduler, mock_syncer):
+        renewals.enroll("permit_id1")
+        other = renewals.LeaderLock(self.leader.path)
+        self.assertTrue(other.acquire())
+
+        with patch('server.helpers.renewals.parkingboss_api_helper.create_permit') as mock_create_permit:
+            self.run_due()
+        other.release()
+
+        mock_create_permit.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
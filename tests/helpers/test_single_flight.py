@@ -0,0 +1,101 @@
+import asyncio
+import threading
+import time
+import unittest
+from mock import Mock
+
+from server.helpers.single_flight import SingleFlight
+
+
+class TestSingleFlight(unittest.TestCase):
+    def setUp(self):
+        self.flights = SingleFlight()
+
+    def test_concurrent_threads_share_one_call(self):
+        def slow_fetch():
+            time.sleep(0.05)
+            return ["permit"]
+        fetch = Mock(side_effect=slow_fetch)
+        results = []
+
+        threads = [threading.Thread(target=lambda: results.append(self.flights.do("permits", fetch))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        fetch.assert_called_once()
+        self.assertEqual([["permit"]] * 8, results)
+
+    def test_error_is_shared_and_not_cached(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def failing_fetch():
+            started.set()
+            release.wait()
+            raise RuntimeError("upstream down")
+        errors = []
+
+        def call():
+            try:
+                self.flights.do("permits", failing_fetch)
+            except RuntimeError as e:
+                errors.append(e)
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait()
+        follower = threading.Thread(target=call)
+        follower.start()
+        time.sleep(0.01)
+        release.set()
+        leader.join()
+        follower.join()
+
+        self.assertEqual(2, len(errors))
+        self.assertEqual("ok", self.flights.do("permits", lambda: "ok"))
+
+    def test_different_keys_do_not_coalesce(self):
+        fetch = Mock(return_value="value")
+        self.flights.do("permits", fetch)
+        self.flights.do("usage", fetch)
+        self.assertEqual(2, fetch.call_count)
+
+
+class TestSingleFlightAsync(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_tasks_share_one_call(self):
+        flights = SingleFlight()
+        calls = 0
+
+        async def fetch():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.02)
+            return "value"
+
+        results = await asyncio.gather(*(flights.do_async("permits", fetch) for _ in range(5)))
+
+        self.assertEqual(1, calls)
+        self.assertEqual(["value"] * 5, results)
+
+    async def test_async_caller_joins_threaded_call(self):
+        flights = SingleFlight()
+        started = threading.Event()
+
+        def slow_fetch():
+            started.set()
+            time.sleep(0.05)
+            return "from thread"
+        thread = threading.Thread(target=flights.do, args=("permits", slow_fetch))
+        thread.start()
+        started.wait()
+
+        async def never_called():
+            raise AssertionError("should have joined the threaded call")
+
+        self.assertEqual("from thread", await flights.do_async("permits", never_called))
+        thread.join()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import datetime
+import unittest
+from mock import patch
+
+from server import create_app
+from server.helpers import parkingboss_api_helper, permit_sync, tenants
+
+CONFIGS = {"unit-12": {"location_id": "LOCATION2", "tenant": "12", "password": "PW", "monthly_usage_quota": 10}}
+
+
+class TestTenantRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = tenants.TenantRegistry(CONFIGS)
+
+    def test_tenants_are_built_once_and_unknown_keys_are_none(self):
+        tenant = self.registry.get("unit-12")
+
+        self.assertIs(tenant, self.registry.get("unit-12"))
+        self.assertEqual("LOCATION2:12", tenant.cache_key)
+        self.assertIsNot(tenant.usage_ledger, parkingboss_api_helper.usage_ledger)
+        self.assertIsNone(self.registry.get("unit-99"))
+        self.assertEqual(["default", "unit-12"], self.registry.keys())
+
+    def test_default_tenant_follows_the_environment_settings(self):
+        default = self.registry.default()
+
+        with patch('server.helpers.parkingboss_api_helper.LOCATION_ID', 'ELSEWHERE'):
+            self.assertEqual('ELSEWHERE', default.location_id)
+        self.assertIs(parkingboss_api_helper.usage_ledger, default.usage_ledger)
+
+    @patch('server.helpers.tenants.TENANT_IDLE_SECONDS', 60)
+    @patch('server.helpers.tenants.time.monotonic')
+    def test_only_recently_used_tenants_are_active(self, mock_monotonic):
+        tenant = self.registry.get("unit-12")
+        mock_monotonic.return_value = 1000
+        self.assertEqual([], self.registry.active())
+
+        tenant.touch()
+        self.assertEqual([tenant], self.registry.active())
+
+        mock_monotonic.return_value = 1061
+        self.assertEqual([], self.registry.active())
+        self.assertFalse(tenant.usage_refresher.due())
+
+
+class TestTenantScope(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.registry = tenants.TenantRegistry(CONFIGS)
+        self.future = (datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=2)).isoformat()
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    def test_scope_sets_and_restores_the_current_tenant(self):
+        tenant = self.registry.get("unit-12")
+
+        with tenants.scope(tenant):
+            self.assertIs(tenant, tenants.current())
+        self.assertEqual(tenants.DEFAULT_KEY, tenants.current().key)
+
+    def test_permit_mirrors_are_kept_apart(self):
+        permit_sync.reconcile([{"license_plate": "ABC123", "expiration": self.future, "id": "permit_id1"}])
+        with tenants.scope(self.registry.get("unit-12")):
+            permit_sync.reconcile([{"license_plate": "XYZ789", "expiration": self.future, "id": "permit_id2"}])
+            self.assertEqual(["XYZ789"], [permit["license_plate"] for permit in permit_sync.list_permits()])
+            self.assertEqual(1, permit_sync.current_version())
+
+        self.assertEqual(["ABC123"], [permit["license_plate"] for permit in permit_sync.list_permits()])
+        self.assertEqual(1, permit_sync.current_version())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import threading
+import time
+import unittest
+from mock import Mock
+
+from server.helpers.token_manager import TokenManager
+
+
+class TestTokenManager(unittest.TestCase):
+    def setUp(self):
+        self.auth_data = {"tenant_id": "12345", "bearer": "token1"}
+        self.fetch = Mock(return_value=self.auth_data)
+
+    def test_token_is_cached(self):
+        manager = TokenManager(self.fetch, ttl=60, refresh_margin=5)
+
+        self.assertEqual(self.auth_data, manager.get())
+        self.assertEqual(self.auth_data, manager.get())
+        self.fetch.assert_called_once()
+
+    def test_token_is_refreshed_inside_margin(self):
+        manager = TokenManager(self.fetch, ttl=1, refresh_margin=5)
+
+        manager.get()
+        manager.get()
+
+        self.assertEqual(2, self.fetch.call_count)
+
+    def test_invalidate_only_matching_bearer(self):
+        manager = TokenManager(self.fetch, ttl=60, refresh_margin=5)
+        manager.get()
+
+        manager.invalidate("some_other_token")
+        manager.get()
+        self.fetch.assert_called_once()
+
+        manager.invalidate("token1")
+        manager.get()
+        self.assertEqual(2, self.fetch.call_count)
+
+    def test_concurrent_callers_share_one_refresh(self):
+        def slow_fetch():
+            time.sleep(0.05)
+            return self.auth_data
+        fetch = Mock(side_effect=slow_fetch)
+        manager = TokenManager(fetch, ttl=60, refresh_margin=5)
+
+        threads = [threading.Thread(target=manager.get) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        fetch.assert_called_once()
+
+    def test_fetch_error_is_not_cached(self):
+        self.fetch.side_effect = [RuntimeError("boom"), self.auth_data]
+        manager = TokenManager(self.fetch, ttl=60, refresh_margin=5)
+
+        with self.assertRaises(RuntimeError):
+            manager.get()
+        self.assertEqual(self.auth_data, manager.get())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+import unittest
+from mock import patch
+
+from server.helpers.ttl_cache import TTLCache
+
+
+class TestTTLCache(unittest.TestCase):
+    @patch('server.helpers.ttl_cache.time.monotonic')
+    def test_entries_expire(self, mock_monotonic):
+        cache = TTLCache(ttl=10)
+        mock_monotonic.return_value = 100
+        cache.set("key", "value")
+
+        mock_monotonic.return_value = 109
+        self.assertEqual("value", cache.get("key"))
+        mock_monotonic.return_value = 110
+        self.assertIsNone(cache.get("key"))
+
+    def test_delete_and_clear(self):
+        cache = TTLCache(ttl=10)
+        cache.set("a", 1)
+        cache.set("b", 2)
+
+        cache.delete("a")
+        self.assertIsNone(cache.get("a"))
+        cache.clear()
+        self.assertIsNone(cache.get("b"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+from decimal import Decimal
+from mock import patch
+
+from server.helpers.error_handler import QuotaExceededError
+from server.helpers.usage_ledger import UsageLedger
+
+
+class TestUsageLedger(unittest.TestCase):
+    def test_unknown_until_first_reconcile(self):
+        ledger = UsageLedger(quota=10)
+
+        ledger.reserve(50)
+
+        self.assertIsNone(ledger.remaining())
+
+    def test_counts_issued_permits_and_rejects_over_quota(self):
+        ledger = UsageLedger(quota=10)
+        ledger.reconcile("6", fetch_started=0)
+
+        ledger.reserve(3)
+
+        self.assertEqual(Decimal("1.00"), ledger.remaining())
+        with self.assertRaises(QuotaExceededError) as e:
+            ledger.reserve(2)
+        self.assertEqual(403, e.exception.status_code)
+
+    def test_failed_create_releases_its_hours(self):
+        ledger = UsageLedger(quota=10)
+        ledger.reconcile("6", fetch_started=0)
+
+        with self.assertRaises(RuntimeError):
+            with ledger.reserving(4):
+                raise RuntimeError("upstream failed")
+
+        self.assertEqual(Decimal("4.00"), ledger.remaining())
+
+    @patch('server.helpers.usage_ledger.time.monotonic')
+    def test_reconcile_drops_permits_upstream_already_counts(self, mock_monotonic):
+        ledger = UsageLedger(quota=10)
+        ledger.reconcile("2", fetch_started=0)
+        mock_monotonic.return_value = 100
+        with ledger.reserving(1):
+            pass
+        with ledger.reserving(2):
+            pass
+        pending = ledger.reserve(3)
+
+        # Upstream now counts the two confirmed permits; the pending one stays on top.
+        ledger.reconcile("5", fetch_started=150)
+
+        self.assertEqual(Decimal("8.00"), ledger.used())
+        ledger.release(pending)
+        self.assertEqual(Decimal("5.00"), ledger.used())
+
+
+if __name__ == '__main__':
+    unittest.main()
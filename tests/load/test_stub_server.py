@@ -0,0 +1,57 @@
+import unittest
+
+from loadtest.driver import percentile, Results
+from loadtest.stub_server import create_stub_app, TENANT_ID
+
+
+class TestStubServer(unittest.TestCase):
+    def setUp(self):
+        self.app = create_stub_app(latency_ms=0, jitter_ms=0, error_rate=0, permits=3)
+        self.client = self.app.test_client()
+
+    def test_permit_lifecycle(self):
+        token = self.client.post('/v1/accounts/auth/tokens').get_json()
+        self.assertEqual(TENANT_ID, token['accounts']['item'])
+
+        created = self.client.post('/v1/permits/temporary', data={'vehicle': 'ABC123', 'duration': 'PT2H'}).get_json()
+        permit_id = created['permits']['item']
+        listed = self.client.get(f'/v1/locations/LOC/tenants/{TENANT_ID}/permits').get_json()
+        self.assertEqual(4, len(listed['permits']['items']))
+        vehicle_id = listed['permits']['items'][permit_id]['vehicle']
+        self.assertEqual('ABC123', listed['vehicles']['items'][vehicle_id]['display'])
+
+        self.assertEqual(200, self.client.put(f'/v1/permits/{permit_id}/expires').status_code)
+        self.assertEqual(404, self.client.put(f'/v1/permits/{permit_id}/expires').status_code)
+
+    def test_usage_payload_matches_helper_parser(self):
+        from server.helpers.parkingboss_api_helper import parse_usage_and_policy_id
+        payload = self.client.get(f'/v1/locations/LOC/tenants/{TENANT_ID}/permits/temporary/usage').get_json()
+
+        self.assertEqual('stub-policy', parse_usage_and_policy_id(payload)['policy_id'])
+
+    def test_injected_errors(self):
+        client = create_stub_app(latency_ms=0, jitter_ms=0, error_rate=1, permits=0).test_client()
+        self.assertEqual(503, client.post('/v1/accounts/auth/tokens').status_code)
+
+
+class TestDriverResults(unittest.TestCase):
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(50, percentile(values, 0.50))
+        self.assertEqual(99, percentile(values, 0.99))
+        self.assertEqual(0.0, percentile([], 0.5))
+
+    def test_summary(self):
+        results = Results()
+        results.record('GET /', 0.010, True)
+        results.record('GET /', 0.030, False)
+
+        rows = results.summary(elapsed=2)
+
+        self.assertEqual({'route': 'GET /', 'requests': 2, 'errors': 1, 'rps': 1.0,
+                          'p50_ms': 10.0, 'p95_ms': 30.0, 'p99_ms': 30.0}, rows[0])
+        self.assertEqual('total', rows[-1]['route'])
+
+
+if __name__ == '__main__':
+    unittest.main()
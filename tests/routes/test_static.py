@@ -0,0 +1,39 @@
+import unittest
+from server import create_app
+from server.helpers import circuit_breaker
+
+
+class TestStaticRoutes(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
+        self.client = self.app.test_client()
+
+    def test_static_files_are_cacheable(self):
+        response = self.client.get('/robots.txt')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('public', response.headers['Cache-Control'])
+        self.assertIn(f'max-age={7 * 24 * 60 * 60}', response.headers['Cache-Control'])
+        response.close()
+
+    def test_health_is_never_stored(self):
+        response = self.client.get('/health')
+
+        self.assertEqual(response.get_json(), {"status": "UP"})
+        self.assertIn('no-store', response.headers['Cache-Control'])
+
+    def test_upstream_health_reports_open_breakers(self):
+        circuit_breaker.reset()
+        breaker = circuit_breaker.breaker('permits')
+        for _ in range(breaker.failure_threshold):
+            breaker.failure()
+
+        body = self.client.get('/health/upstream').get_json()
+        circuit_breaker.reset()
+
+        self.assertEqual('DEGRADED', body['status'])
+        self.assertEqual('open', body['breakers']['permits']['state'])
+
+
+if __name__ == '__main__':
+    unittest.main()
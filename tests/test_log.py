@@ -0,0 +1,85 @@
+import logging
+import os
+import queue
+import unittest
+import requests
+from mock import Mock, patch
+
+from server import log
+from server.helpers import tenants
+
+
+class TestLog(unittest.TestCase):
+    @patch.dict(os.environ, {'TENANT_PW': 'hunter2'})
+    def test_redact_password_and_tokens(self):
+        message = log.redact("params: {'password': 'hunter2', 'Authorization': 'bearer abc.def'} token=xyz")
+
+        self.assertNotIn('hunter2', message)
+        self.assertNotIn('abc.def', message)
+        self.assertNotIn('xyz', message)
+        self.assertIn("'Authorization': 'bearer ***'", message)
+
+    def test_redact_secrets_in_an_upstream_error_url(self):
+        request = requests.Request('GET', 'https://api.parkingboss.com/v1/accounts/auth/tokens', params={
+            'viewpoint': 'now', 'Authorization': 'bearer abc.def-SECRET', 'password': 'p@ss w,rd'}).prepare()
+        response = requests.Response()
+        response.status_code, response.reason, response.url = 401, 'Unauthorized', request.url
+        with self.assertRaises(requests.HTTPError) as raised:
+            response.raise_for_status()
+
+        message = log.redact('Error with API request: %s' % raised.exception)
+
+        self.assertNotIn('SECRET', message)
+        self.assertNotIn('p%40ss', message)
+        self.assertIn('viewpoint=now&Authorization=***&password=***', message)
+
+    def test_redact_whole_quoted_values(self):
+        message = log.redact("params: {'password': 'p@ss w,rd', \"token\": \"a b\"}")
+
+        self.assertEqual("params: {'password': '***', \"token\": \"***\"}", message)
+
+    def test_redact_registered_tenant_passwords(self):
+        tenants.TenantRegistry({'unit-12': {'location_id': 'l', 'tenant': '12', 'password': 'tenant 12 pw'}})
+
+        message = log.redact('Logging in with tenant 12 pw, encoded tenant+12+pw')
+
+        self.assertEqual('Logging in with ***, encoded ***', message)
+
+    @patch.dict(os.environ, {'TENANT_PW': 'hunter2'})
+    def test_queue_handler_formats_and_redacts_once(self):
+        records = queue.SimpleQueue()
+        handler = log.RedactingQueueHandler(records)
+        logger = logging.getLogger('tests.log')
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+
+        logger.warning('Calling POST with params: %s', {'password': 'hunter2'})
+
+        record = records.get_nowait()
+        self.assertEqual("Calling POST with params: {'password': '***'}", record.msg)
+        self.assertIsNone(record.args)
+
+    def test_payload_is_sampled(self):
+        logger = Mock()
+        logger.isEnabledFor.return_value = True
+
+        with patch('server.log.LOG_PAYLOAD_SAMPLE_RATE', 0):
+            log.payload(logger, 'Calling GET to: %s', 'url')
+        logger.debug.assert_not_called()
+
+        with patch('server.log.LOG_PAYLOAD_SAMPLE_RATE', 1):
+            log.payload(logger, 'Calling GET to: %s', 'url')
+        logger.debug.assert_called_once_with('Calling GET to: %s', 'url')
+
+    def test_payload_skipped_when_debug_disabled(self):
+        logger = Mock()
+        logger.isEnabledFor.return_value = False
+
+        with patch('server.log.LOG_PAYLOAD_SAMPLE_RATE', 1):
+            log.payload(logger, 'Calling GET to: %s', 'url')
+
+        logger.debug.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
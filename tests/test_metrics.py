@@ -0,0 +1,97 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import unittest
+from mock import patch
+
+from server import metrics
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.metrics_dir = tempfile.mkdtemp()
+        patch('server.metrics.METRICS_DIR', self.metrics_dir).start()
+        self.before = metrics.snapshot()
+
+    def tearDown(self):
+        patch.stopall()
+
+    def delta(self, name, labels):
+        counters, _ = metrics.snapshot()
+        return counters.get((name, labels), 0) - self.before[0].get((name, labels), 0)
+
+    def test_counters_merge_across_threads(self):
+        labels = (('result', 'hit'),)
+        threads = [threading.Thread(target=lambda: [metrics.inc('cache_requests_total', labels) for _ in range(100)])
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(400, self.delta('cache_requests_total', labels))
+
+    def test_exited_threads_keep_their_counts_but_not_their_shards(self):
+        labels = (('result', 'miss'),)
+        shards_before = len(metrics._shards)
+        for _ in range(50):
+            thread = threading.Thread(target=metrics.inc, args=('cache_requests_total', labels))
+            thread.start()
+            thread.join()
+
+        self.assertEqual(shards_before, len(metrics._shards))
+        self.assertEqual(50, self.delta('cache_requests_total', labels))
+
+    def test_timed_upstream_records_latency_and_errors(self):
+        labels = (('operation', 'test_op'),)
+
+        @metrics.timed_upstream('test_op')
+        def failing():
+            raise RuntimeError("boom")
+
+        @metrics.timed_upstream('test_op')
+        async def succeeding():
+            return "ok"
+
+        with self.assertRaises(RuntimeError):
+            failing()
+        self.assertEqual("ok", asyncio.run(succeeding()))
+
+        _, histograms = metrics.snapshot()
+        self.assertEqual(2, histograms[('parkingboss_upstream_seconds', labels)][-1])
+        self.assertEqual(1, self.delta('parkingboss_upstream_errors_total', labels))
+
+    def test_collect_sums_worker_files_and_keeps_the_counts_of_dead_workers(self):
+        name = ('cache_requests_total', (('result', 'miss'),))
+        key = metrics.encode_key(name)
+        histogram = metrics.encode_key(('http_request_seconds', (('endpoint', 'home'),)))
+        for pid, value in ((os.getpid(), 2), (999999999, 5), (1, 3)):
+            with open(os.path.join(self.metrics_dir, f'{pid}.json'), 'w') as f:
+                json.dump({'counters': {key: value}, 'histograms': {histogram: [value, 0.5, value]}}, f)
+
+        counters, histograms = metrics.collect()
+
+        self.assertEqual(10, counters[name])
+        self.assertEqual([10, 1.5, 10], histograms[('http_request_seconds', (('endpoint', 'home'),))])
+        self.assertFalse(os.path.exists(os.path.join(self.metrics_dir, '999999999.json')))
+        # Folded into the retired totals once, not again on the next scrape
+        self.assertEqual(10, metrics.collect()[0][name])
+
+    def test_render_histogram(self):
+        values = [0] * (len(metrics.BUCKETS) + 1) + [0.0, 0]
+        values[1] = 2
+        values[-2] = 0.006
+        values[-1] = 2
+
+        text = metrics.render({}, {('http_request_seconds', (('endpoint', 'home'),)): values})
+
+        self.assertIn('# TYPE http_request_seconds histogram', text)
+        self.assertIn('http_request_seconds_bucket{endpoint="home",le="0.001"} 0', text)
+        self.assertIn('http_request_seconds_bucket{endpoint="home",le="+Inf"} 2', text)
+        self.assertIn('http_request_seconds_count{endpoint="home"} 2', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+from mock import patch
+
+import serving
+
+
+class TestServingProfiles(unittest.TestCase):
+    @patch.dict('os.environ', {}, clear=True)
+    def test_workers_follow_cpus(self):
+        self.assertEqual(9, serving.worker_count('sync', cpus=4))
+        self.assertEqual(5, serving.worker_count('gthread', cpus=4))
+
+    @patch.dict('os.environ', {'WEB_CONCURRENCY': '3'})
+    def test_web_concurrency_overrides_worker_count(self):
+        self.assertEqual(3, serving.worker_count('sync', cpus=4))
+
+    @patch.dict('os.environ', {}, clear=True)
+    def test_gthread_command(self):
+        args = serving.gunicorn_args('gthread', '0.0.0.0', 5000, cpus=2)
+
+        self.assertEqual('server:create_app()', args[-1])
+        self.assertIn('--preload', args)
+        for flag, value in (('--worker-class', 'gthread'), ('--workers', '3'), ('--threads', '8'),
+                            ('--keep-alive', '5'), ('--bind', '0.0.0.0:5000')):
+            self.assertEqual(value, args[args.index(flag) + 1])
+
+    @patch.dict('os.environ', {}, clear=True)
+    def test_workers_learn_their_thread_count_and_events_port(self):
+        for profile, threads in (('sync', '1'), ('gthread', '8')):
+            args = serving.gunicorn_args(profile, '0.0.0.0', 5000, cpus=2)
+            env = [args[i + 1] for i, arg in enumerate(args) if arg == '--env']
+            self.assertEqual(['EVENTS_PORT=5001', f'WORKER_THREADS={threads}'], sorted(env))
+
+    @patch.dict('os.environ', {'EVENTS_PORT': '7000'})
+    def test_events_port_can_be_set(self):
+        self.assertEqual(7000, serving.events_port(5000))
+
+
+if __name__ == '__main__':
+    unittest.main()
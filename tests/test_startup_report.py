@@ -0,0 +1,30 @@
+import unittest
+
+import startup_report
+
+IMPORTTIME = """import time: self [us] | cumulative | imported package
+import time:       120 |        120 |     sqlalchemy.util
+import time:       300 |        420 |   sqlalchemy
+import time:        50 |         50 |     server.cache
+import time:        80 |        550 |   server
+"""
+
+
+class TestStartupReport(unittest.TestCase):
+    def test_server_modules_stay_separate_and_packages_are_summed(self):
+        imports = startup_report.group(startup_report.parse_importtime(IMPORTTIME))
+
+        self.assertEqual([('sqlalchemy', 420), ('server', 80), ('server.cache', 50)], imports)
+
+    def test_reports_create_app_phases(self):
+        timings, imports = startup_report.measure()
+
+        self.assertEqual({'config', 'database', 'cache', 'blueprints', 'logging'}, set(timings['phases']))
+        self.assertIn('server.helpers.permit_sync', dict(imports))
+        # Deferred until the first upstream call
+        self.assertNotIn('requests', dict(imports))
+        self.assertNotIn('httpx', dict(imports))
+
+
+if __name__ == '__main__':
+    unittest.main()
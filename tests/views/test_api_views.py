@@ -0,0 +1,94 @@
+import unittest
+from mock import AsyncMock, patch
+from server import create_app
+from server.cache import cache
+from server.helpers import people, permit_sync, plate_search, tenants
+
+
+class TestApiViews(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            cache.clear()
+        self.permits = [
+            {"license_plate": "ABC123", "expiration": "2999-01-01T00:00:00-08:00", "id": "permit_id1"},
+            {"license_plate": "XYZ789", "expiration": "2999-01-02T00:00:00-08:00", "id": "permit_id2"},
+        ]
+
+    @patch('server.views.permit_views.parkingboss_api_helper.get_permits', new_callable=AsyncMock)
+    def test_list_permits_with_selected_fields(self, mock_get_permits):
+        mock_get_permits.return_value = self.permits
+
+        response = self.client.get('/api/permits?fields=id,license_plate&sort=plate&order=desc')
+
+        body = response.get_json()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([{"id": "permit_id2", "license_plate": "XYZ789"}, {"id": "permit_id1", "license_plate": "ABC123"}],
+                         body['permits'])
+        self.assertEqual(2, body['total'])
+        self.assertEqual(304, self.client.get('/api/permits', headers={'If-None-Match': response.headers['ETag']}).status_code)
+
+    def test_list_permits_rejects_unknown_fields(self):
+        self.assertEqual(self.client.get('/api/permits?fields=id,owner').status_code, 400)
+
+    @patch('server.views.permit_views.parkingboss_api_helper.get_permits', new_callable=AsyncMock)
+    def test_changes_since_version(self, mock_get_permits):
+        mock_get_permits.return_value = self.permits
+        version = self.client.get('/api/permits').get_json()['version']
+        with self.app.app_context():
+            permit_sync.apply_deleted("permit_id2")
+
+        body = self.client.get(f'/api/permits/changes?since={version}').get_json()
+
+        self.assertFalse(body['reset'])
+        self.assertEqual([], body['changed'])
+        self.assertEqual(["permit_id2"], body['deleted'])
+        self.assertEqual([], body['expired'])
+        self.assertGreater(body['version'], version)
+
+    @patch('server.views.permit_views.parkingboss_api_helper.get_permits', new_callable=AsyncMock)
+    def test_changes_from_unknown_version_resets(self, mock_get_permits):
+        mock_get_permits.return_value = self.permits
+
+        body = self.client.get('/api/permits/changes?since=1000&fields=id').get_json()
+
+        self.assertTrue(body['reset'])
+        self.assertEqual([{"id": "permit_id1"}, {"id": "permit_id2"}], body['permits'])
+
+    def test_changes_requires_since(self):
+        self.assertEqual(self.client.get('/api/permits/changes').status_code, 400)
+
+
+    @patch('server.views.permit_views.parkingboss_api_helper.get_permits', new_callable=AsyncMock)
+    def test_search_plates(self, mock_get_permits):
+        mock_get_permits.return_value = self.permits
+        plate_search._indexes.clear()
+
+        body = self.client.get('/api/plates/search?q=abc-1').get_json()
+
+        self.assertEqual('ABC1', body['query'])
+        self.assertEqual(['ABC123'], [match['plate'] for match in body['matches']])
+        self.assertTrue(body['matches'][0]['valid'])
+        self.assertEqual(self.client.get('/api/plates/search?q=abc&mode=fuzzy').status_code, 400)
+        self.assertEqual(self.client.get('/api/plates/search?q=--').status_code, 400)
+
+
+    @patch('server.views.permit_views.parkingboss_api_helper.get_permits', new_callable=AsyncMock)
+    def test_search_plates_sees_only_the_tenants_own_plates(self, mock_get_permits):
+        mock_get_permits.return_value = []
+        plate_search._indexes.clear()
+        registry = tenants.TenantRegistry({"unit-12": {"location_id": "LOCATION2", "tenant": "12", "password": "PW"}})
+        with self.app.app_context():
+            people.create_people([{"name": "Ann", "license_plates": ["SECRET1"]}])
+
+        with patch('server.helpers.tenants.registry', registry):
+            own = self.client.get('/api/plates/search?q=SEC').get_json()
+            other = self.client.get('/t/unit-12/api/plates/search?q=SEC').get_json()
+
+        self.assertEqual(['SECRET1'], [match['plate'] for match in own['matches']])
+        self.assertEqual([], other['matches'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,27 @@
+import tempfile
+import unittest
+from mock import patch
+from server import create_app
+
+
+class TestMetricsViews(unittest.TestCase):
+    def setUp(self):
+        patch('server.metrics.METRICS_DIR', tempfile.mkdtemp()).start()
+        self.app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        patch.stopall()
+
+    def test_metrics_include_route_timings(self):
+        self.client.get('/permits/hello')
+
+        response = self.client.get('/metrics')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('http_request_seconds_count{endpoint="permits.hello_person",method="GET",status="200"}',
+                      response.data.decode())
+
+
+if __name__ == '__main__':
+    unittest.main()
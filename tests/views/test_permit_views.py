@@ -1,15 +1,177 @@
 import unittest
+from mock import AsyncMock, patch
 from server import create_app
+from server.cache import cache
+from server.helpers import permit_sync, tenants
+from server.helpers.error_handler import ExternalAPIError
 
 class TestPermitViews(unittest.TestCase):
     def setUp(self):
-        self.app = create_app()
+        self.app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
         self.client = self.app.test_client()
+        with self.app.app_context():
+            cache.clear()
 
     def test_hello_person(self):
         response = self.client.get('/permits/hello')
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.data.decode(), 'Hello, World! This is the permits view.')
 
+    @patch('server.views.permit_views.parkingboss_api_helper.get_permits', new_callable=AsyncMock)
+    def test_list_permits_is_cached(self, mock_get_permits):
+        mock_get_permits.return_value = [{"license_plate": "ABC123", "expiration": "2999-01-01T00:00:00-08:00", "id": "permit_id1"}]
+
+        first = self.client.get('/permits')
+        second = self.client.get('/permits')
+
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('ABC123', first.data.decode())
+        self.assertEqual(first.data, second.data)
+        mock_get_permits.assert_awaited_once()
+
+    @patch('server.views.permit_views.parkingboss_api_helper.get_permits', new_callable=AsyncMock)
+    def test_list_permits_pages_and_sorts(self, mock_get_permits):
+        mock_get_permits.return_value = [
+            {"license_plate": f"PLATE{i}", "expiration": "2999-01-01T00:00:00-08:00", "id": f"permit_id{i}"}
+            for i in range(3)
+        ]
+
+        response = self.client.get('/permits?sort=plate&order=desc&per_page=2&page=2')
+
+        page = response.data.decode()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('PLATE0', page)
+        self.assertNotIn('PLATE2', page)
+        self.assertIn('Page 2 of 2', page)
+
+    @patch('server.views.permit_views.parkingboss_api_helper.get_permits', new_callable=AsyncMock)
+    def test_list_permits_not_modified_until_permits_change(self, mock_get_permits):
+        mock_get_permits.return_value = [{"license_plate": "ABC123", "expiration": "2999-01-01T00:00:00-08:00", "id": "permit_id1"}]
+
+        first = self.client.get('/permits')
+        etag = first.headers['ETag']
+        unchanged = self.client.get('/permits', headers={'If-None-Match': etag})
+        with self.app.app_context():
+            permit_sync.apply_deleted("permit_id1")
+        changed = self.client.get('/permits', headers={'If-None-Match': etag})
+
+        self.assertIn('no-cache', first.headers['Cache-Control'])
+        self.assertNotIn('no-store', first.headers['Cache-Control'])
+        self.assertEqual(unchanged.status_code, 304)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(etag, changed.headers['ETag'])
+
+    def test_list_permits_rejects_bad_page_args(self):
+        self.assertEqual(self.client.get('/permits?page=0').status_code, 400)
+        self.assertEqual(self.client.get('/permits?sort=owner').status_code, 400)
+
+    @patch('server.views.permit_views.parkingboss_api_helper.get_permits', new_callable=AsyncMock)
+    def test_list_permits_upstream_error(self, mock_get_permits):
+        mock_get_permits.side_effect = ExternalAPIError()
+
+        response = self.client.get('/permits')
+
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.get_json(), {'error': 'Error with external API'})
+
+    @patch('server.views.permit_views.parkingboss_api_helper.get_permits', new_callable=AsyncMock)
+    @patch('server.views.permit_views.parkingboss_api_helper.create_permit', new_callable=AsyncMock)
+    @patch('server.views.permit_views.parkingboss_api_helper.get_policy_id', new_callable=AsyncMock)
+    def test_bulk_create_permits(self, mock_get_policy_id, mock_create_permit, mock_get_permits):
+        mock_create_permit.side_effect = ["permit_id1", ExternalAPIError()]
+        mock_get_permits.return_value = [{"license_plate": "ABC123", "expiration": "2999-01-01T00:00:00-08:00", "id": "permit_id1"}]
+
+        response = self.client.post('/permits/bulk', json={'permits': [
+            {'license_plate': 'ABC123', 'duration': 2},
+            {'license_plate': 'XYZ789'},
+        ]})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['results'], [
+            {'license_plate': 'ABC123', 'success': True, 'permit_id': 'permit_id1'},
+            {'license_plate': 'XYZ789', 'success': False, 'error': 'Error with external API'},
+        ])
+        mock_get_policy_id.assert_awaited_once()
+        self.assertEqual(['PT2H', 'PT1H'], [call.kwargs['duration'] for call in mock_create_permit.call_args_list])
+        mock_get_permits.assert_awaited_once()
+
+    @patch('server.views.permit_views.parkingboss_api_helper.get_permits', new_callable=AsyncMock)
+    @patch('server.views.permit_views.parkingboss_api_helper.delete_permit', new_callable=AsyncMock)
+    def test_bulk_delete_permits(self, mock_delete_permit, mock_get_permits):
+        mock_get_permits.return_value = []
+
+        response = self.client.delete('/permits/bulk', json={'permit_ids': ['permit_id1', 'permit_id2']})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(2, mock_delete_permit.await_count)
+        self.assertTrue(all(result['success'] for result in response.get_json()['results']))
+        mock_get_permits.assert_awaited_once()
+
+    def test_bulk_create_rejects_empty_list(self):
+        response = self.client.post('/permits/bulk', json={'permits': []})
+        self.assertEqual(response.status_code, 400)
+
+    @patch('server.views.permit_views.parkingboss_api_helper.create_permit', new_callable=AsyncMock)
+    def test_bulk_create_rejects_invalid_items(self, mock_create_permit):
+        for item in ({'license_plate': 'ABC123', 'duration': 'abc'}, {'license_plate': 'ABC123', 'duration': -1},
+                     {'license_plate': 'ABC123', 'duration': 1.5}, {'license_plate': 123}, {'license_plate': ' '}):
+            response = self.client.post('/permits/bulk', json={'permits': [{'license_plate': 'XYZ789'}, item]})
+            self.assertEqual(response.status_code, 400, item)
+        mock_create_permit.assert_not_awaited()
+
+    @patch('server.views.permit_views.parkingboss_api_helper.get_permits', new_callable=AsyncMock)
+    def test_tenant_routes_serve_their_own_permits(self, mock_get_permits):
+        registry = tenants.TenantRegistry({"unit-12": {"location_id": "LOCATION2", "tenant": "12", "password": "PW"}})
+        mock_get_permits.side_effect = [
+            [{"license_plate": "ABC123", "expiration": "2999-01-01T00:00:00-08:00", "id": "permit_id1"}],
+            [{"license_plate": "XYZ789", "expiration": "2999-01-01T00:00:00-08:00", "id": "permit_id2"}],
+        ]
+
+        with patch('server.helpers.tenants.registry', registry):
+            default_page = self.client.get('/permits').data.decode()
+            tenant_page = self.client.get('/t/unit-12/permits').data.decode()
+            unknown = self.client.get('/t/unit-99/permits')
+
+        self.assertIn('ABC123', default_page)
+        self.assertNotIn('XYZ789', default_page)
+        self.assertIn('XYZ789', tenant_page)
+        self.assertNotIn('ABC123', tenant_page)
+        self.assertIn('href="/t/unit-12/permits/create"', tenant_page)
+        self.assertEqual(unknown.status_code, 404)
+
+
+    @patch('server.helpers.renewals.scheduler')
+    def test_enroll_and_cancel_renewal(self, mock_scheduler):
+        with self.app.app_context():
+            permit_sync.reconcile([{"license_plate": "ABC123", "expiration": "2999-01-01T00:00:00-08:00", "id": "permit_id1"}])
+
+        response = self.client.post('/permits/permit_id1/renewal', json={'hours': 2})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('renew_until', response.get_json())
+        self.assertEqual(self.client.post('/permits/permit_id1/renewal', json={'hours': 'x'}).status_code, 400)
+        self.assertEqual(self.client.post('/permits/unknown/renewal').status_code, 404)
+        self.assertEqual(self.client.delete('/permits/permit_id1/renewal').status_code, 200)
+        self.assertEqual(self.client.delete('/permits/permit_id1/renewal').status_code, 404)
+
+
+    @patch('server.helpers.permit_sync.syncer')
+    @patch('server.helpers.outbox.drainer')
+    def test_writes_are_accepted_before_reaching_upstream(self, mock_drainer, mock_syncer):
+        with self.app.app_context():
+            permit_sync.reconcile([{"license_plate": "ABC123", "expiration": "2999-01-01T00:00:00-08:00", "id": "permit_id1"}])
+
+        created = self.client.post('/permits', data={'licenseplate': 'XYZ789', 'duration': '2'})
+        deleted = self.client.delete('/permits/permit_id1')
+
+        self.assertEqual(created.status_code, 202)
+        self.assertEqual(deleted.status_code, 202)
+        mock_drainer.wake.assert_called()
+        status = self.client.get(created.headers['Location']).get_json()
+        self.assertEqual(('create', 'pending', 'XYZ789'), (status['kind'], status['state'], status['license_plate']))
+        self.assertEqual(self.client.get('/permits/operations/unknown').status_code, 404)
+        self.assertEqual(self.client.post('/permits', data={'licenseplate': 'XYZ789', 'duration': 'x'}).status_code, 400)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,9 +1,11 @@
 import unittest
+from mock import patch
 from server import create_app
+from server.helpers import permit_sync, tenants
 
 class TestPersonViews(unittest.TestCase):
     def setUp(self):
-        self.app = create_app()
+        self.app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
         self.client = self.app.test_client()
 
     def test_hello_person(self):
@@ -11,5 +13,46 @@ class TestPersonViews(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.data.decode(), 'Hello, World! This is the person view.')
 
+    def test_create_and_list_people(self):
+        response = self.client.post('/person', json={'people': [{'name': 'Bob', 'license_plates': ['XYZ789']},
+                                                                {'name': 'Ann'}]})
+        self.assertEqual(response.status_code, 201)
+        bob, ann = response.get_json()['ids']
+
+        body = self.client.get('/person?per_page=1').get_json()
+        self.assertEqual(2, body['total'])
+        self.assertEqual([{'id': ann, 'name': 'Ann', 'license_plates': []}], body['people'])
+        self.assertEqual(['XYZ789'], self.client.get(f'/person/{bob}').get_json()['license_plates'])
+        self.assertEqual(404, self.client.get('/person/999').status_code)
+
+    def test_create_people_rejects_missing_names(self):
+        self.assertEqual(self.client.post('/person', json={'people': [{'license_plates': ['ABC123']}]}).status_code, 400)
+
+    def test_vehicle_shows_owner_and_permits(self):
+        person_id = self.client.post('/person', json={'people': [{'name': 'Ann'}]}).get_json()['ids'][0]
+        self.client.put(f'/person/{person_id}/vehicles', json={'license_plates': ['ABC123']})
+        with self.app.app_context():
+            permit_sync.reconcile([{"license_plate": "ABC123", "expiration": "2999-01-01T00:00:00-08:00", "id": "permit_id1"}])
+
+        body = self.client.get('/vehicles/ABC123').get_json()
+
+        self.assertEqual({'id': person_id, 'name': 'Ann'}, body['owner'])
+        self.assertEqual(['permit_id1'], [permit['id'] for permit in body['permits']])
+        self.assertEqual(404, self.client.get('/vehicles/NOPE').status_code)
+
+    def test_people_and_vehicles_are_kept_apart_per_tenant(self):
+        registry = tenants.TenantRegistry({"unit-12": {"location_id": "LOCATION2", "tenant": "12", "password": "PW"}})
+        with patch('server.helpers.tenants.registry', registry):
+            ann = self.client.post('/person', json={'people': [{'name': 'Ann', 'license_plates': ['SECRET1']}]}).get_json()['ids'][0]
+            bob = self.client.post('/t/unit-12/person', json={'people': [{'name': 'Bob', 'license_plates': ['SECRET1']}]}).get_json()['ids'][0]
+
+            self.assertEqual('Ann', self.client.get('/vehicles/SECRET1').get_json()['owner']['name'])
+            self.assertEqual('Bob', self.client.get('/t/unit-12/vehicles/SECRET1').get_json()['owner']['name'])
+            self.assertEqual(['Bob'], [person['name'] for person in self.client.get('/t/unit-12/person').get_json()['people']])
+            self.assertEqual(404, self.client.get(f'/t/unit-12/person/{ann}').status_code)
+            self.assertEqual(404, self.client.put(f'/t/unit-12/person/{ann}/vehicles', json={'license_plates': ['X1']}).status_code)
+            self.assertEqual(['SECRET1'], self.client.get(f'/person/{ann}').get_json()['license_plates'])
+            self.assertEqual(['SECRET1'], self.client.get(f'/t/unit-12/person/{bob}').get_json()['license_plates'])
+
 if __name__ == '__main__':
     unittest.main()